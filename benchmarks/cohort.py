@@ -0,0 +1,51 @@
+import numpy as np
+
+
+def make_cohort(num_patients:int=100, timesteps:int=20, num_codes:int=50, events_per_visit:float=3.0,
+                filter_timesteps:int=2, num_filters:int=8, seed:int=0):
+    """Generate a synthetic cohort of EHR-like patient graphs, filters and labels.
+
+    Each patient has a random number of visits (at most timesteps + 1). The codes recorded at each visit
+    are drawn from a skewed (Zipf-like) popularity over the vocabulary, with a Poisson number of codes per
+    visit. Every code in one visit is joined to every code in the next visit with the number of days between
+    the visits, so the graphs have the sparsity of real data. Earlier timesteps are left empty for patients
+    with fewer visits. Patients in the positive class are more likely to have a small set of 'signal' codes,
+    so some filters separate the classes.
+
+    Args:
+        num_patients (int): number of patients.
+        timesteps (int): number of timesteps (transitions between visits) in each graph.
+        num_codes (int): vocabulary size (number of nodes).
+        events_per_visit (float): mean number of codes recorded at a visit.
+        filter_timesteps (int): number of timesteps in each filter.
+        num_filters (int): number of filters.
+        seed (int): random seed, the same seed always gives the same cohort.
+
+    Returns:
+        tuple: 4D float32 patient graphs (patients, timesteps, codes, codes), 4D float32 filters
+        (filters, filter timesteps, codes, codes) and a list of 0/1 labels.
+    """
+    rng = np.random.default_rng(seed)
+    popularity = 1 / np.arange(1, num_codes + 1)
+    popularity /= popularity.sum()
+    signal_codes = rng.choice(num_codes, size=max(num_codes // 20, 1), replace=False)
+
+    labels = rng.integers(0, 2, size=num_patients)
+    pat_graphs = np.zeros((num_patients, timesteps, num_codes, num_codes), dtype=np.float32)
+    for p in range(num_patients):
+        num_visits = rng.integers(2, timesteps + 2)
+        visits = []
+        for _ in range(num_visits):
+            size = min(max(rng.poisson(events_per_visit), 1), num_codes)
+            codes = rng.choice(num_codes, size=size, replace=False, p=popularity)
+            if labels[p] == 1 and rng.random() < 0.3:
+                codes = np.union1d(codes, rng.choice(signal_codes, size=1))
+            visits.append(codes)
+
+        days_between = rng.integers(1, 365, size=num_visits - 1)
+        first_t = timesteps - (num_visits - 1)
+        for v in range(num_visits - 1):
+            pat_graphs[p, first_t + v][np.ix_(visits[v], visits[v + 1])] = days_between[v]
+
+    filters = rng.normal(size=(num_filters, filter_timesteps, num_codes, num_codes)).astype(np.float32)
+    return pat_graphs, filters, labels.tolist()
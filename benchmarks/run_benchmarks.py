@@ -0,0 +1,177 @@
+"""Time and memory-profile each stage of the pipeline on synthetic cohorts.
+
+Run from the top directory, e.g.:
+
+    python -m benchmarks.run_benchmarks --scales small medium --output bench.json
+    python -m benchmarks.run_benchmarks --scales small --output new.json --compare bench.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import matplotlib
+matplotlib.use('Agg')
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from benchmarks.cohort import make_cohort  # noqa: E402
+from tgcnn_act_graph import calculations, figures, max_act_diff, utils  # noqa: E402
+from tgcnn_act_graph.sparse import SparseGraphs  # noqa: E402
+
+SCALES = {
+    'small': dict(num_patients=50, timesteps=10, num_codes=30, num_filters=8),
+    'medium': dict(num_patients=500, timesteps=20, num_codes=60, num_filters=16),
+    'large': dict(num_patients=2000, timesteps=30, num_codes=100, num_filters=64),
+}
+
+# Modules whose import time is measured in a fresh interpreter, the compute path first
+STARTUP_MODULES = ['tgcnn_act_graph.max_act_diff', 'tgcnn_act_graph.utils', 'tgcnn_act_graph.figures']
+
+_IMPORT_SCRIPT = '''
+import time, tracemalloc
+if {trace}:
+    tracemalloc.start()
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start, tracemalloc.get_traced_memory()[1])
+'''
+
+
+def measure(func, repeat:int):
+    """Best wall time over repeat runs and the peak traced memory of one more run.
+
+    Returns:
+        tuple: (seconds, peak bytes)
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(times), peak
+
+
+def stages(pat_graphs:np.ndarray, filters:np.ndarray, labels:list, out_dir:str):
+    """The pipeline stages to measure, as (name, function) pairs."""
+    sparse_graphs = SparseGraphs.from_dense(pat_graphs)
+    # the patient with the most events, after flipping as in edge_activated_graph
+    patient_number = int(np.argmax(np.count_nonzero(pat_graphs.reshape(pat_graphs.shape[0], -1), axis=1)))
+    patient_graph, filt = utils.flip_graph(pat_graphs[patient_number], filters[0])
+    act_graph = calculations.get_act_graph_array(patient_graph, filt)
+    edges_df = utils.create_edges_df(patient_graph, act_graph)
+    save_path = os.path.join(out_dir, 'graph.png')
+
+    return [
+        ('create_max_act_df', lambda: max_act_diff.create_max_act_df('label', pat_graphs, filters, labels, False)),
+        ('create_max_act_df_gemm', lambda: max_act_diff.create_max_act_df('label', pat_graphs, filters, labels, False, backend='gemm')),
+        ('create_max_act_df_sparse', lambda: max_act_diff.create_max_act_df('label', sparse_graphs, filters, labels, False)),
+        ('get_act_graph_array', lambda: calculations.get_act_graph_array(patient_graph, filt)),
+        ('create_edges_df', lambda: utils.create_edges_df(patient_graph, act_graph)),
+        ('create_layout_pos_dict', lambda: utils.create_layout_pos_dict(edges_df)),
+        ('edge_activated_graph', lambda: figures.edge_activated_graph(pat_graphs, patient_number, filters, labels,
+                                                                      save_path=save_path)),
+    ]
+
+
+def import_time(module:str, repeat:int):
+    """Best wall time over repeat imports of a module and the peak traced memory of one more, each
+    in a fresh interpreter so nothing is already in sys.modules.
+
+    Returns:
+        tuple: (seconds, peak bytes)
+    """
+    def run_import(trace):
+        output = subprocess.run([sys.executable, '-c', _IMPORT_SCRIPT.format(module=module, trace=trace)],
+                                capture_output=True, text=True, check=True).stdout
+        seconds, peak = output.split()
+        return float(seconds), int(peak)
+
+    times = [run_import(False)[0] for _ in range(repeat)]
+    return min(times), run_import(True)[1]
+
+
+def git_commit():
+    """Current git commit of the repository, or None outside a git checkout."""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(scales:list, repeat:int, seed:int):
+    """Measure the import time of the compute and plotting modules, then run every stage at every scale.
+
+    Returns:
+        dict: machine-readable results with a meta section and one record per stage and scale.
+    """
+    results = []
+    for module in STARTUP_MODULES:
+        seconds, peak = import_time(module, repeat)
+        name = f'import {module}'
+        print(f'{"startup":>8} {name:<28} {seconds:10.4f} s {peak / 2**20:10.1f} MiB')
+        results.append({'stage': name, 'scale': 'startup', 'seconds': seconds, 'peak_bytes': peak, 'params': {}})
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        for scale in scales:
+            params = dict(SCALES[scale], seed=seed)
+            pat_graphs, filters, labels = make_cohort(**params)
+            for name, func in stages(pat_graphs, filters, labels, out_dir):
+                seconds, peak = measure(func, repeat)
+                print(f'{scale:>8} {name:<28} {seconds:10.4f} s {peak / 2**20:10.1f} MiB')
+                results.append({'stage': name, 'scale': scale, 'seconds': seconds, 'peak_bytes': peak, 'params': params})
+
+    meta = {'commit': git_commit(), 'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+            'platform': platform.platform(), 'repeat': repeat}
+    return {'meta': meta, 'results': results}
+
+
+def compare(new:dict, baseline:dict):
+    """Table of the new results against a baseline run, matched on stage and scale.
+
+    Returns:
+        pd.DataFrame: seconds and peak memory of both runs and the new / baseline ratios.
+    """
+    new_df = pd.DataFrame(new['results'])[['stage', 'scale', 'seconds', 'peak_bytes']]
+    base_df = pd.DataFrame(baseline['results'])[['stage', 'scale', 'seconds', 'peak_bytes']]
+    table = new_df.merge(base_df, on=['stage', 'scale'], suffixes=('', '_baseline'))
+    table['time_ratio'] = table['seconds'] / table['seconds_baseline']
+    table['memory_ratio'] = table['peak_bytes'] / table['peak_bytes_baseline']
+    return table
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', nargs='+', choices=list(SCALES), default=['small', 'medium'])
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per stage, the best is kept')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='bench_results.json', help='JSON file to write the results to')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    args = parser.parse_args(argv)
+
+    results = run(args.scales, args.repeat, args.seed)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        with pd.option_context('display.width', 200, 'display.max_columns', None):
+            print(compare(results, baseline))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -10,8 +10,12 @@ with open("requirements.txt", "r") as f:
 setup(
     name="tgcnn_act_graph",
     version="0.3.1",
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks', 'benchmarks.*', 'test_graphs', 'test_graphs.*']),
     install_requires=install_requirements,
+    extras_require={"export": ["pyarrow"]},
+    entry_points={
+        "console_scripts": ["tgcnn-act-graph-export=tgcnn_act_graph.export:main"],
+    },
     long_description=description,
     long_description_content_type="text/markdown",
 )
\ No newline at end of file
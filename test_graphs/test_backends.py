@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from tgcnn_act_graph import backends, calculations, max_act_diff, parallel
+from test_graphs.test_calculations import test_pats, test_filts, labels
+
+
+@pytest.mark.parametrize('name', backends.available_backends())
+def test_backend_parity(name):
+    """Test every installed backend matches the NumPy reference kernels.
+    """
+    report = backends.check_parity(test_pats, test_filts, names=[name])
+    assert report[name]['ok'], f"The {name} backend should match the numpy backend: {report[name]}"
+
+    max_acts = calculations.max_activation_matrix(test_pats, test_filts, backend=name)
+    assert np.allclose(max_acts, calculations.max_activation_matrix(test_pats, test_filts)), "The maximum activations should match"
+
+
+def test_backend_fallback(monkeypatch):
+    """Test a backend with a missing dependency falls back to numpy with a warning, and unknown names are an error.
+    """
+    def load_missing():
+        raise ImportError("No module named 'missing'")
+
+    monkeypatch.setitem(backends._loaders, 'missing', load_missing)
+
+    with pytest.warns(RuntimeWarning):
+        max_acts = calculations.max_activation_matrix(test_pats, test_filts, backend='missing')
+    assert np.array_equal(max_acts, calculations.max_activation_matrix(test_pats, test_filts)), "The numpy backend should be used"
+    assert 'missing' not in backends.available_backends(), "Backends with missing dependencies should not be listed"
+    with pytest.raises(ImportError):
+        backends.get_backend('missing', fallback=False)
+    with pytest.raises(ValueError):
+        backends.get_backend('unknown')
+
+
+def test_gemm_blocks():
+    """Test the unfolded scan gives the same window sums however small the blocks are.
+    """
+    sums = calculations.window_activation_sums(test_pats, test_filts)
+    assert np.allclose(calculations.window_activation_sums_gemm(test_pats, test_filts, max_block_bytes=1), sums), \
+        "One patient at a time should give the same window sums"
+    assert np.allclose(calculations.window_activation_sums_gemm(test_pats, test_filts), sums), "One block should give the same window sums"
+
+
+def test_backend_options():
+    """Test kernel options and the patient block size reach the scan through the ranking functions.
+    """
+    gemm = backends.get_backend('gemm', max_block_bytes=1)
+    assert gemm.options == {'max_block_bytes': 1} and backends.get_backend(gemm) is gemm, "Options should be bound to the backend"
+    with pytest.raises(ValueError):
+        backends.get_backend('gemm', block_bytes=1)
+
+    expected = calculations.max_activation_matrix(test_pats, test_filts)
+    assert np.allclose(calculations.max_activation_matrix(test_pats, test_filts, block_size=1, backend=gemm), expected), \
+        "Small blocks should give the same maximum activations"
+    assert np.allclose(parallel.max_activation_matrix(test_pats, test_filts, n_jobs=2, block_size=1, backend=gemm), expected), \
+        "The workers should load the backend with its options"
+    exact_df = max_act_diff.max_act_diff_calc('Hip Replacement', test_pats, test_filts, labels, verbose=False, show_plot=False)
+    gemm_df = max_act_diff.max_act_diff_calc('Hip Replacement', test_pats, test_filts, labels, verbose=False, show_plot=False,
+                                             backend=gemm, block_size=1)
+    assert np.allclose(gemm_df['Difference'], exact_df['Difference']), "The ranking should be the same"
@@ -0,0 +1,35 @@
+import os
+
+import matplotlib
+import pytest
+matplotlib.use('Agg')
+
+from tgcnn_act_graph import batch  # noqa: E402
+from test_graphs.test_calculations import test_pats, test_filts, labels  # noqa: E402
+
+
+def test_render_edge_activated_graphs(tmp_path):
+    """Test every patient gets a file and failures are reported rather than stopping the batch.
+    """
+    report = batch.render_edge_activated_graphs(test_pats, [0, 3, 10], test_filts, labels, tmp_path,
+                                                 file_format='svg', n_workers=2)
+
+    assert report['patient_number'].tolist() == [0, 3, 10], "There should be one row per patient in order"
+    assert os.path.exists(tmp_path / 'patient_0.svg'), "Patient 0 should be drawn"
+    assert os.path.exists(tmp_path / 'patient_3.svg'), "Patient 3 should be drawn"
+    assert report['error'].isna().tolist() == [True, True, False], "Only the missing patient should fail"
+    assert (report['seconds'] > 0).all(), "Each file should be timed"
+
+
+def test_render_options_checked(tmp_path):
+    """Test bad options fail before drawing and the html renderer writes .html files.
+    """
+    with pytest.raises(ValueError):
+        batch.render_edge_activated_graphs(test_pats, [0], test_filts, labels, tmp_path, renderer='plotly', n_workers=1)
+    with pytest.raises(ValueError):
+        batch.render_edge_activated_graphs(test_pats, [0], test_filts, labels, tmp_path, file_format='bmpx', n_workers=1)
+    assert not os.listdir(tmp_path), "Nothing should be drawn with bad options"
+
+    report = batch.render_edge_activated_graphs(test_pats, [0], test_filts, labels, tmp_path, renderer='html', n_workers=1)
+    assert report['path'].tolist() == [os.path.join(tmp_path, 'patient_0.html')], "The html renderer should write .html files"
+    assert report['error'].isna().all() and os.path.exists(tmp_path / 'patient_0.html'), "The page should be written"
@@ -0,0 +1,15 @@
+import numpy as np
+
+from benchmarks.cohort import make_cohort
+
+
+def test_make_cohort_seeded():
+    """Test the synthetic cohort is reproducible from its seed and as sparse as EHR graphs.
+    """
+    pat_graphs, filters, labels = make_cohort(num_patients=20, timesteps=6, num_codes=40, filter_timesteps=3, num_filters=4, seed=1)
+    same_graphs, _, same_labels = make_cohort(num_patients=20, timesteps=6, num_codes=40, filter_timesteps=3, num_filters=4, seed=1)
+
+    assert pat_graphs.shape == (20, 6, 40, 40), "There should be one graph per patient"
+    assert filters.shape == (4, 3, 40, 40), "The filters should have the requested shape"
+    assert np.array_equal(pat_graphs, same_graphs) and labels == same_labels, "The same seed should give the same cohort"
+    assert np.count_nonzero(pat_graphs) < 0.05 * pat_graphs.size, "The graphs should be mostly zeros"
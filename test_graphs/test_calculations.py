@@ -180,3 +180,113 @@ def test_repeat_array_fractional():
     assert np.array_equal(true_repeated_filter, test_repeat_array_fractional), "The filter should be 5 timesteps"    
 
 
+def test_max_activation_matrix():
+    """Test the batched maximum activation matches running each filter over each window one at a time.
+    """
+    max_acts = calculations.max_activation_matrix(test_pats, test_filts)
+
+    true_max_acts = np.zeros((test_pats.shape[0], test_filts.shape[0]))
+    for p in range(test_pats.shape[0]):
+        for k in range(test_filts.shape[0]):
+            for i in range(test_pats.shape[1] - test_filts.shape[1] + 1):
+                window_sum = np.sum(test_pats[p, i:i+test_filts.shape[1]] * test_filts[k])
+                true_max_acts[p, k] = max(true_max_acts[p, k], calculations.leaky_relu(window_sum, 0.01))
+
+    assert max_acts.shape == (4, 2), "There should be one value per patient and filter"
+    assert np.allclose(true_max_acts, max_acts), "The batched maximum activations should match the window by window loop"
+
+
+def test_max_act_diff_calc_chunked(tmp_path):
+    """Test the out-of-core ranking from a memory-mapped file and from an iterator of chunks
+    matches the in-memory ranking.
+    """
+    true_diff = max_act_diff.max_act_diff_calc('Hip Replacement', test_pats, test_filts, labels, verbose=False, show_plot=False)
+
+    path = tmp_path / 'pats.npy'
+    np.save(path, test_pats)
+    mmap_diff = max_act_diff.max_act_diff_calc_chunked('Hip Replacement', str(path), test_filts, labels, chunk_size=3)
+    iter_diff = max_act_diff.max_act_diff_calc_chunked('Hip Replacement', iter([test_pats[:1], test_pats[1:]]), test_filts, labels)
+
+    assert mmap_diff['Filter'].tolist() == true_diff['Filter'].tolist(), "The filters should be the same"
+    assert np.allclose(mmap_diff['Difference'], true_diff['Difference']), "The memory-mapped differences should match"
+    assert np.allclose(iter_diff['Difference'], true_diff['Difference']), "The chunked differences should match"
+
+
+def test_edges_df_columns():
+    """Test the edges are found in timestep order with typed columns.
+    """
+    edges_df = utils.create_edges_df(test_pat, test_pat * 2)
+
+    assert edges_df['start_node'].astype(str).tolist() == ['1_v0', '2_v1', '2_v1', '1_v2', '2_v2', '1_v3', '1_v3'], "Start nodes should be in timestep order"
+    assert edges_df['end_node'].astype(str).tolist() == ['2_v1', '1_v2', '2_v2', '1_v3', '1_v3', '0_v4', '2_v4'], "End nodes should be in timestep order"
+    assert edges_df['activated'].dtype == bool, "The activated column should be boolean"
+    assert edges_df['weight'].dtype == np.float32, "The weight column should be float32"
+    assert edges_df['time_between'].tolist() == [3, 4, 4, 2, 2, 5, 5], "The time between should come from the patient graph"
+    assert (edges_df['end_visit'] == edges_df['start_visit'] + 1).all(), "Edges should join consecutive visits"
+
+
+def test_layout_pos_dict():
+    """Test the array based layout gives the same positions as the DataFrame based layout.
+    """
+    edges_df = utils.create_edges_df(test_pats[1], test_pats[1])
+    pos_df = utils.create_position_df(edges_df)
+    pos_list = utils.generate_pos_sequence(pos_df['max_codes_per_visit'].max())
+    pos_df = utils.map_y_coord_to_node(pos_df, pos_list)
+
+    assert utils.create_layout_pos_dict(edges_df) == utils.create_pos_dict(pos_df), "Both layouts should give the same positions"
+    assert utils.y_offsets(8).tolist() == utils.generate_pos_sequence(8)[7], "The cached offsets should match the position sequence"
+
+
+def test_act_graph_array_batch():
+    """Test the activated graph for a batch of patients matches the repeated filter for each patient,
+    including a graph that isn't a whole number of filter lengths.
+    """
+    odd_length_pats = test_pats[:, :3]
+    act_graphs = calculations.get_act_graph_array(odd_length_pats, test_filt)
+
+    for p in range(odd_length_pats.shape[0]):
+        filt_repeated = calculations.repeat_array_fractional(test_filt, 1.5)
+        true_act_graph = filt_repeated * odd_length_pats[p]
+        true_act_graph = np.where(true_act_graph < 0, 0.01 * true_act_graph, true_act_graph)
+        assert np.allclose(act_graphs[p], true_act_graph), "Each patient should be multiplied by the repeated filter"
+
+    assert np.array_equal(calculations.leaky_relu_array(np.array([-2.0, 3.0])), [-0.02, 3.0]), "Negative values should be multiplied by alpha"
+
+
+def test_top_k_filter_edges():
+    """Test the stacked activated graphs for the top filters match one filter at a time.
+    """
+    mean_activation_df = max_act_diff.max_act_diff_calc('Hip Replacement', test_pats, test_filts, labels, verbose=False, show_plot=False)
+    filter_nums, top_filts = utils.get_top_k_filts(mean_activation_df, test_filts, 2)
+    assert filter_nums[0] == mean_activation_df.loc[mean_activation_df['Difference'].idxmax(), 'Filter'], "The best filter should come first"
+
+    act_graphs = calculations.get_act_graph_array_multi(test_pat, top_filts)
+    batch_act_graphs = calculations.get_act_graph_array_multi(test_pats, top_filts)
+    for k in range(2):
+        assert np.allclose(act_graphs[k], calculations.get_act_graph_array(test_pat, top_filts[k])), "Each filter should match the single filter activation"
+        assert np.allclose(batch_act_graphs[2, k], calculations.get_act_graph_array(test_pats[2], top_filts[k])), "Each patient in the batch should match"
+
+    edges_df = utils.create_multi_filter_edges_df(test_pat, act_graphs, filter_nums)
+    assert edges_df[f'weight_filter_{filter_nums[0]}'].tolist() == [0, 0, 0, 2, 0, 0, 0], "Only one edge is activated by the best filter"
+
+
+def test_typed_results():
+    """Test the array-backed results use compact dtypes and convert to the same DataFrames.
+    """
+    table = max_act_diff.create_max_act_df('Hip Replacement', test_pats, test_filts, labels, verbose=False, as_frame=False)
+    max_act_df = max_act_diff.create_max_act_df('Hip Replacement', test_pats, test_filts, labels, verbose=False)
+
+    assert table.max_activation.dtype == np.float32, "The activations should be float32 by default"
+    assert table.filter_num.dtype == np.uint8, "The filter numbers should use the smallest integer dtype"
+    pd.testing.assert_frame_equal(table.to_pandas('Hip Replacement'), max_act_df)
+
+    float64_df = max_act_diff.create_max_act_df('Hip Replacement', test_pats, test_filts, labels, verbose=False, dtype=np.float64)
+    assert float64_df['Max Activation'].dtype == np.float64, "The activation dtype should be configurable"
+
+    edges = utils.create_edges_df(test_pat, test_pat * 2, as_frame=False)
+    assert edges.start_code.dtype == np.int32, "The node indices should be int32 by default"
+    pd.testing.assert_frame_equal(edges.to_pandas(), utils.create_edges_df(test_pat, test_pat * 2))
+
+    for dtype in ('float64', np.dtype(np.float64), np.float64):
+        edges = utils.create_edges_df(test_pat, test_pat * 0, dtype=dtype, as_frame=False)
+        assert edges.weight.dtype == np.float64 and np.all(edges.weight == 0.5), "The weight dtype can be given in any numpy form"
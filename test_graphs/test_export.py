@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from tgcnn_act_graph import calculations, export, utils
+from tgcnn_act_graph.ragged import RaggedCohort
+from tgcnn_act_graph.ranking import FilterRanking
+from tgcnn_act_graph.sparse import SparseGraphs
+from test_graphs.test_calculations import test_pats, test_filts, labels
+
+
+def test_edge_table_chunks():
+    """Test the chunked edge tables match create_edges_df for each patient.
+    """
+    chunks = list(export.edge_table_chunks(test_pats, [0, 2, 3], test_filts[0], chunk_size=2))
+    assert len(chunks) == 2, "Three patients in chunks of two should give two chunks"
+
+    edges = pd.concat(chunks, ignore_index=True)
+    for patient_number in (0, 2, 3):
+        patient_graph, filt = utils.flip_graph(test_pats[patient_number], test_filts[0])
+        edges_df = utils.create_edges_df(patient_graph, calculations.get_act_graph_array(patient_graph, filt))
+        patient_edges = edges[edges['patient_number'] == patient_number]
+        assert np.array_equal(patient_edges['weight'], edges_df['weight']), "The weights should match create_edges_df"
+        assert np.array_equal(patient_edges['start_code'], edges_df['start_code']), "The codes should match create_edges_df"
+
+
+def test_load_array_npz(tmp_path):
+    """Test arrays are chosen from a .npz file by name and .npy files are memory-mapped.
+    """
+    np.savez(tmp_path / 'cohort.npz', graphs=test_pats, filters=test_filts)
+    np.save(tmp_path / 'labels.npy', np.array(labels))
+
+    assert np.array_equal(export.load_array(f'{tmp_path}/cohort.npz:filters'), test_filts), "The named array should be loaded"
+    assert isinstance(export.load_array(tmp_path / 'labels.npy'), np.memmap), ".npy files should be memory-mapped"
+    with pytest.raises(ValueError):
+        export.load_array(tmp_path / 'cohort.npz')
+
+
+@pytest.mark.parametrize('file_format', ['parquet', 'feather'])
+def test_export_cli(tmp_path, file_format):
+    """Test the command writes the ranking and the edges of every patient.
+    """
+    pytest.importorskip('pyarrow')
+    np.save(tmp_path / 'graphs.npy', test_pats)
+    np.save(tmp_path / 'filters.npy', test_filts)
+    np.save(tmp_path / 'labels.npy', np.array(labels))
+
+    export.main(['--graphs', str(tmp_path / 'graphs.npy'), '--filters', str(tmp_path / 'filters.npy'),
+                 '--labels', str(tmp_path / 'labels.npy'), '--output-dir', str(tmp_path / 'out'),
+                 '--format', file_format, '--chunk-size', '3'])
+
+    read = pd.read_parquet if file_format == 'parquet' else pd.read_feather
+    edges = read(tmp_path / 'out' / f'edges.{file_format}')
+    assert len(read(tmp_path / 'out' / f'ranking.{file_format}')) == test_filts.shape[0], "There should be one row per filter"
+    assert sorted(edges['patient_number'].unique()) == [0, 1, 2, 3], "Every patient should be exported"
+
+
+def test_export_sparse_ragged_and_empty(tmp_path):
+    """Test sparse and ragged cohorts export the same edges as the dense cohort, no patients still
+    writes an edges file with the columns, and a stale ranking is rejected.
+    """
+    pytest.importorskip('pyarrow')
+    ranking = FilterRanking.compute('Hip Replacement', test_pats, test_filts, labels)
+    dense = export.export(test_pats, test_filts, labels, tmp_path / 'dense', filter_ranking=ranking)
+    dense_edges = pd.read_parquet(dense['edges'])
+    for name, pat_graphs in (('sparse', SparseGraphs.from_dense(test_pats)), ('ragged', RaggedCohort.from_padded(test_pats, [4] * 4))):
+        written = export.export(pat_graphs, test_filts, labels, tmp_path / name, chunk_size=3)
+        assert pd.read_parquet(written['edges']).equals(dense_edges), f"The {name} cohort should export the same edges"
+
+    empty = export.export(test_pats, test_filts, labels, tmp_path / 'empty', patient_numbers=[], filter_ranking=ranking)
+    empty_edges = pd.read_parquet(empty['edges'])
+    assert len(empty_edges) == 0 and list(empty_edges.columns) == list(dense_edges.columns), "No patients should still write the columns"
+    assert empty_edges.dtypes.equals(dense_edges.dtypes), "The empty file should have the same column types"
+
+    with pytest.raises(ValueError):
+        export.export(test_pats, test_filts * 2, labels, tmp_path / 'stale', filter_ranking=ranking)
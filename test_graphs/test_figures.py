@@ -0,0 +1,27 @@
+import matplotlib
+matplotlib.use('Agg')
+
+import matplotlib.pyplot as plt  # noqa: E402
+from matplotlib.collections import LineCollection  # noqa: E402
+
+from tgcnn_act_graph import figures, utils  # noqa: E402
+from test_graphs.test_calculations import test_pat  # noqa: E402
+
+
+def test_draw_direct():
+    """Test the direct renderer draws every edge in one collection with the activated edges in red.
+    """
+    # activate only the first edge
+    act_graph = test_pat * 0
+    act_graph[0, 1, 2] = 3
+    edges_df = utils.create_edges_df(test_pat, act_graph)
+    fig, ax = plt.subplots()
+    figures.draw_edge_activated_graph_direct(edges_df, show_edge_labels=False, ax=ax)
+
+    lines = [c for c in ax.collections if isinstance(c, LineCollection)]
+    assert len(lines) == 1, "All edges should be drawn in a single collection"
+    assert len(lines[0].get_segments()) == len(edges_df), "There should be one line per edge"
+    assert matplotlib.colors.to_hex(lines[0].get_colors()[0]) == '#ff0000', "The activated edge should be red"
+    assert len(ax.texts) == len(utils.create_layout_pos_dict(edges_df)), "Only the nodes should be labelled"
+    plt.close(fig)
+
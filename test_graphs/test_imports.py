@@ -0,0 +1,13 @@
+import subprocess
+import sys
+
+
+def test_compute_modules_import_without_plotting():
+    """Test the numerical modules can be imported without loading matplotlib or networkx.
+    """
+    code = ("import sys\n"
+            "from tgcnn_act_graph import calculations, max_act_diff, utils, ranking, parallel, sparse, results\n"
+            "print(sorted({m.split('.')[0] for m in sys.modules} & {'matplotlib', 'networkx'}))")
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+
+    assert output.strip() == '[]', "matplotlib and networkx should only be imported when drawing"
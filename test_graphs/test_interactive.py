@@ -0,0 +1,58 @@
+import json
+
+import numpy as np
+
+from tgcnn_act_graph import interactive, utils
+from test_graphs.test_calculations import test_pat
+
+
+def activated_edges_df():
+    """Edges of the test patient with two edges activated."""
+    act_graph = test_pat * 0
+    act_graph[0, 1, 2] = 3
+    act_graph[1, 0, 1] = 5
+    return utils.create_edges_df(test_pat, act_graph)
+
+
+def test_level_of_detail():
+    """Test the coarsest tier only has the strongest activated edges and the last tier has every edge.
+    """
+    edges_df = activated_edges_df()
+    order, tier_ends = interactive.level_of_detail(edges_df, edge_budget=1, growth=2)
+
+    assert sorted(order.tolist()) == list(range(len(edges_df))), "Every edge should be in the order once"
+    strongest = edges_df['weight'][edges_df['activated']].max()
+    assert tier_ends[0] == 1 and edges_df['weight'].iloc[order[0]] == strongest, "The first tier should be the strongest activated edge"
+    num_activated = int(edges_df['activated'].sum())
+    assert edges_df['activated'].iloc[order[:num_activated]].all(), "Activated edges should come before the other edges"
+    assert np.all(np.diff(tier_ends) > 0) and tier_ends[-1] == len(edges_df), "Each tier should add edges up to every edge"
+
+
+def test_write_graph_html(tmp_path):
+    """Test the JSON and HTML views hold every node and edge in level-of-detail order.
+    """
+    edges_df = activated_edges_df()
+    pos_dict = utils.create_layout_pos_dict(edges_df)
+
+    view = interactive.write_graph_json(tmp_path / 'graph.json', edges_df, pos_dict, edge_budget=1)
+    with open(tmp_path / 'graph.json') as f:
+        assert json.load(f) == view, "The JSON file should hold the view"
+    assert view['nodes']['name'] == list(pos_dict), "Every node should be in the view"
+    start_nodes = [view['nodes']['name'][s] for s in view['edges']['source']]
+    assert sorted(start_nodes) == sorted(edges_df['start_node'].astype(str)), "Every edge should be in the view"
+
+    interactive.write_graph_html(tmp_path / 'graph.html', edges_df, pos_dict, edge_budget=1, title='Patient <1>')
+    page = (tmp_path / 'graph.html').read_text()
+    assert json.dumps(view, separators=(',', ':')) in page, "The view should be embedded in the page"
+    assert '<title>Patient &lt;1&gt;</title>' in page, "The title should be escaped"
+
+
+def test_empty_graph(tmp_path):
+    """Test a patient with no edges still gives a page with an empty view.
+    """
+    empty_graph = test_pat * 0
+    edges_df = utils.create_edges_df(empty_graph, empty_graph)
+    view = interactive.write_graph_html(tmp_path / 'graph.html', edges_df)
+
+    assert view['nodes']['name'] == [] and view['tiers'] == [0], "The view should have no nodes or edges"
+    assert 'Math.min(a, b), start)' in (tmp_path / 'graph.html').read_text(), "The bounds should have a starting value"
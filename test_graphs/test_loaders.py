@@ -0,0 +1,64 @@
+import zipfile
+
+import numpy as np
+import pytest
+
+from tgcnn_act_graph import loaders
+from test_graphs.test_calculations import test_filts
+
+
+def keras_kernel():
+    """The test filters as a Keras Conv3D kernel (Tf, N, N, in, K)."""
+    return np.moveaxis(test_filts, 0, -1)[:, :, :, None, :]
+
+
+def test_kernel_to_filters():
+    """Test Keras and PyTorch kernels are reordered to the filters layout.
+    """
+    assert np.array_equal(loaders.kernel_to_filters(keras_kernel(), 'keras'), test_filts), "Keras kernels should be reordered"
+    assert np.array_equal(loaders.kernel_to_filters(test_filts[:, None], 'torch'), test_filts), "PyTorch weights should be reordered"
+    with pytest.raises(ValueError):
+        loaders.kernel_to_filters(np.concatenate([keras_kernel()] * 2, axis=3), 'keras')
+
+
+def test_load_filters_numpy(tmp_path):
+    """Test kernels are found in .npy and .npz files.
+    """
+    np.save(tmp_path / 'kernel.npy', keras_kernel())
+    np.savez(tmp_path / 'weights.npz', kernel=keras_kernel(), bias=np.zeros(2))
+
+    assert np.array_equal(loaders.load_filters(tmp_path / 'kernel.npy'), test_filts), "The .npy kernel should be loaded"
+    assert np.array_equal(loaders.load_filters(tmp_path / 'weights.npz'), test_filts), "The only 5D array should be chosen"
+
+
+def test_load_filters_hdf5(tmp_path):
+    """Test kernels are read from Keras weights files and .keras archives without the framework.
+    """
+    h5py = pytest.importorskip('h5py')
+    path = str(tmp_path / 'model.weights.h5')
+    with h5py.File(path, 'w') as f:
+        f['model_weights/conv3d/conv3d/kernel:0'] = keras_kernel()
+        f['model_weights/conv3d/conv3d/bias:0'] = np.zeros(2)
+        f['model_weights/dense/dense/kernel:0'] = np.zeros((2, 1))
+
+    filters = loaders.load_filters(path)
+    assert isinstance(filters.base, np.memmap) or isinstance(filters, np.memmap), "Contiguous datasets should be memory-mapped"
+    assert np.array_equal(filters, test_filts), "The Conv3D kernel should be found"
+    assert np.array_equal(loaders.load_filters(path, name='conv3d/kernel'), test_filts), "The kernel should be found by name"
+
+    # Keras 3 weights, as in .weights.h5 files and the model.weights.h5 inside .keras archives
+    keras3_path = str(tmp_path / 'keras3.weights.h5')
+    with h5py.File(keras3_path, 'w') as f:
+        f['layers/conv3d/vars/0'] = keras_kernel()
+        f['layers/conv3d/vars/1'] = np.zeros(2)
+        f['layers/conv3d_1/vars/0'] = keras_kernel()
+        f['layers/dense/vars/0'] = np.zeros((2, 1))
+    for name in ('conv3d', 'conv3d/kernel'):
+        assert np.array_equal(loaders.load_filters(keras3_path, name=name), test_filts), "Keras 3 kernels should be found by layer name"
+
+    with zipfile.ZipFile(tmp_path / 'model.keras', 'w') as archive:
+        archive.write(keras3_path, 'model.weights.h5')
+    assert np.array_equal(loaders.load_filters(tmp_path / 'model.keras', name='conv3d_1'), test_filts), \
+        "The kernel should be read from the archive"
+    with pytest.raises(ValueError):
+        loaders.load_filters(tmp_path / 'model.keras')
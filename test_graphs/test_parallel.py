@@ -0,0 +1,19 @@
+import numpy as np
+
+from tgcnn_act_graph import calculations, max_act_diff, parallel
+from tgcnn_act_graph.sparse import SparseGraphs
+from test_graphs.test_calculations import test_pats, test_filts, labels
+
+
+def test_parallel_matches_serial():
+    """Test the shared memory scan gives exactly the serial maximum activations.
+    """
+    serial = calculations.max_activation_matrix(test_pats, test_filts)
+
+    assert np.array_equal(parallel.max_activation_matrix(test_pats, test_filts, n_jobs=2, block_size=1), serial), "Dense results should be identical"
+    assert np.array_equal(parallel.max_activation_matrix(SparseGraphs.from_dense(test_pats), test_filts, n_jobs=2, block_size=3),
+                          calculations.max_activation_matrix(SparseGraphs.from_dense(test_pats), test_filts)), "Sparse results should be identical"
+
+    serial_diff = max_act_diff.max_act_diff_calc('Hip Replacement', test_pats, test_filts, labels, verbose=False, show_plot=False)
+    parallel_diff = max_act_diff.max_act_diff_calc('Hip Replacement', test_pats, test_filts, labels, verbose=False, show_plot=False, n_jobs=2)
+    assert serial_diff.equals(parallel_diff), "The ranking should be identical"
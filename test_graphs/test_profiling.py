@@ -0,0 +1,22 @@
+import matplotlib
+matplotlib.use('Agg')
+
+import tracemalloc  # noqa: E402
+
+from tgcnn_act_graph import figures, profiling  # noqa: E402
+from test_graphs.test_calculations import test_pats, test_filts, labels  # noqa: E402
+
+
+def test_profiler_records_stages(tmp_path):
+    """Test every stage of edge_activated_graph is recorded with its time, memory and sizes.
+    """
+    profiler = profiling.PipelineProfiler()
+    figures.edge_activated_graph(test_pats, 0, test_filts, labels, save_path=tmp_path / 'graph.png', profiler=profiler)
+    records = profiler.to_dataframe()
+
+    assert records['name'].tolist() == ['select_patient', 'rank_filters', 'get_max_act_filt', 'flip_graph',
+                                        'get_act_graph_array', 'create_edges_df', 'create_layout_pos_dict', 'draw'], "Every stage should be recorded in order"
+    assert (records['seconds'] > 0).all(), "Every stage should be timed"
+    assert records['peak_bytes'].notna().all(), "Memory should be traced"
+    assert records.loc[records['name'] == 'create_edges_df', 'edges'].item() == 7, "The test patient has 7 edges"
+    assert not tracemalloc.is_tracing(), "tracemalloc should be stopped after each stage"
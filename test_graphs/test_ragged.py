@@ -0,0 +1,64 @@
+import numpy as np
+
+from tgcnn_act_graph import backends, calculations, max_act_diff, parallel, ranking
+from tgcnn_act_graph.ragged import RaggedCohort
+from test_graphs.test_calculations import test_pats, test_filts, labels
+
+
+def ragged_pats():
+    """The test patients with a different number of timesteps each, one shorter than the filters."""
+    lengths = [test_pats.shape[1], test_filts.shape[1], 1, test_pats.shape[1] - 1] * (test_pats.shape[0] // 4 + 1)
+    return [test_pats[p, :lengths[p]] for p in range(test_pats.shape[0])]
+
+
+def test_ragged_cohort():
+    """Test patients are zero-copy views and the cohort converts to and from padded arrays.
+    """
+    graphs = ragged_pats()
+    cohort = RaggedCohort.from_graphs(graphs)
+
+    assert np.shares_memory(cohort[1], cohort.timesteps), "A patient should be a view of the timesteps"
+    assert all(np.array_equal(cohort[p], graph) for p, graph in enumerate(graphs)), "Each patient should keep its timesteps"
+    assert np.array_equal(cohort.take([3, 0])[1], graphs[0]), "take should select patients in the given order"
+    assert np.array_equal(cohort.patient_slice(1, 3)[0], graphs[1]), "patient_slice should select a block of patients"
+
+    padded = cohort.to_padded()
+    assert padded.shape == (len(graphs), test_pats.shape[1]) + test_pats.shape[2:], "Padding should be to the longest patient"
+    lengths = cohort.lengths
+    assert np.array_equal(RaggedCohort.from_padded(padded, lengths).timesteps, cohort.timesteps), "The padding should be removed"
+    start_padded = cohort.to_padded(padding='start')
+    assert np.array_equal(RaggedCohort.from_padded(start_padded, lengths, padding='start').timesteps, cohort.timesteps), \
+        "Padding at the start should be removed"
+
+
+def test_ragged_matches_per_patient():
+    """Test the maximum activations and ranking match scanning each patient on its own.
+    """
+    graphs = ragged_pats()
+    cohort = RaggedCohort.from_graphs(graphs)
+
+    true_max_acts = np.concatenate([calculations.max_activation_matrix(graph[None], test_filts) for graph in graphs])
+    assert np.allclose(calculations.max_activation_matrix(cohort, test_filts, block_size=3), true_max_acts), \
+        "Maximum activations should match scanning each patient on its own"
+    assert np.all(true_max_acts[2] == 0), "A patient shorter than the filters should have no activation"
+    assert np.allclose(parallel.max_activation_matrix(cohort, test_filts, n_jobs=2), true_max_acts), \
+        "The parallel scan should match"
+
+    diff_df = max_act_diff.max_act_diff_calc('Hip Replacement', cohort, test_filts, labels, verbose=False, show_plot=False)
+    chunked_df = max_act_diff.max_act_diff_calc_chunked('Hip Replacement', cohort, test_filts, labels, chunk_size=3)
+    assert np.allclose(diff_df['Difference'], chunked_df['Difference']), "The chunked ranking should match"
+    filter_ranking = ranking.FilterRanking.compute('Hip Replacement', cohort, test_filts, labels)
+    assert filter_ranking.matches(cohort, test_filts, labels), "The ranking should be keyed by the ragged cohort"
+
+
+def test_ragged_backends():
+    """Test every installed backend scans a ragged cohort the same as the default scan.
+    """
+    cohort = RaggedCohort.from_graphs(ragged_pats())
+    expected = calculations.max_activation_matrix(cohort, test_filts)
+    for name in backends.available_backends():
+        assert np.allclose(calculations.max_activation_matrix(cohort, test_filts, block_size=1, backend=name), expected), \
+            f"The {name} backend should give the same maximum activations"
+    gemm = backends.get_backend('gemm', max_block_bytes=1)
+    assert np.allclose(parallel.max_activation_matrix(cohort, test_filts, n_jobs=2, backend=gemm), expected), \
+        "The workers should scan with the backend"
@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+
+from tgcnn_act_graph import utils, max_act_diff, figures, ranking
+from tgcnn_act_graph.ranking import FilterRanking, RankingState
+from test_graphs.test_calculations import test_pats, test_filts, labels
+
+
+def test_ranking_save_load(tmp_path):
+    """Test a saved ranking loads back the same and a stale ranking is detected.
+    """
+    ranking = FilterRanking.compute('Hip Replacement', test_pats, test_filts, labels)
+    path = tmp_path / 'ranking.npz'
+    ranking.save(path)
+
+    loaded = FilterRanking.load(path, test_pats, test_filts, labels)
+    assert loaded.key == ranking.key, "The content hash should be saved"
+    assert loaded.table.equals(ranking.table), "The Filter and Difference columns should be saved"
+    assert np.array_equal(utils.get_max_act_filt(loaded, test_filts), test_filts[ranking.best_filter-1]), "The best filter should be selected"
+
+    changed_labels = [1, 1, 1, 0]
+    assert not loaded.matches(test_pats, test_filts, changed_labels), "Different labels should give a different key"
+    with pytest.raises(ValueError):
+        FilterRanking.load(path, test_pats, test_filts * 2, labels)
+
+    for same_labels in (np.asarray(labels, dtype=np.int32), np.asarray(labels, dtype=bool), np.asarray(labels, dtype=float)):
+        assert loaded.matches(test_pats, test_filts, same_labels), "The type of the labels shouldn't change the key"
+    with pytest.raises(ValueError, match='together'):
+        FilterRanking.load(path, filters=test_filts)
+
+
+def test_edge_activated_graph_reuses_ranking(monkeypatch):
+    """Test the cohort isn't scanned again when a ranking is given.
+    """
+    ranking = FilterRanking.compute('Hip Replacement', test_pats, test_filts, labels)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("The ranking should not be recalculated")
+
+    monkeypatch.setattr(max_act_diff, 'max_act_diff_calc', fail)
+    monkeypatch.setattr(figures.plt, 'show', lambda: None)
+    figures.edge_activated_graph(test_pats, 1, test_filts, labels, filter_ranking=ranking)
+
+
+def test_ranking_state_updates(tmp_path):
+    """Test adding and removing patients gives the same ranking as recalculating from scratch.
+    """
+    state = RankingState('Hip Replacement', test_filts)
+    state.update(test_pats[:2], labels[:2]).update(test_pats[2:], labels[2:])
+    assert state.patient_ids.tolist() == [0, 1, 2, 3], "The patients should be numbered in the order they were added"
+    full_diff = max_act_diff.max_act_diff_calc('Hip Replacement', test_pats, test_filts, labels, verbose=False, show_plot=False)
+    assert np.allclose(state.difference_df()['Difference'], full_diff['Difference']), "Adding every patient should match the full ranking"
+
+    path = tmp_path / 'state.npz'
+    state.save(path)
+    state = RankingState.load(path)
+    state.remove([1])
+    keep = [0, 2, 3]
+    kept_diff = max_act_diff.max_act_diff_calc('Hip Replacement', test_pats[keep], test_filts, [labels[k] for k in keep], verbose=False, show_plot=False)
+    assert np.allclose(state.difference_df()['Difference'], kept_diff['Difference']), "Removing a patient should match recalculating without it"
+
+    with pytest.raises(ValueError):
+        state.remove([1])
+    with pytest.raises(ValueError):
+        state.update(test_pats[:1], labels[:1], patient_ids=[0])
+    assert len(state) == 3, "Patients that can't be removed or added shouldn't change the cohort"
+
+
+def test_ranking_state_many_updates():
+    """Test the ranking still matches recalculating on the current cohort after many adds and removes.
+    """
+    rng = np.random.default_rng(0)
+    cohort = rng.random((40,) + test_pats.shape[1:]) * (rng.random((40,) + test_pats.shape[1:]) < 0.3)
+    filters = rng.normal(size=test_filts.shape)
+    cohort_labels = np.arange(40) % 2
+
+    state = RankingState('Hip Replacement', filters)
+    in_cohort = np.zeros(40, dtype=bool)
+    for _ in range(200):
+        change = rng.choice(40, size=5, replace=False)
+        add, remove = change[~in_cohort[change]], change[in_cohort[change]]
+        if add.shape[0]:
+            state.update(cohort[add], cohort_labels[add], patient_ids=add)
+        state.remove(remove)
+        in_cohort[change] = ~in_cohort[change]
+
+        patients = np.flatnonzero(in_cohort)
+        if np.unique(cohort_labels[patients]).shape[0] == 2:
+            expected = max_act_diff.max_act_diff_calc('Hip Replacement', cohort[patients], filters, cohort_labels[patients],
+                                                      verbose=False, show_plot=False)
+            np.testing.assert_allclose(state.difference_df()['Difference'], expected['Difference'], rtol=1e-12, atol=1e-12)
+    assert sorted(state.patient_ids.tolist()) == np.flatnonzero(in_cohort).tolist(), "The state should hold the current cohort"
+
+
+def test_ranking_hashes_cohort_once(monkeypatch, tmp_path):
+    """Test drawing many patients from a loaded ranking only hashes the cohort the first time.
+    """
+    path = tmp_path / 'ranking.npz'
+    FilterRanking.compute('Hip Replacement', test_pats, test_filts, labels).save(path)
+    loaded = FilterRanking.load(path)
+
+    hashes = []
+    content_hash = ranking.content_hash
+    monkeypatch.setattr(ranking, 'content_hash', lambda *args: hashes.append(1) or content_hash(*args))
+    for patient_number in range(len(test_pats)):
+        figures.edge_activated_graph(test_pats, patient_number, test_filts, labels, filter_ranking=loaded,
+                                     save_path=tmp_path / f'patient_{patient_number}.png', renderer='direct')
+    assert len(hashes) == 1, "The cohort should only be hashed for the first patient"
+
+    assert not loaded.matches(test_pats, test_filts, [1, 1, 1, 0]), "Different labels should still be checked"
+    assert not loaded.matches(test_pats.copy(), test_filts * 2, labels), "Different filters should still be checked"
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from tgcnn_act_graph import max_act_diff, sampling
+from tgcnn_act_graph.sparse import SparseGraphs
+from test_graphs.test_calculations import test_pats, test_filts, labels
+
+
+def make_separable_cohort(num_patients:int, seed:int):
+    """One-timestep graphs whose single event is larger in the positive class, and three filters that
+    weight the event by 1, 0.5 and 0.1.
+    """
+    rng = np.random.default_rng(seed)
+    cohort_labels = rng.integers(0, 2, size=num_patients)
+    pat_graphs = np.zeros((num_patients, 1, 2, 2))
+    pat_graphs[:, 0, 0, 1] = rng.normal(5, 1, size=num_patients) + 5 * cohort_labels
+    filters = np.zeros((3, 1, 2, 2))
+    filters[:, 0, 0, 1] = [1, 0.5, 0.1]
+    return pat_graphs, filters, cohort_labels
+
+
+def test_sampled_ranking_separates_top_filter():
+    """Test sampling stops early with the same top filter as the exact ranking, and the intervals cover
+    the exact differences.
+    """
+    pat_graphs, filters, cohort_labels = make_separable_cohort(4000, seed=0)
+    exact_df = max_act_diff.max_act_diff_calc('label', pat_graphs, filters, cohort_labels, verbose=False, show_plot=False)
+    sampled_df = sampling.sampled_max_act_diff('label', pat_graphs, filters, cohort_labels, initial_size=32, seed=0)
+
+    assert sampled_df.attrs['separated'], "The top filter should be separated"
+    assert max(sampled_df.attrs['sampled']) < 2000, "Only a sample of each class should be scanned"
+    assert sampled_df['Difference'].idxmax() == exact_df['Difference'].idxmax(), "The top filter should match the exact ranking"
+    assert np.all((sampled_df['Lower'] <= exact_df['Difference']) & (exact_df['Difference'] <= sampled_df['Upper'])), \
+        "The confidence intervals should cover the exact differences"
+
+
+def test_sampled_ranking_every_patient():
+    """Test sampling every patient (dense or sparse) gives the exact ranking with no uncertainty.
+    """
+    exact_df = max_act_diff.max_act_diff_calc_chunked('Hip Replacement', test_pats, test_filts, labels)
+    for pat_graphs in (test_pats, SparseGraphs.from_dense(test_pats)):
+        sampled_df = sampling.sampled_max_act_diff('Hip Replacement', pat_graphs, test_filts, labels, initial_size=10)
+        assert np.allclose(sampled_df['Difference'], exact_df['Difference']), "Sampling every patient should be exact"
+        assert np.allclose(sampled_df['Lower'], sampled_df['Upper']), "The intervals should shrink to the exact difference"
+
+    with pytest.raises(ValueError):
+        sampling.sampled_max_act_diff('Hip Replacement', test_pats, test_filts, [1, 1, 1, 1])
+    with pytest.raises(ValueError):
+        sampling.sampled_max_act_diff('Hip Replacement', test_pats, test_filts, labels, initial_size=1)
+
+
+def test_single_sample_not_separated():
+    """Test a class with one sample has unbounded intervals, so it can't separate the top filter.
+    """
+    sums, squares = np.array([[2.0, 1.0], [10.0, 5.0]]), np.array([[4.0, 1.0], [100.0, 25.0]])
+    difference, lower, upper = sampling.difference_intervals(sums, squares, np.array([1, 1]), np.array([100, 100]), z=2)
+    assert np.allclose(difference, [8, 4]), "The difference should be the difference of the sample means"
+    assert np.all(lower == 0) and np.all(np.isinf(upper)), "One sample per class should give no bound"
+
+    _, lower, upper = sampling.difference_intervals(sums, squares, np.array([1, 1]), np.array([1, 1]), z=2)
+    assert np.allclose(lower, upper), "Fully sampled classes should have no uncertainty"
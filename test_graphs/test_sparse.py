@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from tgcnn_act_graph import utils, max_act_diff, calculations
+from tgcnn_act_graph.sparse import SparseGraphs
+from test_graphs.test_calculations import test_pats, test_filts, labels
+
+
+def test_sparse_round_trip():
+    """Test the sparse cohort keeps every event and duplicate coordinates are summed.
+    """
+    sparse_pats = SparseGraphs.from_dense(test_pats)
+
+    assert sparse_pats.nnz == np.count_nonzero(test_pats), "Only the non-zero events should be stored"
+    assert np.array_equal(sparse_pats.to_dense(), test_pats), "Densifying should give back the original graphs"
+    assert np.array_equal(sparse_pats[2].to_dense(), test_pats[2]), "Selecting a patient should match the dense patient"
+
+    coo = SparseGraphs.from_coo([[0, 1, 0], [2, 0, 2], [1, 1, 1]], [3, 4, 5], (2, 3, 3))
+    assert coo.to_dense()[0, 2, 1] == 8, "Duplicate coordinates should be summed"
+
+
+def test_sparse_matches_dense():
+    """Test the ranking, activated graph and edges are the same for sparse and dense inputs.
+    """
+    sparse_pats = SparseGraphs.from_dense(test_pats)
+
+    dense_diff = max_act_diff.max_act_diff_calc('Hip Replacement', test_pats, test_filts, labels, verbose=False, show_plot=False)
+    sparse_diff = max_act_diff.max_act_diff_calc('Hip Replacement', sparse_pats, test_filts, labels, verbose=False, show_plot=False)
+    assert np.allclose(dense_diff['Difference'], sparse_diff['Difference']), "The filter differences should match"
+
+    max_act_filt = utils.get_max_act_filt(dense_diff, test_filts)
+    dense_graph, filt = utils.flip_graph(utils.select_patient(test_pats, 1), max_act_filt)
+    sparse_graph, _ = utils.flip_graph(utils.select_patient(sparse_pats, 1), max_act_filt)
+
+    dense_edges = utils.create_edges_df(dense_graph, calculations.get_act_graph_array(dense_graph, filt))
+    sparse_edges = utils.create_edges_df(sparse_graph, calculations.get_act_graph_array(sparse_graph, filt))
+
+    assert dense_edges['start_node'].tolist() == sparse_edges['start_node'].tolist(), "Start nodes should match"
+    assert dense_edges['end_node'].tolist() == sparse_edges['end_node'].tolist(), "End nodes should match"
+    assert np.allclose(dense_edges['weight'].astype(float), sparse_edges['weight']), "Edge weights should match"
+
+
+def test_sparse_take():
+    """Test selecting patients in any order matches indexing the dense array.
+    """
+    sparse_pats = SparseGraphs.from_dense(test_pats)
+    assert np.array_equal(sparse_pats.take([3, 0, 2]).to_dense(), test_pats[[3, 0, 2]]), "The patients should be selected in order"
+
+
+def test_sparse_unsorted_coords():
+    """Test unsorted or duplicate coordinates are rejected by the constructor and sorted by from_coo.
+    """
+    sparse_pats = SparseGraphs.from_dense(test_pats)
+    order = np.random.default_rng(0).permutation(sparse_pats.nnz)
+    with pytest.raises(ValueError, match='from_coo'):
+        SparseGraphs(sparse_pats.coords[:, order], sparse_pats.values[order], sparse_pats.shape)
+    with pytest.raises(ValueError, match='from_coo'):
+        SparseGraphs(sparse_pats.coords[:, [0, 0]], sparse_pats.values[[0, 0]], sparse_pats.shape)
+
+    unsorted = SparseGraphs.from_coo(sparse_pats.coords[:, order], sparse_pats.values[order], sparse_pats.shape)
+    assert np.array_equal(unsorted[2].to_dense(), test_pats[2]), "from_coo should sort the events so patients are found"
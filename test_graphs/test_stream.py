@@ -0,0 +1,41 @@
+import threading
+
+import pandas as pd
+import pytest
+
+from tgcnn_act_graph import calculations, max_act_diff, utils
+from tgcnn_act_graph.ranking import FilterRanking
+from tgcnn_act_graph.stream import iter_edge_activations
+from test_graphs.test_calculations import test_pats, test_filts, labels
+
+
+@pytest.mark.parametrize('prefetch', [0, 2])
+def test_iter_edge_activations(prefetch):
+    """Test each patient's edges match the pipeline in edge_activated_graph, with and without prefetching.
+    """
+    filter_ranking = FilterRanking.compute('Hip Replacement', test_pats, test_filts, labels)
+    max_act_filt = utils.get_max_act_filt(filter_ranking, test_filts)
+
+    results = list(iter_edge_activations(test_pats, filter_ranking, test_filts, patients=[3, 1], prefetch=prefetch))
+    assert [result.patient_number for result in results] == [3, 1], "Patients should be yielded in the order given"
+
+    for result in results:
+        patient_graph, filt = utils.flip_graph(test_pats[result.patient_number], max_act_filt)
+        edges_df = utils.create_edges_df(patient_graph, calculations.get_act_graph_array(patient_graph, filt))
+        assert result.filter_num == filter_ranking.best_filter, "The best filter of the ranking should be used"
+        pd.testing.assert_frame_equal(result.edges, edges_df)
+
+
+def test_iter_edge_activations_prefetch_stops():
+    """Test the background thread stops when the consumer stops early and errors reach the consumer.
+    """
+    difference_df = max_act_diff.max_act_diff_calc('Hip Replacement', test_pats, test_filts, labels, verbose=False, show_plot=False)
+
+    num_threads = threading.active_count()
+    results = iter_edge_activations(test_pats, difference_df, test_filts, prefetch=1)
+    assert next(results).patient_number == 0, "The first patient should come first"
+    results.close()
+    assert threading.active_count() == num_threads, "The prefetch thread should stop with the consumer"
+
+    with pytest.raises(IndexError):
+        list(iter_edge_activations(test_pats, difference_df, test_filts, patients=[0, 10], prefetch=1))
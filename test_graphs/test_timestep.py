@@ -0,0 +1,42 @@
+import matplotlib
+matplotlib.use('Agg')
+
+import numpy as np  # noqa: E402
+
+from tgcnn_act_graph import calculations  # noqa: E402
+from tgcnn_act_graph.sparse import SparseGraphs  # noqa: E402
+from tgcnn_act_graph.timestep import TimestepActivations  # noqa: E402
+from test_graphs.test_calculations import test_pats, test_filts  # noqa: E402
+
+
+def test_timestep_activations():
+    """Test the kept window activations match scanning each window one at a time and give the
+    same maximum activations as the ranking.
+    """
+    timestep_acts = TimestepActivations.compute(test_pats, test_filts, block_size=3, dtype=np.float64)
+    filt_steps = test_filts.shape[1]
+
+    for p in range(test_pats.shape[0]):
+        for k in range(test_filts.shape[0]):
+            true_acts = [calculations.leaky_relu(np.sum(test_pats[p, w:w+filt_steps] * test_filts[k]), 0.01)
+                         for w in range(test_pats.shape[1] - filt_steps + 1)]
+            assert np.allclose(timestep_acts.window_activations(p, k+1), true_acts), "Window activations should match the loop"
+
+    assert np.allclose(timestep_acts.max_activations(), calculations.max_activation_matrix(test_pats, test_filts)), \
+        "The maximum over the windows should be the maximum activation"
+    sparse_acts = TimestepActivations.compute(SparseGraphs.from_dense(test_pats), test_filts)
+    assert np.allclose(sparse_acts.activations, timestep_acts.activations), "Sparse graphs should give the same activations"
+
+
+def test_timestep_importance(tmp_path):
+    """Test each timestep gets the largest activation of the windows covering it.
+    """
+    window_acts = np.array([1., 5., 2., -0.5])
+    importance = calculations.timestep_importance(window_acts, 2)
+
+    assert importance.tolist() == [1., 5., 5., 2., 0.], "Each timestep should get the largest covering window activation"
+
+    timestep_acts = TimestepActivations.compute(test_pats, test_filts)
+    assert timestep_acts.timestep_importance(0).shape == (test_filts.shape[0], test_pats.shape[1]), "There should be one value per filter and timestep"
+    timestep_acts.plot(0, save_path=tmp_path / 'timesteps.png')
+    assert (tmp_path / 'timesteps.png').exists(), "The plot should be saved"
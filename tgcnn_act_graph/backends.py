@@ -0,0 +1,227 @@
+"""Registry of compute backends for the two kernels of the pipeline, selected by name:
+
+- window_activation_sums(pat_graphs, filters): (patients, filters, windows) window sums of dense 4D
+  patient graphs, as calculations.window_activation_sums.
+- act_graph_array(graphs, filts): graphs (..., T, N, N) multiplied by the filters (..., T_f, N, N)
+  repeated along the time axis with the leaky ReLU applied, as calculations._repeated_filter_activation.
+
+Backends with optional dependencies are only loaded when first asked for, and fall back to 'numpy'
+with a warning if the dependency isn't installed. Options of a window_activation_sums kernel, such as
+the block size of 'gemm', are set with get_backend(name, **options), and the returned Backend can be
+passed anywhere a backend name is accepted.
+"""
+import functools
+import inspect
+import warnings
+from dataclasses import dataclass, field
+
+import numpy as np
+
+DEFAULT_BACKEND = 'numpy'
+
+
+@dataclass
+class Backend:
+    """Kernels of one backend.
+
+    Args:
+        name (str): name the backend is registered under.
+        window_activation_sums (callable): window sum kernel.
+        act_graph_array (callable): activated graph kernel.
+        options (dict): keyword arguments bound to the window sum kernel.
+    """
+    name: str
+    window_activation_sums: callable
+    act_graph_array: callable
+    options: dict = field(default_factory=dict)
+
+
+# name: function loading the backend, which raises ImportError if a dependency is missing
+_loaders = {}
+_loaded = {}
+
+
+def register_backend(name:str, loader):
+    """Register a backend. The loader is called the first time the backend is asked for.
+
+    Args:
+        name (str): name to select the backend by.
+        loader (callable): function with no arguments returning a Backend, raising ImportError if a
+            dependency is missing.
+    """
+    _loaders[name] = loader
+    _loaded.pop(name, None)
+
+
+def get_backend(name:str=None, fallback:bool=True, **options):
+    """Get a backend by name, loading it if needed.
+
+    Args:
+        name (str or Backend): registered backend name, DEFAULT_BACKEND if not given. A Backend is
+            returned as it is.
+        fallback (bool): use DEFAULT_BACKEND (with a warning, and without the options) if a dependency
+            of the backend is missing, otherwise raise the ImportError.
+        **options: keyword arguments for the window_activation_sums kernel, e.g.
+            get_backend('gemm', max_block_bytes=2**24).
+
+    Raises:
+        ValueError: if no backend is registered under the name, or its kernel doesn't take the options.
+
+    Returns:
+        Backend: the backend.
+    """
+    if isinstance(name, Backend):
+        return name
+    if name is None:
+        name = DEFAULT_BACKEND
+    if options:
+        backend = get_backend(name, fallback)
+        if backend.name != name:
+            return backend
+        parameters = inspect.signature(backend.window_activation_sums).parameters
+        unknown = sorted(set(options) - set(parameters))
+        if unknown:
+            raise ValueError(f"The {name!r} backend has no options {unknown}.")
+        return Backend(name, functools.partial(backend.window_activation_sums, **options), backend.act_graph_array,
+                       dict(options))
+    if name in _loaded:
+        return _loaded[name]
+    if name not in _loaders:
+        raise ValueError(f"Unknown backend {name!r}, choose from {sorted(_loaders)}.")
+
+    try:
+        _loaded[name] = _loaders[name]()
+    except ImportError as e:
+        if not fallback or name == DEFAULT_BACKEND:
+            raise
+        warnings.warn(f"The {name!r} backend is not available ({e}), using {DEFAULT_BACKEND!r} instead.", RuntimeWarning)
+        return get_backend(DEFAULT_BACKEND)
+    return _loaded[name]
+
+
+def available_backends():
+    """Names of the registered backends whose dependencies are installed.
+
+    Returns:
+        list: backend names.
+    """
+    names = []
+    for name in _loaders:
+        try:
+            get_backend(name, fallback=False)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def check_parity(pat_graphs:np.ndarray, filters:np.ndarray, names:list=None, rtol:float=1e-5, atol:float=1e-6):
+    """Compare the kernels of each backend against the 'numpy' reference on the same inputs.
+
+    Args:
+        pat_graphs (np.ndarray): 4D dense patient graphs.
+        filters (np.ndarray): 4D array of filters.
+        names (list): backends to check, every available backend if not given.
+        rtol (float): relative tolerance.
+        atol (float): absolute tolerance.
+
+    Returns:
+        dict: backend name: dict of the largest absolute difference from the reference for each kernel
+        and whether both kernels are within the tolerance.
+    """
+    reference = get_backend(DEFAULT_BACKEND)
+    ref_sums = reference.window_activation_sums(pat_graphs, filters)
+    ref_acts = reference.act_graph_array(pat_graphs[:, None], filters)
+
+    report = {}
+    for name in (available_backends() if names is None else names):
+        backend = get_backend(name, fallback=False)
+        sums = backend.window_activation_sums(pat_graphs, filters)
+        acts = backend.act_graph_array(pat_graphs[:, None], filters)
+        report[name] = {
+            'window_activation_sums': float(np.max(np.abs(sums - ref_sums), initial=0)),
+            'act_graph_array': float(np.max(np.abs(acts - ref_acts), initial=0)),
+            'ok': sums.shape == ref_sums.shape and acts.shape == ref_acts.shape
+                  and np.allclose(sums, ref_sums, rtol=rtol, atol=atol) and np.allclose(acts, ref_acts, rtol=rtol, atol=atol),
+        }
+    return report
+
+
+def _load_numpy():
+    from tgcnn_act_graph import calculations
+    return Backend('numpy', calculations.window_activation_sums, calculations._repeated_filter_activation)
+
+
+def _load_gemm():
+    from tgcnn_act_graph import calculations
+    return Backend('gemm', calculations.window_activation_sums_gemm, calculations._repeated_filter_activation)
+
+
+def _load_numba():
+    import numba
+
+    from tgcnn_act_graph import calculations
+
+    # Single threaded: numba's thread pool isn't fork safe and parallel.max_activation_matrix
+    # already spreads the patients over processes
+    @numba.njit
+    def window_sums(graphs_flat, filts_flat, out):
+        num_pats, time_steps, num_cells = graphs_flat.shape
+        num_filters, filt_steps, _ = filts_flat.shape
+        num_windows = out.shape[2]
+        for p in range(num_pats):
+            for t in range(time_steps):
+                for m in range(num_cells):
+                    value = graphs_flat[p, t, m]
+                    # only recorded events contribute, so the work scales with the number of events
+                    if value == 0:
+                        continue
+                    for offset in range(filt_steps):
+                        window = t - offset
+                        if 0 <= window < num_windows:
+                            for k in range(num_filters):
+                                out[p, k, window] += value * filts_flat[k, offset, m]
+
+    def window_activation_sums(pat_graphs, filters):
+        if pat_graphs.ndim != 4:
+            raise ValueError("The input array must be 4-dimensional.")
+        if filters.ndim != 4:
+            raise ValueError("The filters array must be 4-dimensional.")
+        num_pats, time_steps = pat_graphs.shape[:2]
+        num_filters, filt_steps = filters.shape[:2]
+        out = np.zeros((num_pats, num_filters, max(time_steps - filt_steps + 1, 0)))
+        window_sums(np.ascontiguousarray(pat_graphs, dtype=np.float64).reshape(num_pats, time_steps, -1),
+                    np.ascontiguousarray(filters, dtype=np.float64).reshape(num_filters, filt_steps, -1), out)
+        return out
+
+    # the activated graph is element-wise work that NumPy already does at memory speed
+    return Backend('numba', window_activation_sums, calculations._repeated_filter_activation)
+
+
+def _load_torch():
+    import torch
+
+    from tgcnn_act_graph import calculations
+
+    def window_activation_sums(pat_graphs, filters):
+        if pat_graphs.ndim != 4:
+            raise ValueError("The input array must be 4-dimensional.")
+        if filters.ndim != 4:
+            raise ValueError("The filters array must be 4-dimensional.")
+        # conv3d over (timesteps, nodes, nodes) with filters covering every node is the TG-CNN
+        # layer: one output per filter and window, (patients, filters, windows, 1, 1)
+        graphs = torch.from_numpy(np.ascontiguousarray(pat_graphs, dtype=np.float64))[:, None]
+        weights = torch.from_numpy(np.ascontiguousarray(filters, dtype=np.float64))[:, None]
+        if graphs.shape[2] < weights.shape[2]:
+            return np.zeros((pat_graphs.shape[0], filters.shape[0], 0))
+        with torch.no_grad():
+            sums = torch.nn.functional.conv3d(graphs, weights)
+        return sums[:, :, :, 0, 0].numpy()
+
+    return Backend('torch', window_activation_sums, calculations._repeated_filter_activation)
+
+
+register_backend('numpy', _load_numpy)
+register_backend('gemm', _load_gemm)
+register_backend('numba', _load_numba)
+register_backend('torch', _load_torch)
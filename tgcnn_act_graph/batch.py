@@ -0,0 +1,107 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib.pyplot as plt
+from matplotlib.backend_bases import FigureCanvasBase
+import numpy as np
+import pandas as pd
+
+from tgcnn_act_graph import figures
+from tgcnn_act_graph.ranking import FilterRanking
+
+# Cohort inputs for the worker process, set once per worker by _init_worker so the cohort
+# isn't pickled again for every patient.
+_worker_inputs = {}
+
+
+def _init_worker(input_tensors, filters:np.array, labels:list, filter_ranking:FilterRanking, renderer:str, headless:bool=True):
+    """Keep the cohort inputs for the worker and switch it to the non-interactive Agg backend."""
+    if headless:
+        plt.switch_backend('agg')
+    _worker_inputs.update(input_tensors=input_tensors, filters=filters, labels=labels, filter_ranking=filter_ranking,
+                          renderer=renderer)
+
+
+def _render_patient(patient_number:int, save_path:str):
+    """Draw one patient to a file, returning a record of how long it took and any error."""
+    start = time.perf_counter()
+    error = None
+    try:
+        figures.edge_activated_graph(_worker_inputs['input_tensors'], patient_number, _worker_inputs['filters'],
+                                     _worker_inputs['labels'], filter_ranking=_worker_inputs['filter_ranking'],
+                                     check_ranking=False, save_path=save_path, renderer=_worker_inputs['renderer'])
+    except Exception as e:
+        error = f'{type(e).__name__}: {e}'
+        plt.close('all')
+    return {'patient_number': patient_number, 'path': save_path, 'seconds': time.perf_counter() - start, 'error': error}
+
+
+def render_edge_activated_graphs(input_tensors, patient_numbers:list, filters:np.array, labels:list, output_dir:str,
+                                 file_format:str='png', n_workers:int=None, filter_ranking:FilterRanking=None,
+                                 renderer:str='networkx', verbose:bool=False):
+    """Draw the edge activated graph for many patients straight to image files, without a display.
+
+    The filter ranking is calculated (or checked) once, then the patients are shared out across a
+    pool of worker processes which each get a copy of the cohort once. Each figure is closed as soon
+    as it is saved so memory doesn't grow with the number of patients.
+
+    Args:
+        input_tensors (np.array): 4D array of patient graph representations (3D).
+        patient_numbers (list): Patients to draw.
+        filters (np.array): 4D array of filters from the TG-CNN model (3D).
+        labels (list): Binary outcome (0 or 1) for each patient.
+        output_dir (str): Folder to write the images to, created if it doesn't exist.
+        file_format (str): Image format, e.g. 'png' or 'svg', one of the formats matplotlib can save. Ignored
+            by the 'html' renderer, which writes .html files.
+        n_workers (int): Number of worker processes, defaults to the number of CPUs. With 1 or fewer
+            the patients are drawn in this process.
+        filter_ranking (FilterRanking): Precomputed ranking of the filters for these inputs.
+        renderer (str): 'networkx', 'direct' or 'html', see figures.edge_activated_graph.
+        verbose (bool): Print a line for every file.
+
+    Raises:
+        ValueError: if the renderer or file format isn't supported.
+
+    Returns:
+        pd.DataFrame: one row per patient with columns patient_number, path, seconds and error
+        (None if the image was written).
+    """
+    # Checked here so a bad option fails once rather than for every patient in the pool
+    if renderer not in ('networkx', 'direct', 'html'):
+        raise ValueError("renderer must be 'networkx', 'direct' or 'html'.")
+    if renderer == 'html':
+        file_format = 'html'
+    elif file_format not in FigureCanvasBase.get_supported_filetypes():
+        raise ValueError(f"file_format must be one of {sorted(FigureCanvasBase.get_supported_filetypes())}.")
+
+    if filter_ranking is None:
+        filter_ranking = FilterRanking.compute('Hip Replacement', input_tensors, filters, labels)
+    else:
+        filter_ranking.check(input_tensors, filters, labels)
+
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = [(int(n), os.path.join(output_dir, f'patient_{n}.{file_format}')) for n in patient_numbers]
+    init_args = (input_tensors, filters, labels, filter_ranking, renderer)
+
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+
+    records = []
+    if n_workers <= 1:
+        # Figures are saved and closed without being shown so the current backend can be kept
+        _init_worker(*init_args, headless=False)
+        for task in tasks:
+            records.append(_render_patient(*task))
+            if verbose:
+                print(records[-1])
+        _worker_inputs.clear()
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=init_args) as pool:
+            futures = [pool.submit(_render_patient, *task) for task in tasks]
+            for future in futures:
+                records.append(future.result())
+                if verbose:
+                    print(records[-1])
+
+    return pd.DataFrame(records, columns=['patient_number', 'path', 'seconds', 'error'])
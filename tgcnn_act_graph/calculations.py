@@ -1,4 +1,5 @@
 import numpy as np
+from tgcnn_act_graph import backends, ragged, sparse
 
 
 def repeat_array_fractional(array: np.ndarray, repeats: float):
@@ -49,38 +50,282 @@ def leaky_relu(x:float, alpha:int):
     return max(alpha * x, x) # if it's negative multiply by 0.01
 
 
-def get_act_graph_array(pat_graph: np.array, max_act_filt: np.array):
+def leaky_relu_array(x:np.ndarray, alpha:float=0.01, out:np.ndarray=None):
+    """Array version of leaky_relu using ufuncs: negative values are multiplied by alpha.
+
+    Args:
+        x (np.ndarray): activations.
+        alpha (float): hyperparameter to select or tune.
+        out (np.ndarray): float array to write the result to, can be x itself to work in place.
+            A new float array is made if not given.
+
+    Returns:
+        np.ndarray: activations with leaky ReLU applied.
+    """
+    if out is None:
+        out = np.array(x, dtype=np.result_type(x, alpha))
+    elif out is not x:
+        np.copyto(out, x)
+    np.multiply(out, alpha, out=out, where=out < 0)
+    return out
+
+
+def _repeated_filter_activation(graphs:np.ndarray, filts:np.ndarray):
+    """Multiply graphs (..., T, N, N) by filters (..., T_f, N, N) repeated along the time axis, broadcasting
+    the leading axes, and apply the leaky ReLU in place.
+    """
+    time_steps = graphs.shape[-3]
+    filt_steps = filts.shape[-3]
+    num_blocks = time_steps // filt_steps
+    full_steps = num_blocks * filt_steps
+
+    out_shape = np.broadcast_shapes(graphs.shape[:-3], filts.shape[:-3]) + graphs.shape[-3:]
+    activated_graph = np.empty(out_shape, dtype=np.result_type(graphs, filts, 0.01))
+
+    # Element-wise multiplication of each block of the patient graph with the filter
+    np.multiply(graphs[..., :full_steps, :, :].reshape(graphs.shape[:-3] + (num_blocks, filt_steps) + graphs.shape[-2:]),
+                filts[..., None, :, :, :],
+                out=activated_graph[..., :full_steps, :, :].reshape(out_shape[:-3] + (num_blocks, filt_steps) + out_shape[-2:]))
+    np.multiply(graphs[..., full_steps:, :, :], filts[..., :time_steps - full_steps, :, :],
+                out=activated_graph[..., full_steps:, :, :])
+
+    # apply a leaky relu (activation)
+    return leaky_relu_array(activated_graph, 0.01, out=activated_graph)
+
+
+def get_act_graph_array(pat_graph: np.array, max_act_filt: np.array, backend:str=None):
     """Get the activated_graph which is the graph element-wise multiplied by the 'sliding window'. 
 
     The stride must be the same as the filter.shape[0] so that slices don't overlap (otherwise we
     get multiple mappings).
 
-    The filter is repeated to be the same length as the patient graph then the two graphs are 
-    multiplied together (element-wise) to get the activated graph.
+    The patient graph is split into non-overlapping blocks of filter.shape[0] timesteps and the filter
+    is broadcast over the blocks (with the first rows of the filter used for a shorter last block),
+    which is the same as repeating the filter to the length of the graph without building the
+    repeated filter. The leaky ReLU is then applied in place.
+
+    A 4D array of patient graphs is processed in one call and gives a 4D array of activated graphs.
+    A sparse.SparseGraphs patient graph is multiplied at its events only and a SparseGraphs
+    activated graph is returned.
+
+    Args:
+        pat_graph (np.array): 3D patient graph, or 4D for a batch of patients.
+        max_act_filt (np.array): 3D filter.
+        backend (str or backends.Backend): compute backend for dense graphs (see backends.get_backend).
 
     Raises:
-        ValueError: if the patient graph is not 3D then raise an error.
+        ValueError: if the patient graph is not 3D (or 4D for a batch) then raise an error.
 
     Returns:
         np.array: filter array .* patient array.
     """
 
-    if pat_graph.ndim != 3:
-        raise ValueError("The input array must be 3-dimensional.")
+    if pat_graph.ndim not in (3, 4):
+        raise ValueError("The input array must be 3-dimensional (or 4-dimensional for a batch of patients).")
 
-    vectorized_leaky_relu = np.vectorize(leaky_relu)
-    
-    filt_num_repeats = pat_graph.shape[0]/max_act_filt.shape[0]
+    if isinstance(pat_graph, sparse.SparseGraphs):
+        return sparse.get_act_graph_array(pat_graph, max_act_filt, 0.01)
 
+    return backends.get_backend(backend).act_graph_array(pat_graph, max_act_filt)
 
-    # To reduce compute repeat the filter to be the same size as the patient graph.
-    # That way the two can be directly multiplied rather than sliding.
-    filt_repeated = repeat_array_fractional(max_act_filt, filt_num_repeats)
 
-    # Element-wise multiplication for the patient graph and the repeated filter
-    filt_times_graph = filt_repeated * pat_graph
+def get_act_graph_array_multi(pat_graph:np.ndarray, filts:np.ndarray, backend:str=None):
+    """Get the activated graph for several filters at once, e.g. the top k filters from
+    utils.get_top_k_filts, in one stacked multiplication.
 
-    # apply a leaky relu (activation)
-    activated_graph = vectorized_leaky_relu(filt_times_graph, 0.01)
+    Args:
+        pat_graph (np.ndarray or sparse.SparseGraphs): 3D patient graph, or 4D for a batch of patients.
+        filts (np.ndarray): 4D array (filters, filter timesteps, nodes, nodes) of filters.
+        backend (str or backends.Backend): compute backend for dense graphs (see backends.get_backend).
+
+    Raises:
+        ValueError: if the patient graph is not 3D or 4D, or the filters are not 4D.
+
+    Returns:
+        np.ndarray: (filters, timesteps, nodes, nodes) activated graphs for a 3D patient graph or
+        (patients, filters, timesteps, nodes, nodes) for a batch. For a SparseGraphs patient graph,
+        a list with a SparseGraphs activated graph for each filter.
+    """
+    if pat_graph.ndim not in (3, 4):
+        raise ValueError("The input array must be 3-dimensional (or 4-dimensional for a batch of patients).")
+    if filts.ndim != 4:
+        raise ValueError("The filters array must be 4-dimensional.")
+
+    if isinstance(pat_graph, sparse.SparseGraphs):
+        return [sparse.get_act_graph_array(pat_graph, filt, 0.01) for filt in filts]
+
+    return backends.get_backend(backend).act_graph_array(pat_graph[..., None, :, :, :], filts)
+
+
+def window_activation_sums(pat_graphs:np.ndarray, filters:np.ndarray):
+    """Get the sum of the element-wise product between every filter and every window of every
+    patient graph, before the activation function is applied. Assumes a stride length of one and
+    only uses windows that are the full length of the filter.
+
+    Rather than multiplying one window at a time, each filter timestep is matched against the
+    patient timesteps it lines up with in a single matrix multiplication, so the whole scan is
+    filters.shape[1] matrix multiplications.
+
+    Args:
+        pat_graphs (np.ndarray): 4D array (patients, timesteps, nodes, nodes) of patient graphs.
+        filters (np.ndarray): 4D array (filters, filter timesteps, nodes, nodes) of filters.
+
+    Raises:
+        ValueError: if either array isn't 4D.
+
+    Returns:
+        np.ndarray: 3D float array (patients, filters, windows) of window sums.
+    """
+    if pat_graphs.ndim != 4:
+        raise ValueError("The input array must be 4-dimensional.")
+    if filters.ndim != 4:
+        raise ValueError("The filters array must be 4-dimensional.")
+
+    num_pats, time_steps = pat_graphs.shape[:2]
+    num_filters, filt_steps = filters.shape[:2]
+    num_windows = max(time_steps - filt_steps + 1, 0)
+
+    graphs_flat = pat_graphs.reshape(num_pats, time_steps, -1)
+    filts_flat = filters.reshape(num_filters, filt_steps, -1).astype(np.float64)
 
-    return activated_graph
\ No newline at end of file
+    sums = np.zeros((num_pats, num_windows, num_filters))
+    for offset in range(filt_steps):
+        # (patients, windows, nodes*nodes) @ (nodes*nodes, filters)
+        sums += graphs_flat[:, offset:offset + num_windows] @ filts_flat[:, offset].T
+
+    return sums.transpose(0, 2, 1)
+
+
+def window_activation_sums_gemm(pat_graphs:np.ndarray, filters:np.ndarray, max_block_bytes:int=2**26):
+    """Same as window_activation_sums, as a single matrix multiplication per block of patients: the
+    windows of the patients are unfolded (im2col) into rows of filter timesteps * nodes * nodes values
+    and multiplied by all the flattened filters at once. This suits large filter banks, where one big
+    multiplication keeps BLAS busier than filters.shape[1] smaller ones.
+
+    Args:
+        pat_graphs (np.ndarray): 4D array (patients, timesteps, nodes, nodes) of patient graphs.
+        filters (np.ndarray): 4D array (filters, filter timesteps, nodes, nodes) of filters.
+        max_block_bytes (int): largest size of the unfolded windows, the patients are unfolded in blocks
+            that fit.
+
+    Raises:
+        ValueError: if either array isn't 4D.
+
+    Returns:
+        np.ndarray: 3D float array (patients, filters, windows) of window sums.
+    """
+    if pat_graphs.ndim != 4:
+        raise ValueError("The input array must be 4-dimensional.")
+    if filters.ndim != 4:
+        raise ValueError("The filters array must be 4-dimensional.")
+
+    num_pats, time_steps = pat_graphs.shape[:2]
+    num_filters, filt_steps = filters.shape[:2]
+    num_windows = max(time_steps - filt_steps + 1, 0)
+    sums = np.zeros((num_pats, num_filters, num_windows))
+    if num_windows == 0:
+        return sums
+
+    graphs_flat = pat_graphs.reshape(num_pats, time_steps, -1)
+    # (filter timesteps * nodes * nodes, filters)
+    filts_flat = filters.reshape(num_filters, -1).astype(np.float64).T
+    window_bytes = num_windows * filts_flat.shape[0] * 8
+    block_size = max(max_block_bytes // window_bytes, 1)
+
+    for start in range(0, num_pats, block_size):
+        # (patients, windows, nodes*nodes, filter timesteps) view, copied as (patients*windows, filter timesteps*nodes*nodes)
+        windows = np.lib.stride_tricks.sliding_window_view(graphs_flat[start:start + block_size], filt_steps, axis=1)
+        unfolded = np.array(windows.transpose(0, 1, 3, 2), dtype=np.float64).reshape(-1, filts_flat.shape[0])
+        sums[start:start + block_size] = (unfolded @ filts_flat).reshape(-1, num_windows, num_filters).transpose(0, 2, 1)
+
+    return sums
+
+
+def _iter_window_sums(pat_graphs, filters:np.ndarray, block_size:int, backend:str=None):
+    """Yield (first patient, window sums) for each block of block_size patients."""
+    if isinstance(pat_graphs, ragged.RaggedCohort):
+        raise TypeError("The patients of a RaggedCohort have different numbers of windows, use to_padded() first.")
+    if pat_graphs.ndim != 4:
+        raise ValueError("The input array must be 4-dimensional.")
+    if filters.ndim != 4:
+        raise ValueError("The filters array must be 4-dimensional.")
+
+    window_sums = backends.get_backend(backend).window_activation_sums
+    for start in range(0, pat_graphs.shape[0], block_size):
+        if isinstance(pat_graphs, sparse.SparseGraphs):
+            yield start, sparse.window_activation_sums(pat_graphs.patient_slice(start, start + block_size), filters)
+        else:
+            yield start, window_sums(pat_graphs[start:start + block_size], filters)
+
+
+def max_activation_matrix(pat_graphs:np.ndarray, filters:np.ndarray, block_size:int=1024, backend:str=None):
+    """Calculate the maximum activation of every filter on every patient graph.
+
+    The leaky ReLU is monotonic so the maximum activation is the activation of the largest window
+    sum. Activations start from 0, so negative activations are reported as 0.
+
+    Args:
+        pat_graphs (np.ndarray, sparse.SparseGraphs or ragged.RaggedCohort): 4D array (patients, timesteps,
+            nodes, nodes) of patient graphs.
+        filters (np.ndarray): 4D array (filters, filter timesteps, nodes, nodes) of filters.
+        block_size (int): number of patients to scan at once, this bounds the memory used for the
+            window sums.
+        backend (str or backends.Backend): compute backend for dense graphs (see backends.get_backend).
+
+    Returns:
+        np.ndarray: 2D float array (patients, filters) of maximum activations.
+    """
+    if isinstance(pat_graphs, ragged.RaggedCohort):
+        if filters.ndim != 4:
+            raise ValueError("The filters array must be 4-dimensional.")
+        # the default backend scans the concatenated timesteps, other backends patients of the same length
+        selected = backends.get_backend(backend)
+        window_sums = None if selected.name == backends.DEFAULT_BACKEND else selected.window_activation_sums
+        return ragged.max_activation_matrix(pat_graphs, filters, block_size, window_sums)
+    max_acts = np.zeros((pat_graphs.shape[0], filters.shape[0]))
+    for start, sums in _iter_window_sums(pat_graphs, filters, block_size, backend):
+        max_acts[start:start + block_size] = sums.max(axis=2, initial=0.0)
+
+    return max_acts
+
+
+def iter_window_activations(pat_graphs:np.ndarray, filters:np.ndarray, block_size:int=1024, alpha:float=0.01,
+                            backend:str=None):
+    """Stream the activation of every filter on every window of every patient graph, a block of
+    patients at a time, for cohorts where the whole (patients, filters, windows) array is too big.
+
+    Args:
+        pat_graphs (np.ndarray or sparse.SparseGraphs): 4D array (patients, timesteps, nodes, nodes)
+            of patient graphs.
+        filters (np.ndarray): 4D array (filters, filter timesteps, nodes, nodes) of filters.
+        block_size (int): number of patients in each block.
+        alpha (float): leaky ReLU parameter.
+        backend (str or backends.Backend): compute backend for dense graphs (see backends.get_backend).
+
+    Yields:
+        tuple: first patient of the block and 3D float array (patients in block, filters, windows) of
+        activations, window w covers timesteps w to w + filter timesteps - 1.
+    """
+    for start, sums in _iter_window_sums(pat_graphs, filters, block_size, backend):
+        yield start, leaky_relu_array(sums, alpha, out=sums)
+
+
+def timestep_importance(window_acts:np.ndarray, filt_steps:int):
+    """Spread window activations over the timesteps: the importance of a timestep is the largest
+    activation of the windows that cover it. Like the maximum activation, it starts from 0.
+
+    Args:
+        window_acts (np.ndarray): activations with windows on the last axis, e.g. (patients, filters, windows).
+        filt_steps (int): number of timesteps in the filters.
+
+    Returns:
+        np.ndarray: array with timesteps (windows + filt_steps - 1) on the last axis.
+    """
+    num_windows = window_acts.shape[-1]
+    time_steps = num_windows + filt_steps - 1 if num_windows else 0
+    importance = np.zeros(window_acts.shape[:-1] + (time_steps,), dtype=window_acts.dtype)
+    for offset in range(filt_steps if num_windows else 0):
+        # window w covers timestep w + offset
+        covered = importance[..., offset:offset + num_windows]
+        np.maximum(covered, window_acts, out=covered)
+    return importance
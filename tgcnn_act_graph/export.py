@@ -0,0 +1,234 @@
+"""Rank the filters of a cohort once and export the ranking and the activated edges of each patient
+to Parquet or Arrow/Feather files, without drawing anything.
+
+Installed as the tgcnn-act-graph-export command, e.g.:
+
+    tgcnn-act-graph-export --graphs graphs.npy --filters filters.npy --labels labels.npy --output-dir out
+    tgcnn-act-graph-export --graphs graphs.npy --filters model.keras:conv3d --labels labels.npy --output-dir out
+    tgcnn-act-graph-export --graphs cohort.npz:graphs --filters cohort.npz:filters --labels cohort.npz:labels \\
+        --output-dir out --format feather --chunk-size 500
+
+Writing the files needs pyarrow (pip install pyarrow).
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from tgcnn_act_graph import calculations, loaders, ragged, sparse, utils
+from tgcnn_act_graph.ranking import FilterRanking
+
+FILE_FORMATS = {'parquet': '.parquet', 'feather': '.feather'}
+# files that can hold several arrays, chosen with file:name
+_KERNEL_FILES = ('.npz', '.h5', '.hdf5', '.keras')
+
+
+def load_array(path:str):
+    """Load an array from a .npy file (memory-mapped, so large cohorts aren't read in full) or from
+    a .npz file. For a .npz file with more than one array, choose the array with path:key.
+
+    Args:
+        path (str): file to read, e.g. 'graphs.npy', 'filters.npz' or 'cohort.npz:graphs'.
+
+    Raises:
+        ValueError: if the .npz file has more than one array and no key is given.
+
+    Returns:
+        np.array: the array.
+    """
+    path, key = str(path), None
+    if '.npz:' in path:
+        path, key = path.rsplit(':', 1)
+    if not path.endswith('.npz'):
+        return np.load(path, mmap_mode='r', allow_pickle=False)
+
+    with np.load(path, allow_pickle=False) as data:
+        if not key:
+            if len(data.files) != 1:
+                raise ValueError(f"{path} has arrays {data.files}, choose one with {path}:<name>.")
+            key = data.files[0]
+        return data[key]
+
+
+def _edges_chunk(chunk_numbers, tables:list):
+    """Concatenate the results.EdgeTable of each patient into a DataFrame with a patient_number column."""
+    return pd.DataFrame({
+        'patient_number': np.concatenate([np.full(len(table), n, dtype=np.int32) for n, table in zip(chunk_numbers, tables)]),
+        'start_code': np.concatenate([table.start_code for table in tables]),
+        'end_code': np.concatenate([table.end_code for table in tables]),
+        'start_visit': np.concatenate([table.start_visit for table in tables]),
+        'end_visit': np.concatenate([table.end_visit for table in tables]),
+        'activated': np.concatenate([table.activated for table in tables]),
+        'weight': np.concatenate([table.weight for table in tables]),
+        'time_between': np.concatenate([table.time_between for table in tables]),
+    })
+
+
+def edge_table_chunks(pat_graphs, patient_numbers:list, filt:np.array, chunk_size:int=1000):
+    """Compute the activated edges of each patient with one filter, a chunk of patients at a time.
+    The graphs and filter are flipped as in figures.edge_activated_graph. A chunk of dense graphs is
+    computed in one call, sparse or ragged patients one at a time.
+
+    Args:
+        pat_graphs (np.array, sparse.SparseGraphs or ragged.RaggedCohort): 4D patient graphs (can be a np.memmap).
+        patient_numbers (list): patients to compute the edges for.
+        filt (np.array): 3D filter, usually the best filter of the ranking.
+        chunk_size (int): number of patients in each chunk.
+
+    Yields:
+        pd.DataFrame: edges of the patients in the chunk with a patient_number column and the integer
+        columns of create_edges_df (start_code, end_code, start_visit, end_visit), activated, weight
+        and time_between. With no patients a single chunk with no rows is yielded, so the columns are
+        still known.
+    """
+    patient_numbers = np.asarray(patient_numbers, dtype=np.int64)
+    if patient_numbers.shape[0] == 0:
+        empty_graph = np.zeros((1, 1, 1), dtype=pat_graphs.dtype)
+        yield _edges_chunk([0], [utils.create_edges_df(empty_graph, empty_graph, as_frame=False)])
+        return
+
+    dense = not isinstance(pat_graphs, (sparse.SparseGraphs, ragged.RaggedCohort))
+    for start in range(0, patient_numbers.shape[0], chunk_size):
+        chunk_numbers = patient_numbers[start:start + chunk_size]
+        if dense:
+            graphs, flipped_filt = utils.flip_graph(np.asarray(pat_graphs[chunk_numbers]), filt)
+            act_graphs = calculations.get_act_graph_array(graphs, flipped_filt)
+            tables = [utils.create_edges_df(graph, act_graph, as_frame=False) for graph, act_graph in zip(graphs, act_graphs)]
+        else:
+            tables = []
+            for patient_number in chunk_numbers.tolist():
+                graph, flipped_filt = utils.flip_graph(utils.select_patient(pat_graphs, patient_number), filt)
+                tables.append(utils.create_edges_df(graph, calculations.get_act_graph_array(graph, flipped_filt), as_frame=False))
+        yield _edges_chunk(chunk_numbers, tables)
+
+
+def write_table_chunks(path:str, chunks, file_format:str='parquet'):
+    """Write DataFrames with the same columns to one file, one chunk at a time (a Parquet row group or
+    an Arrow record batch per chunk), so only one chunk is held in memory.
+
+    Args:
+        path (str): file to write.
+        chunks (iterable): DataFrames to write.
+        file_format (str): 'parquet' or 'feather'.
+
+    Raises:
+        ImportError: if pyarrow isn't installed.
+        ValueError: if there are no chunks, as the columns of the file wouldn't be known.
+
+    Returns:
+        int: number of rows written.
+    """
+    if file_format not in FILE_FORMATS:
+        raise ValueError(f"file_format must be one of {list(FILE_FORMATS)}.")
+    try:
+        import pyarrow as pa
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Writing Parquet or Feather files needs pyarrow, install it with pip install pyarrow.") from e
+
+    writer = None
+    num_rows = 0
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                if file_format == 'parquet':
+                    writer = pa.parquet.ParquetWriter(path, table.schema)
+                else:
+                    writer = pa.ipc.new_file(path, table.schema)
+            writer.write_table(table)
+            num_rows += table.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        raise ValueError("There must be at least one chunk to write, even with no rows, so the file has columns.")
+    return num_rows
+
+
+def export(pat_graphs:np.array, filters:np.array, labels:list, output_dir:str, class_name:str='Hip Replacement',
+           patient_numbers:list=None, file_format:str='parquet', chunk_size:int=1000, filter_ranking:FilterRanking=None,
+           n_jobs:int=1):
+    """Rank the filters once and write the ranking and the activated edges of each patient.
+
+    Args:
+        pat_graphs (np.array, sparse.SparseGraphs or ragged.RaggedCohort): 4D patient graphs (can be a np.memmap).
+        filters (np.array): 4D array of filters.
+        labels (list): binary outcome for each patient.
+        output_dir (str): folder to write ranking.<format> and edges.<format> to, made if it doesn't exist.
+        class_name (str): name to describe prediction outcome.
+        patient_numbers (list): patients to export the edges of, every patient if not given.
+        file_format (str): 'parquet' or 'feather'.
+        chunk_size (int): number of patients to compute and write at once.
+        filter_ranking (FilterRanking): precomputed ranking of the filters for these inputs, checked
+            against them before use.
+        n_jobs (int): number of processes to rank the filters with, -1 for every CPU.
+
+    Raises:
+        ValueError: if filter_ranking was calculated from different inputs.
+
+    Returns:
+        dict: paths of the ranking and edges files, the best filter and the number of edges written.
+    """
+    if file_format not in FILE_FORMATS:
+        raise ValueError(f"file_format must be one of {list(FILE_FORMATS)}.")
+    if filter_ranking is None:
+        filter_ranking = FilterRanking.compute(class_name, pat_graphs, filters, labels, n_jobs=n_jobs)
+    else:
+        # free if the ranking was already checked against these inputs, e.g. by FilterRanking.load
+        filter_ranking.check(pat_graphs, filters, labels)
+    if patient_numbers is None:
+        patient_numbers = range(pat_graphs.shape[0])
+
+    os.makedirs(output_dir, exist_ok=True)
+    extension = FILE_FORMATS[file_format]
+    ranking_path = os.path.join(output_dir, 'ranking' + extension)
+    edges_path = os.path.join(output_dir, 'edges' + extension)
+
+    write_table_chunks(ranking_path, [filter_ranking.table], file_format)
+    best_filter = filter_ranking.best_filter
+    num_edges = write_table_chunks(edges_path, edge_table_chunks(pat_graphs, patient_numbers, filters[best_filter-1], chunk_size),
+                                   file_format)
+    return {'ranking': ranking_path, 'edges': edges_path, 'best_filter': best_filter, 'num_edges': num_edges}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--graphs', required=True, help='.npy or .npz[:name] file of 4D patient graphs')
+    parser.add_argument('--filters', required=True, help='.npy, .npz, .h5 or .keras file of the filters or Conv3D kernel, '
+                                                          'with :name to choose the kernel (see loaders.load_filters)')
+    parser.add_argument('--labels', required=True, help='.npy or .npz[:name] file of the outcome for each patient')
+    parser.add_argument('--output-dir', required=True, help='folder to write the ranking and edges files to')
+    parser.add_argument('--format', choices=list(FILE_FORMATS), default='parquet')
+    parser.add_argument('--class-name', default='Hip Replacement', help='name to describe prediction outcome')
+    parser.add_argument('--patients', type=int, nargs='+', help='patients to export the edges of (default every patient)')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='patients to compute and write at once')
+    parser.add_argument('--ranking', help='FilterRanking .npz file, loaded if it exists (and checked against the inputs), '
+                                          'otherwise written after ranking the filters')
+    parser.add_argument('--n-jobs', type=int, default=1, help='processes to rank the filters with, -1 for every CPU')
+    args = parser.parse_args(argv)
+
+    filters_path, filters_name = args.filters, None
+    if args.filters.rpartition(':')[0].endswith(_KERNEL_FILES):
+        filters_path, _, filters_name = args.filters.rpartition(':')
+    pat_graphs, labels = load_array(args.graphs), load_array(args.labels)
+    filters = loaders.load_filters(filters_path, name=filters_name)
+
+    filter_ranking = None
+    if args.ranking and os.path.exists(args.ranking):
+        filter_ranking = FilterRanking.load(args.ranking, pat_graphs, filters, labels)
+    elif args.ranking:
+        filter_ranking = FilterRanking.compute(args.class_name, pat_graphs, filters, labels, n_jobs=args.n_jobs)
+        filter_ranking.save(args.ranking)
+
+    written = export(pat_graphs, filters, labels, args.output_dir, class_name=args.class_name, patient_numbers=args.patients,
+                     file_format=args.format, chunk_size=args.chunk_size, filter_ranking=filter_ranking, n_jobs=args.n_jobs)
+    print(f"Filter {written['best_filter']} had the largest difference in activation.")
+    print(f"Wrote {written['ranking']} and {written['num_edges']} edges to {written['edges']}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
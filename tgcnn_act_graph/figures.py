@@ -1,9 +1,9 @@
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection, PolyCollection
 import pandas as pd
-import networkx as nx
 import numpy as np
 
-from tgcnn_act_graph import utils, max_act_diff, calculations
+from tgcnn_act_graph import utils, max_act_diff, calculations, interactive, profiling, ranking
 
 def plot_activation_difference(filter_num_col:pd.DataFrame, diff_col:pd.DataFrame):
     """_summary_
@@ -22,7 +22,32 @@ def plot_activation_difference(filter_num_col:pd.DataFrame, diff_col:pd.DataFram
     plt.show()
 
 
-def draw_edge_activated_graph(edges_df:pd.DataFrame, pos_dict:pd.DataFrame):
+def plot_timestep_activation(importance:np.ndarray, filter_nums:list, save_path:str=None):
+    """Plot the activation of one patient graph over its timesteps, one line per filter.
+
+    Args:
+        importance (np.ndarray): 2D array (filters, timesteps) of timestep importance, from
+            timestep.TimestepActivations.timestep_importance.
+        filter_nums (list): filter number of each row.
+        save_path (str): If given save the figure to this file and close it instead of showing it.
+    """
+    fig = plt.figure(figsize=(10, 4))
+    timesteps = np.arange(importance.shape[1])
+    for filter_num, filter_importance in zip(filter_nums, importance):
+        plt.plot(timesteps, filter_importance, marker='.', linestyle='-', label=f'Filter {filter_num}')
+    plt.xlabel('Timestep')
+    plt.ylabel('Activation')
+    plt.xticks(timesteps)
+    plt.legend()
+    plt.tight_layout()
+    if save_path is None:
+        plt.show()
+    else:
+        fig.savefig(save_path)
+        plt.close(fig)
+
+
+def draw_edge_activated_graph(edges_df:pd.DataFrame, pos_dict:pd.DataFrame, save_path:str=None, show_edge_labels:bool=True):
     """Draw an individual patient graph using NetworkX highlighting which edges might 
     be most associated to the prediction.
 
@@ -30,7 +55,13 @@ def draw_edge_activated_graph(edges_df:pd.DataFrame, pos_dict:pd.DataFrame):
         edges_df (pd.DataFrame): Dataframe with information about edges including: start and end nodes, whether it's activated,
         weight, and edge_label.
         pos_dict (dictionary): dictionary with x and y coordinates for each node:(x,y)
+        save_path (str): If given save the figure to this file (format from the extension) and close it
+            instead of showing it.
+        show_edge_labels (bool): Label each edge with the time between visits.
     """
+    # Only the NetworkX renderer needs networkx, so it isn't imported with the module
+    import networkx as nx
+
     # Convert df to list of tuples for Networkx
     edges = []
     for _, row in edges_df.iterrows():
@@ -47,16 +78,105 @@ def draw_edge_activated_graph(edges_df:pd.DataFrame, pos_dict:pd.DataFrame):
     edge_labels = {(u, v): G[u][v]['edge_label'] for u, v in G.edges()}
 
     # Draw the graph
-    plt.figure(figsize=(12, 8))
+    fig = plt.figure(figsize=(12, 8))
     nx.draw(G, pos_dict, with_labels=True, node_size=3000, node_color="lightblue", edge_color=edge_colors, width=edge_widths, font_size=10, font_weight="bold", arrowsize=20)
-    nx.draw_networkx_edge_labels(G, pos_dict, edge_labels=edge_labels, font_color='blue', font_size=10, font_weight='bold')
+    if show_edge_labels:
+        nx.draw_networkx_edge_labels(G, pos_dict, edge_labels=edge_labels, font_color='blue', font_size=10, font_weight='bold')
 
     #plt.title("Graph Visualisation of Patients Pathway and Connections Associated to Hip Replacement")
-    plt.show()
+    if save_path is None:
+        plt.show()
+    else:
+        fig.savefig(save_path)
+        plt.close(fig)
+
+
+
+def _node_column_xy(node_col:pd.Series, pos_dict:dict):
+    """Look up the (x, y) position of every node in a start_node or end_node column, once per distinct node."""
+    node_codes, node_names = pd.factorize(node_col)
+    node_xy = np.array([pos_dict[name] for name in node_names], dtype=float).reshape(-1, 2)
+    return node_xy[node_codes]
 
 
+def draw_edge_activated_graph_direct(edges_df:pd.DataFrame, pos_dict:dict=None, save_path:str=None, show_edge_labels:bool=True,
+                                     ax:plt.Axes=None):
+    """Draw an individual patient graph straight from the edges DataFrame with batched matplotlib
+    collections, without building a NetworkX graph. Uses the same look as draw_edge_activated_graph:
+    red activated edges and grey edges with width from the weight, light blue nodes and blue edge labels.
 
-def edge_activated_graph(input_tensors:np.array, patient_number:int, filters:np.array, labels:list, verbose:bool=False, show_plot:bool=False):
+    Args:
+        edges_df (pd.DataFrame): Dataframe from utils.create_edges_df.
+        pos_dict (dictionary): dictionary with x and y coordinates for each node:(x,y), calculated with
+            utils.create_layout_pos_dict if not given.
+        save_path (str): If given save the figure to this file (format from the extension) and close it
+            instead of showing it.
+        show_edge_labels (bool): Label each edge with the time between visits, turn off for large graphs.
+        ax (plt.Axes): Axes to draw on, a new figure is made if not given (and then shown or saved).
+    """
+    if pos_dict is None:
+        pos_dict = utils.create_layout_pos_dict(edges_df)
+
+    start_xy = _node_column_xy(edges_df['start_node'], pos_dict)
+    end_xy = _node_column_xy(edges_df['end_node'], pos_dict)
+    node_xy = np.array(list(pos_dict.values()), dtype=float).reshape(-1, 2)
+    edge_colors = np.where(edges_df['activated'].to_numpy(dtype=bool), 'red', 'grey')
+
+    new_figure = ax is None
+    if new_figure:
+        # axes filling the whole figure, as nx.draw uses
+        fig = plt.figure(figsize=(12, 8))
+        ax = fig.add_axes((0, 0, 1, 1))
+    else:
+        fig = ax.figure
+
+    ax.add_collection(LineCollection(np.stack([start_xy, end_xy], axis=1), colors=edge_colors,
+                                     linewidths=edges_df['weight'].to_numpy(dtype=float), zorder=1))
+    ax.scatter(node_xy[:, 0], node_xy[:, 1], s=3000, c='lightblue', zorder=2)
+    ax.update_datalim(node_xy)
+    ax.autoscale_view()
+    ax.margins(0.1)
+    ax.set_axis_off()
+
+    # Edge directions on screen, used to place the arrow heads at the edge of the end node and rotate labels
+    direction = ax.transData.transform(end_xy) - ax.transData.transform(start_xy)
+    direction /= np.maximum(np.linalg.norm(direction, axis=1, keepdims=True), 1e-12)
+    normal = np.column_stack([-direction[:, 1], direction[:, 0]])
+
+    # Arrow heads in inches relative to the end node, node radius from node_size=3000 (points^2)
+    # and head size from arrowsize=20
+    node_radius, head_length, head_half_width = np.sqrt(3000) / 2 / 72, 8 / 72, 4 / 72
+    tip = -node_radius * direction
+    base = -(node_radius + head_length) * direction
+    heads = np.stack([tip, base + head_half_width * normal, base - head_half_width * normal], axis=1)
+    ax.add_collection(PolyCollection(heads, facecolors=edge_colors, edgecolors=edge_colors, offsets=end_xy,
+                                     offset_transform=ax.transData, transform=fig.dpi_scale_trans, zorder=3))
+
+    for name, (x, y) in pos_dict.items():
+        ax.text(x, y, name, fontsize=10, fontweight='bold', ha='center', va='center', zorder=4)
+
+    if show_edge_labels:
+        mid_xy = (start_xy + end_xy) / 2
+        angles = np.degrees(np.arctan2(direction[:, 1], direction[:, 0]))
+        # keep labels upright
+        angles = np.where(angles > 90, angles - 180, np.where(angles < -90, angles + 180, angles))
+        for (x, y), angle, label in zip(mid_xy, angles, edges_df['time_between'].tolist()):
+            ax.text(x, y, label, color='blue', fontsize=10, fontweight='bold', ha='center', va='center',
+                    rotation=angle, rotation_mode='anchor', zorder=3,
+                    bbox=dict(boxstyle='round', ec=(1.0, 1.0, 1.0), fc=(1.0, 1.0, 1.0)))
+
+    if new_figure:
+        if save_path is None:
+            plt.show()
+        else:
+            fig.savefig(save_path)
+            plt.close(fig)
+
+
+def edge_activated_graph(input_tensors:np.array, patient_number:int, filters:np.array, labels:list, verbose:bool=False, show_plot:bool=False,
+                         filter_ranking:ranking.FilterRanking=None, check_ranking:bool=True, save_path:str=None,
+                         renderer:str='networkx', show_edge_labels:bool=True, n_jobs:int=1,
+                         profiler:profiling.PipelineProfiler=None):
     """Draw an individual patients graph with red edges where the AI model filters have given high weights, 
     representing which edges the patterns associate to the outcome the most. 
 
@@ -67,36 +187,69 @@ def edge_activated_graph(input_tensors:np.array, patient_number:int, filters:np.
         labels (list): Binary outcome (0 or 1) for patient e.g. no replacement or hip replacement.
         verbose (bool): Print extra statements.
         show_plot (bool): Print the maximum activation per filter plot.
+        filter_ranking (ranking.FilterRanking): Precomputed ranking of the filters for these inputs, so the
+            cohort isn't scanned again for every patient.
+        check_ranking (bool): Check filter_ranking against the inputs before use. The cohort is only hashed
+            the first time the ranking is checked against the same input objects (see
+            ranking.FilterRanking.matches), so drawing many patients from the same cohort hashes it once.
+        save_path (str): Save the figure to this file instead of showing it.
+        renderer (str): 'networkx' to draw with draw_edge_activated_graph, 'direct' to draw with
+            draw_edge_activated_graph_direct, which is much faster for patients with many edges, or 'html' to
+            write an interactive view with interactive.write_graph_html to save_path.
+        show_edge_labels (bool): Label each edge with the time between visits.
+        n_jobs (int): Number of processes to rank the filters with, -1 for every CPU.
+        profiler (profiling.PipelineProfiler): Record the time, peak memory and sizes of each stage.
     """
+    if renderer not in ('networkx', 'direct', 'html'):
+        raise ValueError("renderer must be 'networkx', 'direct' or 'html'.")
+    if renderer == 'html' and save_path is None:
+        raise ValueError("The 'html' renderer needs a save_path to write the page to.")
+    if profiler is None:
+        profiler = profiling.NULL_PROFILER
 
     # 1. Select the patient graph to draw
-    patient_graph = utils.select_patient(input_tensors, patient_number)
+    with profiler.stage('select_patient', patient_number=patient_number) as stage:
+        patient_graph = utils.select_patient(input_tensors, patient_number)
+        stage.timesteps, stage.nodes = patient_graph.shape[0], patient_graph.shape[1]
 
     # 2. Get the maximum activation for each filter.
-    mean_activation_df = max_act_diff.max_act_diff_calc('Hip Replacement', input_tensors, filters, labels, verbose=verbose, show_plot=show_plot)
+    with profiler.stage('rank_filters', patient_number=patient_number, timesteps=input_tensors.shape[1], nodes=input_tensors.shape[2]):
+        if filter_ranking is None:
+            mean_activation_df = max_act_diff.max_act_diff_calc('Hip Replacement', input_tensors, filters, labels, verbose=verbose, show_plot=show_plot,
+                                                                n_jobs=n_jobs)
+        else:
+            if check_ranking:
+                filter_ranking.check(input_tensors, filters, labels)
+            mean_activation_df = filter_ranking
 
     # 3. Find the filter with the maximum activation.
         # This should have the strongest effect.
-    max_act_filt = utils.get_max_act_filt(mean_activation_df, filters)
+    with profiler.stage('get_max_act_filt', patient_number=patient_number):
+        max_act_filt = utils.get_max_act_filt(mean_activation_df, filters)
 
     # 4. Element-wise multiplication of the max activation filter by the chosen graph
-    patient_graph, max_act_filt = utils.flip_graph(patient_graph, max_act_filt)
-    act_graph = calculations.get_act_graph_array(patient_graph, max_act_filt)
+    sizes = dict(patient_number=patient_number, timesteps=patient_graph.shape[0], nodes=patient_graph.shape[1])
+    with profiler.stage('flip_graph', **sizes):
+        patient_graph, max_act_filt = utils.flip_graph(patient_graph, max_act_filt)
+    with profiler.stage('get_act_graph_array', **sizes):
+        act_graph = calculations.get_act_graph_array(patient_graph, max_act_filt)
 
     # 5. Get the edge features incl. start and end node, activation, weight, time between (edge value)
-    edges_df = utils.create_edges_df(patient_graph, act_graph)
-
-    # 6. Create a dataframe with the x coordinates for the nodes
-    pos_df = utils.create_position_df(edges_df)
-
-    # 7. Generate a list of possible y locations depending on the number of nodes per visit
-    pos_list = utils.generate_pos_sequence(pos_df['max_codes_per_visit'].max())
-
-    # 8. Add to the dataframe to y get coordinates for the nodes based on the number of nodes per timestep
-    pos_df = utils.map_y_coord_to_node(pos_df, pos_list)
-
-    # 9. Turn the x and y coordinates into a dictionary that can be read by NetworkX
-    pos_dict = utils.create_pos_dict(pos_df)
-
-    # 10. Draw the patient graph with the activated edges
-    draw_edge_activated_graph(edges_df, pos_dict)
\ No newline at end of file
+    with profiler.stage('create_edges_df', **sizes) as stage:
+        edges_df = utils.create_edges_df(patient_graph, act_graph)
+        stage.edges = len(edges_df)
+
+    # 6. Get the x (visit) and y coordinates for the nodes, y depends on the number of nodes per visit,
+    # as a dictionary that can be read by NetworkX
+    with profiler.stage('create_layout_pos_dict', patient_number=patient_number, edges=len(edges_df)) as stage:
+        pos_dict = utils.create_layout_pos_dict(edges_df)
+        stage.nodes = len(pos_dict)
+
+    # 7. Draw the patient graph with the activated edges
+    with profiler.stage('draw', patient_number=patient_number, nodes=len(pos_dict), edges=len(edges_df)):
+        if renderer == 'html':
+            interactive.write_graph_html(save_path, edges_df, pos_dict)
+        elif renderer == 'direct':
+            draw_edge_activated_graph_direct(edges_df, pos_dict, save_path=save_path, show_edge_labels=show_edge_labels)
+        else:
+            draw_edge_activated_graph(edges_df, pos_dict, save_path=save_path, show_edge_labels=show_edge_labels)
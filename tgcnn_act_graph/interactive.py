@@ -0,0 +1,270 @@
+"""Export an activated patient graph to a self-contained JSON or HTML view with level-of-detail tiers,
+so graphs with many edges open straight away and are only drawn in full when zoomed in.
+
+The edges are ordered activated first, then by weight, and split into tiers: the first tier is the
+edge_budget strongest activated edges, and each tier after it has growth times as many edges, the
+last tier being every edge. The view draws the tiers it needs for the current zoom on a canvas, so
+nothing is rasterised before it is opened and no plotting library is needed.
+"""
+import json
+
+import numpy as np
+import pandas as pd
+
+from tgcnn_act_graph import utils
+
+
+def level_of_detail(edges_df:pd.DataFrame, edge_budget:int=500, growth:float=4.0):
+    """Order the edges by importance and split them into level-of-detail tiers.
+
+    Args:
+        edges_df (pd.DataFrame): DataFrame from utils.create_edges_df.
+        edge_budget (int): number of edges in the coarsest tier, only activated edges are in it.
+        growth (float): factor the number of edges grows by from one tier to the next.
+
+    Raises:
+        ValueError: if edge_budget is less than 1 or growth isn't more than 1.
+
+    Returns:
+        tuple: 1D array of the edge rows in drawing order and 1D array of the number of edges drawn at
+        each tier (cumulative, the last is every edge).
+    """
+    if edge_budget < 1:
+        raise ValueError("edge_budget must be at least 1.")
+    if growth <= 1:
+        raise ValueError("growth must be more than 1.")
+
+    activated = edges_df['activated'].to_numpy(dtype=bool)
+    weight = edges_df['weight'].to_numpy(dtype=float)
+    # activated edges first, each group by decreasing weight
+    order = np.lexsort((-weight, ~activated))
+    num_edges, num_activated = order.shape[0], int(np.count_nonzero(activated))
+
+    tier_ends = [min(edge_budget, num_activated)]
+    size = edge_budget
+    while tier_ends[-1] < num_edges:
+        size = int(np.ceil(size * growth))
+        tier_ends.append(min(size, num_edges))
+    return order, np.array(tier_ends, dtype=np.int64)
+
+
+def graph_view(edges_df:pd.DataFrame, pos_dict:dict=None, edge_budget:int=500, growth:float=4.0):
+    """Build the JSON-serialisable view of an activated graph: node names and positions, and the edges
+    as columns in level-of-detail order.
+
+    Args:
+        edges_df (pd.DataFrame): DataFrame from utils.create_edges_df.
+        pos_dict (dictionary): dictionary with x and y coordinates for each node:(x,y), calculated with
+            utils.create_layout_pos_dict if not given.
+        edge_budget (int): number of edges in the coarsest tier.
+        growth (float): factor the number of edges grows by from one tier to the next.
+
+    Returns:
+        dict: nodes (name, x, y), edges (source and target node index, weight, activated, label) and
+        tiers (cumulative number of edges drawn at each tier).
+    """
+    if pos_dict is None:
+        pos_dict = utils.create_layout_pos_dict(edges_df)
+    order, tier_ends = level_of_detail(edges_df, edge_budget, growth)
+
+    names = list(pos_dict)
+    node_index = pd.Index(names)
+    xy = np.array([pos_dict[name] for name in names], dtype=float).reshape(-1, 2)
+    source = node_index.get_indexer(edges_df['start_node'].astype(str).to_numpy()[order])
+    target = node_index.get_indexer(edges_df['end_node'].astype(str).to_numpy()[order])
+    if np.any(source < 0) or np.any(target < 0):
+        raise ValueError("Every node of the edges must have a position in pos_dict.")
+
+    return {
+        'nodes': {'name': names, 'x': xy[:, 0].tolist(), 'y': xy[:, 1].tolist()},
+        'edges': {
+            'source': source.tolist(),
+            'target': target.tolist(),
+            'weight': np.round(edges_df['weight'].to_numpy(dtype=float)[order], 6).tolist(),
+            'activated': edges_df['activated'].to_numpy(dtype=bool)[order].astype(int).tolist(),
+            'label': edges_df['time_between'].to_numpy()[order].tolist(),
+        },
+        'tiers': tier_ends.tolist(),
+    }
+
+
+def write_graph_json(path:str, edges_df:pd.DataFrame, pos_dict:dict=None, edge_budget:int=500, growth:float=4.0):
+    """Write the graph_view of an activated graph to a JSON file.
+
+    Args:
+        path (str): file to write.
+        edges_df (pd.DataFrame): DataFrame from utils.create_edges_df.
+        pos_dict (dictionary): dictionary with x and y coordinates for each node:(x,y).
+        edge_budget (int): number of edges in the coarsest tier.
+        growth (float): factor the number of edges grows by from one tier to the next.
+
+    Returns:
+        dict: the view written.
+    """
+    view = graph_view(edges_df, pos_dict, edge_budget, growth)
+    with open(path, 'w') as f:
+        json.dump(view, f, separators=(',', ':'))
+    return view
+
+
+def write_graph_html(path:str, edges_df:pd.DataFrame, pos_dict:dict=None, edge_budget:int=500, growth:float=4.0,
+                     title:str='Activated patient graph'):
+    """Write an activated graph to a self-contained HTML page (no external scripts) that can be panned
+    by dragging and zoomed with the mouse wheel. The coarsest tier is drawn at first and finer tiers
+    are added as the view is zoomed in, with edge labels once every edge is shown.
+
+    Args:
+        path (str): file to write.
+        edges_df (pd.DataFrame): DataFrame from utils.create_edges_df.
+        pos_dict (dictionary): dictionary with x and y coordinates for each node:(x,y).
+        edge_budget (int): number of edges in the coarsest tier.
+        growth (float): factor the number of edges grows by from one tier to the next.
+        title (str): title of the page.
+
+    Returns:
+        dict: the view written.
+    """
+    view = graph_view(edges_df, pos_dict, edge_budget, growth)
+    # escape '</' so the data can't end the script element
+    data = json.dumps(view, separators=(',', ':')).replace('</', '<\\/')
+    title = title.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+    with open(path, 'w') as f:
+        f.write(_HTML_TEMPLATE.replace('{title}', title).replace('{growth}', repr(float(growth))).replace('{data}', data))
+    return view
+
+
+# Same look as figures.draw_edge_activated_graph: red activated and grey edges with width from the
+# weight, light blue nodes with bold names and blue edge labels
+_HTML_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+html, body { margin: 0; height: 100%; overflow: hidden; font-family: sans-serif; }
+canvas { display: block; cursor: grab; }
+#info { position: absolute; top: 8px; left: 8px; background: rgba(255,255,255,0.8); padding: 4px 8px; font-size: 12px; }
+</style>
+</head>
+<body>
+<div id="info"></div>
+<canvas id="graph"></canvas>
+<script>
+const view = {data};
+const growth = {growth};
+const canvas = document.getElementById('graph');
+const ctx = canvas.getContext('2d');
+const info = document.getElementById('info');
+const nodes = view.nodes, edges = view.edges, tiers = view.tiers;
+const numEdges = tiers[tiers.length - 1];
+
+// fit the nodes to the window
+// reduce rather than spreading the coordinates, which fails for very large graphs, starting from 0
+// for a graph with no nodes so the page still opens
+const start = nodes.x.length ? Infinity : 0;
+const minX = nodes.x.reduce((a, b) => Math.min(a, b), start) - 1, maxX = nodes.x.reduce((a, b) => Math.max(a, b), -start) + 1;
+const minY = nodes.y.reduce((a, b) => Math.min(a, b), start) - 1, maxY = nodes.y.reduce((a, b) => Math.max(a, b), -start) + 1;
+let baseScale, scale, offsetX, offsetY;
+
+function fit() {
+  canvas.width = window.innerWidth;
+  canvas.height = window.innerHeight;
+  baseScale = Math.min(canvas.width / (maxX - minX), canvas.height / (maxY - minY));
+  scale = baseScale;
+  offsetX = (canvas.width - (maxX - minX) * scale) / 2 - minX * scale;
+  offsetY = (canvas.height + (maxY - minY) * scale) / 2 + minY * scale;
+}
+
+function tier() {
+  // one more tier each time the view is zoomed in by the growth factor
+  const level = Math.floor(Math.log(scale / baseScale) / Math.log(growth) + 1e-9);
+  return Math.max(0, Math.min(tiers.length - 1, level));
+}
+
+function draw() {
+  const level = tier();
+  const shown = tiers[level];
+  const zoom = scale / baseScale;
+  const radius = Math.max(2, Math.min(30, 0.25 * scale));
+  ctx.clearRect(0, 0, canvas.width, canvas.height);
+
+  for (let e = shown - 1; e >= 0; e--) {
+    const s = edges.source[e], t = edges.target[e];
+    const x1 = nodes.x[s] * scale + offsetX, y1 = offsetY - nodes.y[s] * scale;
+    const x2 = nodes.x[t] * scale + offsetX, y2 = offsetY - nodes.y[t] * scale;
+    const colour = edges.activated[e] ? 'red' : 'grey';
+    ctx.strokeStyle = colour;
+    ctx.fillStyle = colour;
+    ctx.lineWidth = Math.max(0.5, edges.weight[e] * Math.min(zoom, 4));
+    ctx.beginPath();
+    ctx.moveTo(x1, y1);
+    ctx.lineTo(x2, y2);
+    ctx.stroke();
+    // arrow head at the edge of the end node
+    const angle = Math.atan2(y2 - y1, x2 - x1);
+    const tipX = x2 - radius * Math.cos(angle), tipY = y2 - radius * Math.sin(angle);
+    const head = Math.max(4, radius / 2);
+    ctx.beginPath();
+    ctx.moveTo(tipX, tipY);
+    ctx.lineTo(tipX - head * Math.cos(angle - 0.4), tipY - head * Math.sin(angle - 0.4));
+    ctx.lineTo(tipX - head * Math.cos(angle + 0.4), tipY - head * Math.sin(angle + 0.4));
+    ctx.fill();
+  }
+
+  ctx.fillStyle = 'lightblue';
+  for (let n = 0; n < nodes.name.length; n++) {
+    ctx.beginPath();
+    ctx.arc(nodes.x[n] * scale + offsetX, offsetY - nodes.y[n] * scale, radius, 0, 2 * Math.PI);
+    ctx.fill();
+  }
+  ctx.textAlign = 'center';
+  ctx.textBaseline = 'middle';
+  if (radius >= 10) {
+    ctx.fillStyle = 'black';
+    ctx.font = 'bold 10px sans-serif';
+    for (let n = 0; n < nodes.name.length; n++) {
+      ctx.fillText(nodes.name[n], nodes.x[n] * scale + offsetX, offsetY - nodes.y[n] * scale);
+    }
+  }
+  // edge labels only at full detail
+  if (shown === numEdges && radius >= 10) {
+    ctx.fillStyle = 'blue';
+    for (let e = 0; e < shown; e++) {
+      const s = edges.source[e], t = edges.target[e];
+      const x = (nodes.x[s] + nodes.x[t]) / 2 * scale + offsetX, y = offsetY - (nodes.y[s] + nodes.y[t]) / 2 * scale;
+      if (x >= 0 && x <= canvas.width && y >= 0 && y <= canvas.height) {
+        ctx.fillText(String(edges.label[e]), x, y);
+      }
+    }
+  }
+  info.textContent = `Showing ${shown} of ${numEdges} edges (tier ${level + 1} of ${tiers.length}), scroll to zoom`;
+}
+
+canvas.addEventListener('wheel', (event) => {
+  event.preventDefault();
+  const factor = Math.exp(-event.deltaY * 0.002);
+  const newScale = Math.max(baseScale * 0.5, scale * factor);
+  offsetX = event.offsetX - (event.offsetX - offsetX) * newScale / scale;
+  offsetY = event.offsetY - (event.offsetY - offsetY) * newScale / scale;
+  scale = newScale;
+  draw();
+}, { passive: false });
+
+let dragging = null;
+canvas.addEventListener('mousedown', (event) => { dragging = [event.clientX, event.clientY]; });
+window.addEventListener('mouseup', () => { dragging = null; });
+window.addEventListener('mousemove', (event) => {
+  if (!dragging) return;
+  offsetX += event.clientX - dragging[0];
+  offsetY += event.clientY - dragging[1];
+  dragging = [event.clientX, event.clientY];
+  draw();
+});
+window.addEventListener('resize', () => { fit(); draw(); });
+
+fit();
+draw();
+</script>
+</body>
+</html>
+"""
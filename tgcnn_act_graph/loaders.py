@@ -0,0 +1,153 @@
+import zipfile
+
+import numpy as np
+
+# Axes of the 3D convolution kernel as each framework saves it
+LAYOUTS = {
+    'keras': 'Tf N N in K',    # Conv3D kernel (depth, height, width, input channels, filters)
+    'torch': 'K in Tf N N',    # Conv3d weight (filters, input channels, depth, height, width)
+    'filters': 'K Tf N N',     # the 4D filters array used by the package
+}
+
+
+def kernel_to_filters(kernel:np.ndarray, layout:str='keras'):
+    """Reorder a 3D convolution kernel to the (filters, filter timesteps, nodes, nodes) layout used by
+    max_act_diff.max_act_diff_calc. The result is a view, so a memory-mapped kernel isn't read.
+
+    Args:
+        kernel (np.ndarray): kernel in the given layout.
+        layout (str): 'keras' (Tf, N, N, in, K), 'torch' (K, in, Tf, N, N) or 'filters' (K, Tf, N, N).
+
+    Raises:
+        ValueError: if the layout is unknown, the kernel has the wrong number of dimensions or more
+            than one input channel.
+
+    Returns:
+        np.ndarray: 4D array (filters, filter timesteps, nodes, nodes).
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f"layout must be one of {list(LAYOUTS)}.")
+    if layout == 'filters':
+        if kernel.ndim != 4:
+            raise ValueError("The filters array must be 4-dimensional.")
+        return kernel
+    if kernel.ndim != 5:
+        raise ValueError(f"A {layout} 3D convolution kernel must be 5-dimensional.")
+
+    channel_axis = 3 if layout == 'keras' else 1
+    if kernel.shape[channel_axis] != 1:
+        raise ValueError("The kernel must have a single input channel, as the patient graphs do.")
+    kernel = kernel[(slice(None),) * channel_axis + (0,)]
+    # keras: (Tf, N, N, K) -> (K, Tf, N, N), torch is already (K, Tf, N, N)
+    return np.moveaxis(kernel, -1, 0) if layout == 'keras' else kernel
+
+
+def _find_kernel(names_shapes:list, name:str=None):
+    """Choose the kernel from (name, shape) pairs: the one matching name, or else the only 5D array.
+
+    A name that isn't an exact match is matched as the end of the path, for both the Keras 2 layout
+    (e.g. model_weights/conv3d/conv3d/kernel:0) and the Keras 3 layout (e.g. layers/conv3d/vars/0),
+    so 'conv3d/kernel' or just the layer name 'conv3d' finds the kernel in either.
+    """
+    names = [n for n, _ in names_shapes]
+    if name is not None:
+        matches = [n for n in names if n == name]
+        if not matches:
+            layer_name = name[:-len('/kernel')] if name.endswith('/kernel') else name
+            keras2 = (f'/{layer_name}/kernel', f'/{layer_name}/kernel:0')
+            # Keras 3 saves the variables of a layer in order, the kernel first
+            keras3 = f'layers/{layer_name}/vars/0'
+            matches = [n for n in names if n.endswith(('/' + name, '/' + name + ':0') + keras2)
+                       or n == keras3 or n.endswith('/' + keras3)]
+        if len(matches) != 1:
+            raise ValueError(f"Found {len(matches)} arrays named {name!r} in {names}.")
+        return matches[0]
+
+    kernels = [n for n, shape in names_shapes if len(shape) == 5]
+    if len(kernels) != 1:
+        raise ValueError(f"Found {len(kernels)} 5D kernels {kernels}, choose one with name.")
+    return kernels[0]
+
+
+def _npz_shapes(path:str):
+    """(name, shape) of every array in a .npz file, read from the array headers without loading the arrays."""
+    names_shapes = []
+    with zipfile.ZipFile(path) as archive:
+        for member in archive.namelist():
+            with archive.open(member) as f:
+                version = np.lib.format.read_magic(f)
+                if version == (1, 0):
+                    shape = np.lib.format.read_array_header_1_0(f)[0]
+                else:
+                    shape = np.lib.format.read_array_header_2_0(f)[0]
+            names_shapes.append((member[:-len('.npy')] if member.endswith('.npy') else member, shape))
+    return names_shapes
+
+
+def _read_hdf5(source, name:str=None):
+    """Read one dataset from an HDF5 file (path or file object) with h5py. A contiguous, uncompressed
+    dataset in a file on disk is memory-mapped instead of read.
+    """
+    try:
+        import h5py
+    except ImportError as e:
+        raise ImportError("Reading HDF5 and .keras weights needs h5py, install it with pip install h5py.") from e
+
+    with h5py.File(source, 'r') as f:
+        datasets = []
+        f.visititems(lambda n, obj: datasets.append((n, obj.shape)) if isinstance(obj, h5py.Dataset) else None)
+        dataset = f[_find_kernel(datasets, name)]
+
+        offset = dataset.id.get_offset()
+        if isinstance(source, str) and offset is not None and dataset.chunks is None and dataset.compression is None:
+            return np.memmap(source, dtype=dataset.dtype, mode='r', offset=offset, shape=dataset.shape)
+        return dataset[()]
+
+
+def load_filters(path:str, name:str=None, layout:str=None):
+    """Load the 3D convolution kernel of a TG-CNN model as the 4D filters array, without importing the
+    deep learning framework. Only the kernel is read (or memory-mapped where the file allows it).
+
+    Supported files:
+        .npy: the kernel itself, memory-mapped.
+        .npz: the array called name, or the only 5D array.
+        .h5/.hdf5/.weights.h5: Keras weights or model file, the dataset called name (the layer name,
+            e.g. 'conv3d', or 'conv3d/kernel', in Keras 2 or Keras 3 layout) or the only 5D dataset.
+            Needs h5py.
+        .keras: Keras 3 model archive, read from the model.weights.h5 inside it. Needs h5py.
+
+    Args:
+        path (str): file to read.
+        name (str): name of the kernel, end of its HDF5 path or name of its Keras layer, needed if there is
+            more than one 5D array.
+        layout (str): layout of the kernel, see kernel_to_filters. Defaults to 'filters' for 4D arrays
+            and 'keras' for 5D kernels.
+
+    Raises:
+        ValueError: if the kernel can't be found or has the wrong shape.
+        ImportError: if h5py is needed and isn't installed.
+
+    Returns:
+        np.ndarray: 4D array (filters, filter timesteps, nodes, nodes).
+    """
+    path = str(path)
+    if path.endswith('.npy'):
+        kernel = np.load(path, mmap_mode='r', allow_pickle=False)
+    elif path.endswith('.npz'):
+        names_shapes = _npz_shapes(path)
+        if name is None and len(names_shapes) == 1:
+            name = names_shapes[0][0]
+        with np.load(path, allow_pickle=False) as data:
+            # only the kernel is decompressed
+            kernel = data[_find_kernel(names_shapes, name)]
+    elif path.endswith('.keras'):
+        with zipfile.ZipFile(path) as archive, archive.open('model.weights.h5') as weights:
+            kernel = _read_hdf5(weights, name)
+    elif path.endswith(('.h5', '.hdf5')):
+        kernel = _read_hdf5(path, name)
+    else:
+        raise ValueError("The filters file must be .npy, .npz, .h5, .hdf5 or .keras.")
+
+    if layout is None:
+        layout = 'filters' if kernel.ndim == 4 else 'keras'
+    return kernel_to_filters(kernel, layout)
@@ -1,67 +1,68 @@
+import os
+
 import pandas as pd
 import numpy as np
-from tgcnn_act_graph import calculations, figures
+from tgcnn_act_graph import calculations, parallel, ragged, results, sparse
 
-def create_max_act_df(class_name:str, pat_graphs:np.array, filters:np.array, labels:list, verbose:bool):
+def create_max_act_df(class_name:str, pat_graphs:np.array, filters:np.array, labels:list, verbose:bool, n_jobs:int=1,
+                      dtype=np.float32, as_frame:bool=True, backend:str=None, block_size:int=None):
     """Calculate the maximum activation from each filter on each patient graph. Running a filter over
     each patient graph and getting the max. 
-    Assumes a stride length of one.
+    Assumes a stride length of one. The whole patients x filters scan is done with
+    calculations.max_activation_matrix and the DataFrame is only built at the end, from a
+    results.MaxActivationTable holding the activations (float32 by default) and the smallest integer dtype that fits
+    the filter numbers and (integer) labels.
 
     Args:
         class_name (str): name to describe prediction outcome.
-        pat_graphs (np.array): 4D array containing x 3D patient graphs.
+        pat_graphs (np.array): 4D array containing x 3D patient graphs (or sparse.SparseGraphs or
+            ragged.RaggedCohort).
         filters (np.array): 4D array containing x filters.
         labels (list): list of binary values representing positive or negative outcomes.
         verbose (bool): print or not to print extra dataframes or print statements.
+        n_jobs (int): number of processes to scan the patients with, -1 for every CPU (see parallel.max_activation_matrix).
+        dtype (np.dtype): dtype of the maximum activations.
+        as_frame (bool): return a DataFrame, otherwise return the results.MaxActivationTable.
+        backend (str or backends.Backend): compute backend to scan dense graphs with, a name or a backend
+            with options from backends.get_backend.
+        block_size (int): number of patients to scan at once (1024 if not given), this bounds the memory
+            used for the window sums. With n_jobs it is the number of patients in each task.
 
     Raises:
         ValueError: if numpy array isn't 4D.
 
     Returns:
-        pd.DataFrame: dataframe with columns for filter number, maximum activation and chosen class_name string.
+        pd.DataFrame: dataframe with columns for filter number, maximum activation and chosen class_name string
+        (or results.MaxActivationTable with the same columns as arrays if as_frame is False).
     """
     if pat_graphs.ndim != 4:
         raise ValueError("The input array must be 4-dimensional.") # 4D to have multiple patients 3D graph representations
     if filters.ndim != 4:
         raise ValueError("The filters array must be 4-dimensional.") # 4D to have multiple 3D filters
 
-    columns = [class_name, 'Max Activation', 'Filter']
-    time_steps = pat_graphs.shape[1]
     num_pats = pat_graphs.shape[0]
     num_filters = filters.shape[0]
-    
-    # Construct empty DataFrame
-    num_rows = num_pats * num_filters
-    df_index = 0
-    df = pd.DataFrame(columns=columns, index=range(num_rows))
-
-    for filter_num in range(0, num_filters):
-        f = filters[filter_num]
-        
-        # first run every patient for one filter
-        for patient_num in range(0, num_pats):
-            df.iloc[df_index, 0] = labels[patient_num]
-            input_tensor = pat_graphs[patient_num]
-            # Run a single filter over the graph
-            max_activation_value = 0
-            # this might need to change when the stride isn't 1 - TODO add this as an action to github 
-            for i in range(0, time_steps-1): 
-                first_slice = input_tensor[i:f.shape[0]+i, :, :]
-                filter_times_slice = first_slice * f
-                window_sum = np.sum(filter_times_slice)
-                activation = calculations.leaky_relu(window_sum, 0.01) 
-                if activation > max_activation_value:
-                    max_activation_value = activation
-            df.iloc[df_index, 1] = max_activation_value
-            df.iloc[df_index, 2] = filter_num+1
-            df_index += 1
-
-            if verbose:
-                print(f"The maximum activation for patient {patient_num} and filter {filter_num} = {max_activation_value}")
-    
-    return df
-
-def max_act_diff_calc(class_name:str, pat_graphs:np.array, filters:np.array, labels:list, verbose:bool, show_plot:bool):
+
+    # (patients, filters) array of the maximum activation of each filter on each patient graph
+    if parallel.resolve_n_jobs(n_jobs) > 1:
+        max_acts = parallel.max_activation_matrix(pat_graphs, filters, n_jobs=n_jobs, block_size=block_size, backend=backend)
+    else:
+        max_acts = calculations.max_activation_matrix(pat_graphs, filters, block_size=block_size or 1024, backend=backend)
+
+    if verbose:
+        for filter_num in range(0, num_filters):
+            for patient_num in range(0, num_pats):
+                print(f"The maximum activation for patient {patient_num} and filter {filter_num} = {max_acts[patient_num, filter_num]}")
+
+    # One row per filter and patient, all patients for the first filter come first
+    table = results.MaxActivationTable.from_matrix(max_acts, labels, dtype=dtype)
+    if not as_frame:
+        return table
+
+    return table.to_pandas(class_name)
+
+def max_act_diff_calc(class_name:str, pat_graphs:np.array, filters:np.array, labels:list, verbose:bool, show_plot:bool, n_jobs:int=1,
+                      backend:str=None, block_size:int=None):
     """Calculate the max difference between the classes for each filter and return in a dataframe.
 
     Args:
@@ -71,16 +72,37 @@ def max_act_diff_calc(class_name:str, pat_graphs:np.array, filters:np.array, lab
         labels (list): list of binary values representing positive or negative outcomes.
         verbose (bool): print or not to print extra dataframes or print statements.
         show_plot (bool): display graph of max filter activations. 
+        n_jobs (int): number of processes to scan the patients with, -1 for every CPU.
+        backend (str or backends.Backend): compute backend to scan dense graphs with (see create_max_act_df).
+        block_size (int): number of patients to scan at once (see create_max_act_df).
 
     Returns:
         pd.DataFrame: difference between graph activation in both classes.
     """
 
-    max_act_per_filt_df = create_max_act_df(class_name, pat_graphs, filters, labels, verbose)
+    # The class means are differences of large sums, keep full precision for the ranking
+    max_act_per_filt_df = create_max_act_df(class_name, pat_graphs, filters, labels, verbose, n_jobs=n_jobs, dtype=np.float64,
+                                            backend=backend, block_size=block_size)
     mean_activation = max_act_per_filt_df.groupby(['Filter', class_name])['Max Activation'].mean()
     mean_activation_df = mean_activation.to_frame()
     mean_activation_df.reset_index(inplace=True)
 
+    return class_mean_difference(mean_activation_df, class_name, verbose, show_plot)
+
+
+def class_mean_difference(mean_activation_df:pd.DataFrame, class_name:str, verbose:bool, show_plot:bool):
+    """Calculate the difference between the classes from the mean maximum activation of each filter in each class.
+
+    Args:
+        mean_activation_df (pd.DataFrame): dataframe with columns Filter, class_name and Max Activation (the mean
+        maximum activation), sorted by Filter then class_name.
+        class_name (str): name to describe prediction outcome.
+        verbose (bool): print or not to print extra dataframes or print statements.
+        show_plot (bool): display graph of max filter activations. 
+
+    Returns:
+        pd.DataFrame: difference between graph activation in both classes.
+    """
     # Calculate the difference between the two class type rows for each Filter
     mean_activation_df['Difference'] = mean_activation_df.groupby('Filter')['Max Activation'].diff()
     mean_activation_df['Difference'] = mean_activation_df['Difference'].abs()
@@ -93,7 +115,116 @@ def max_act_diff_calc(class_name:str, pat_graphs:np.array, filters:np.array, lab
     if verbose:
         print(mean_activation_df)
     if show_plot:
+        # figures imports utils (and so this module) as well as matplotlib, only import it when
+        # plotting so the ranking can be computed without the plotting dependencies
+        from tgcnn_act_graph import figures
         figures.plot_activation_difference(mean_activation_df['Filter'], mean_activation_df['Difference'])
 
     return mean_activation_df
 
+
+
+def class_activation_sums(max_acts:np.ndarray, labels, classes:np.ndarray):
+    """Sum the maximum activations of each filter over the patients in each class.
+
+    Args:
+        max_acts (np.ndarray): 2D array (patients, filters) of maximum activations.
+        labels (list): class of each patient.
+        classes (np.ndarray): classes to sum over, patients in other classes are ignored.
+
+    Returns:
+        tuple: 2D array (classes, filters) of sums and 1D array (classes) of patient counts.
+    """
+    labels = np.asarray(labels)
+    sums = np.zeros((len(classes), max_acts.shape[1]))
+    counts = np.zeros(len(classes), dtype=np.int64)
+    for c, label in enumerate(classes):
+        in_class = labels == label
+        sums[c] = max_acts[in_class].sum(axis=0)
+        counts[c] = np.count_nonzero(in_class)
+    return sums, counts
+
+
+def class_sums_to_mean_df(class_name:str, classes:np.ndarray, sums:np.ndarray, counts:np.ndarray):
+    """Turn per class sums and counts of the maximum activations into the mean activation dataframe
+    used by class_mean_difference. Classes with no patients are left out, as they are by groupby.
+
+    Args:
+        class_name (str): name to describe prediction outcome.
+        classes (np.ndarray): sorted classes.
+        sums (np.ndarray): 2D array (classes, filters) of summed maximum activations.
+        counts (np.ndarray): 1D array (classes) of patient counts.
+
+    Returns:
+        pd.DataFrame: dataframe with columns Filter, class_name and Max Activation, sorted by Filter then class_name.
+    """
+    classes = np.asarray(classes)
+    present = counts > 0
+    means = sums[present] / counts[present, None]
+    num_filters = sums.shape[1]
+    num_classes = int(np.count_nonzero(present))
+
+    return pd.DataFrame({'Filter': np.repeat(np.arange(1, num_filters+1), num_classes),
+                         class_name: np.tile(classes[present], num_filters),
+                         'Max Activation': means.T.ravel()})
+
+
+def _iter_cohort_chunks(pat_graphs, labels, chunk_size:int):
+    """Yield (graphs, labels) chunks of a cohort given as an array, a .npy file path or an iterator
+    of 4D chunks (with labels in the same order as the patients in the chunks).
+    """
+    if isinstance(pat_graphs, (str, os.PathLike)):
+        pat_graphs = np.load(pat_graphs, mmap_mode='r')
+
+    labels = np.asarray(labels)
+    if hasattr(pat_graphs, 'ndim'):
+        for start in range(0, pat_graphs.shape[0], chunk_size):
+            if isinstance(pat_graphs, (sparse.SparseGraphs, ragged.RaggedCohort)):
+                chunk = pat_graphs.patient_slice(start, start + chunk_size)
+            else:
+                chunk = pat_graphs[start:start + chunk_size]
+            yield chunk, labels[start:start + chunk.shape[0]]
+        return
+
+    start = 0
+    for chunk in pat_graphs:
+        yield chunk, labels[start:start + chunk.shape[0]]
+        start += chunk.shape[0]
+    if start != labels.shape[0]:
+        raise ValueError("There must be one label for every patient.")
+
+
+def max_act_diff_calc_chunked(class_name:str, pat_graphs, filters:np.array, labels:list, chunk_size:int=1024,
+                              verbose:bool=False, show_plot:bool=False):
+    """Out-of-core version of max_act_diff_calc. The patients are read in chunks and only the running
+    sum and count of the maximum activation per filter and class is kept, so peak memory depends on
+    the chunk size rather than the number of patients.
+
+    Args:
+        class_name (str): name to describe prediction outcome.
+        pat_graphs (np.array, str or iterable): 4D array (which can be a np.memmap, sparse.SparseGraphs or
+            ragged.RaggedCohort), path to a .npy file which is opened with mmap_mode='r', or an iterable of
+            4D chunks of patients.
+        filters (np.array): 4D array containing x filters.
+        labels (list): list of binary values representing positive or negative outcomes, in patient order.
+        chunk_size (int): number of patients to read at once (ignored for an iterable of chunks).
+        verbose (bool): print or not to print extra dataframes or print statements.
+        show_plot (bool): display graph of max filter activations. 
+
+    Returns:
+        pd.DataFrame: difference between graph activation in both classes.
+    """
+    if filters.ndim != 4:
+        raise ValueError("The filters array must be 4-dimensional.")
+
+    classes = np.unique(np.asarray(labels))
+    sums = np.zeros((len(classes), filters.shape[0]))
+    counts = np.zeros(len(classes), dtype=np.int64)
+    for chunk, chunk_labels in _iter_cohort_chunks(pat_graphs, labels, chunk_size):
+        max_acts = calculations.max_activation_matrix(chunk, filters, block_size=chunk_size)
+        chunk_sums, chunk_counts = class_activation_sums(max_acts, chunk_labels, classes)
+        sums += chunk_sums
+        counts += chunk_counts
+
+    mean_activation_df = class_sums_to_mean_df(class_name, classes, sums, counts)
+    return class_mean_difference(mean_activation_df, class_name, verbose, show_plot)
@@ -0,0 +1,122 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from tgcnn_act_graph import backends, calculations, ragged, sparse
+
+# Shared arrays attached by each worker process in _init_worker
+_worker_arrays = {}
+
+
+def _share(array:np.ndarray, segments:list):
+    """Copy an array into a new shared memory segment.
+
+    Returns:
+        tuple: (segment name, shape, dtype string) to attach to the array from another process.
+    """
+    array = np.ascontiguousarray(array)
+    segment = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    segments.append(segment)
+    np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)[...] = array
+    return segment.name, array.shape, array.dtype.str
+
+
+def _attach(spec:tuple):
+    """Attach to a shared array made by _share, keeping the segment open for the life of the worker."""
+    name, shape, dtype = spec
+    segment = shared_memory.SharedMemory(name=name)
+    _worker_arrays.setdefault('segments', []).append(segment)
+    return np.ndarray(shape, dtype=dtype, buffer=segment.buf)
+
+
+def _init_worker(graph_specs:dict, filters_spec:tuple, out_spec:tuple, backend:str=None, backend_options:dict=None):
+    """Attach the worker to the shared patient graphs, filters and output array."""
+    backend = backends.get_backend(backend, **(backend_options or {}))
+    if 'values' in graph_specs:
+        graphs = sparse.SparseGraphs(_attach(graph_specs['coords']), _attach(graph_specs['values']), graph_specs['shape'])
+    elif 'offsets' in graph_specs:
+        graphs = ragged.RaggedCohort(_attach(graph_specs['timesteps']), _attach(graph_specs['offsets']))
+    else:
+        graphs = _attach(graph_specs['dense'])
+    _worker_arrays.update(graphs=graphs, filters=_attach(filters_spec), out=_attach(out_spec), backend=backend)
+
+
+def _scan_block(start:int, stop:int):
+    """Write the maximum activations for patients start to stop into the shared output array."""
+    graphs = _worker_arrays['graphs']
+    if isinstance(graphs, (sparse.SparseGraphs, ragged.RaggedCohort)):
+        block = graphs.patient_slice(start, stop)
+    else:
+        block = graphs[start:stop]
+    _worker_arrays['out'][start:stop] = calculations.max_activation_matrix(block, _worker_arrays['filters'],
+                                                                              backend=_worker_arrays['backend'])
+
+
+def resolve_n_jobs(n_jobs:int):
+    """Turn an n_jobs argument into a number of processes, None means 1 and negative numbers count back
+    from the number of CPUs (-1 is every CPU).
+    """
+    if n_jobs is None:
+        return 1
+    if n_jobs < 0:
+        return max((os.cpu_count() or 1) + 1 + n_jobs, 1)
+    return max(n_jobs, 1)
+
+
+def max_activation_matrix(pat_graphs, filters:np.ndarray, n_jobs:int=-1, block_size:int=None, backend:str=None):
+    """Parallel version of calculations.max_activation_matrix. The patient graphs, filters and output are
+    put in shared memory once and the workers scan blocks of patients, so the cohort is never pickled per
+    task. Each patient is scanned the same way as in the serial version, so the output is identical.
+
+    Args:
+        pat_graphs (np.ndarray, sparse.SparseGraphs or ragged.RaggedCohort): 4D patient graphs.
+        filters (np.ndarray): 4D array (filters, filter timesteps, nodes, nodes) of filters.
+        n_jobs (int): number of worker processes, -1 for every CPU.
+        block_size (int): patients per task, defaults to splitting the cohort into four tasks per
+            worker (at most 1024 patients each).
+        backend (str or backends.Backend): compute backend each worker scans dense graphs with (see backends.get_backend).
+
+    Returns:
+        np.ndarray: 2D float array (patients, filters) of maximum activations.
+    """
+    if pat_graphs.ndim != 4:
+        raise ValueError("The input array must be 4-dimensional.")
+    if filters.ndim != 4:
+        raise ValueError("The filters array must be 4-dimensional.")
+
+    n_jobs = resolve_n_jobs(n_jobs)
+    num_pats = pat_graphs.shape[0]
+    if n_jobs == 1 or num_pats == 0:
+        return calculations.max_activation_matrix(pat_graphs, filters, block_size=block_size or 1024, backend=backend)
+    if block_size is None:
+        block_size = min(max(-(-num_pats // (n_jobs * 4)), 1), 1024)
+    # the workers load the backend themselves, from its name and options
+    backend_options = None
+    if isinstance(backend, backends.Backend):
+        backend, backend_options = backend.name, backend.options
+
+    segments = []
+    try:
+        if isinstance(pat_graphs, sparse.SparseGraphs):
+            graph_specs = {'coords': _share(pat_graphs.coords, segments), 'values': _share(pat_graphs.values, segments),
+                           'shape': pat_graphs.shape}
+        elif isinstance(pat_graphs, ragged.RaggedCohort):
+            graph_specs = {'timesteps': _share(pat_graphs.timesteps, segments), 'offsets': _share(pat_graphs.offsets, segments)}
+        else:
+            graph_specs = {'dense': _share(pat_graphs, segments)}
+        filters_spec = _share(filters, segments)
+        out_spec = _share(np.zeros((num_pats, filters.shape[0])), segments)
+
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker,
+                                 initargs=(graph_specs, filters_spec, out_spec, backend, backend_options)) as pool:
+            futures = [pool.submit(_scan_block, start, start + block_size) for start in range(0, num_pats, block_size)]
+            for future in futures:
+                future.result()
+
+        return np.ndarray(out_spec[1], dtype=out_spec[2], buffer=segments[-1].buf).copy()
+    finally:
+        for segment in segments:
+            segment.close()
+            segment.unlink()
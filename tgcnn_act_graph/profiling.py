@@ -0,0 +1,112 @@
+import time
+import tracemalloc
+from dataclasses import dataclass, asdict, fields
+
+import pandas as pd
+
+
+@dataclass
+class StageRecord:
+    """Measurements for one stage of the pipeline. Sizes that don't apply to a stage are None.
+
+    Args:
+        name (str): name of the stage.
+        patient_number (int): patient the stage was run for.
+        seconds (float): wall time of the stage.
+        peak_bytes (int): peak memory traced by tracemalloc above the memory in use when the stage
+            started, None if memory isn't traced.
+        timesteps (int): number of timesteps in the patient graph.
+        nodes (int): number of nodes (codes in the patient graph, or nodes in the layout).
+        edges (int): number of edges.
+    """
+    name: str
+    patient_number: int = None
+    seconds: float = None
+    peak_bytes: int = None
+    timesteps: int = None
+    nodes: int = None
+    edges: int = None
+
+
+class _Stage:
+    """Context manager timing one stage and adding its StageRecord to the profiler."""
+
+    def __init__(self, profiler, record:StageRecord):
+        self.profiler = profiler
+        self.record = record
+
+    def __enter__(self):
+        if self.profiler.trace_memory:
+            # Only trace for the length of the stage unless tracemalloc was already running
+            self._started_tracing = not tracemalloc.is_tracing()
+            if self._started_tracing:
+                tracemalloc.start()
+            elif hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            self._start_memory = tracemalloc.get_traced_memory()[0]
+        self._start = time.perf_counter()
+        return self.record
+
+    def __exit__(self, *exc):
+        self.record.seconds = time.perf_counter() - self._start
+        if self.profiler.trace_memory:
+            self.record.peak_bytes = max(tracemalloc.get_traced_memory()[1] - self._start_memory, 0)
+            if self._started_tracing:
+                tracemalloc.stop()
+        self.profiler.records.append(self.record)
+        return False
+
+
+class PipelineProfiler:
+    """Opt-in record of the wall time, peak memory and input sizes of each pipeline stage. Pass one to
+    figures.edge_activated_graph (it can be reused across patients) and read the records afterwards.
+
+    Args:
+        trace_memory (bool): measure peak memory with tracemalloc, which slows the pipeline down.
+    """
+
+    def __init__(self, trace_memory:bool=True):
+        self.trace_memory = trace_memory
+        self.records = []
+
+    def stage(self, name:str, **sizes):
+        """Measure a stage, the sizes can be given here or set on the record inside the with block.
+
+        Args:
+            name (str): name of the stage.
+            **sizes: StageRecord fields, e.g. patient_number, timesteps, nodes and edges.
+
+        Returns:
+            context manager: yields the StageRecord for the stage.
+        """
+        return _Stage(self, StageRecord(name, **sizes))
+
+    def to_dataframe(self):
+        """Get the records as a DataFrame, one row per stage run.
+
+        Returns:
+            pd.DataFrame: with one column per StageRecord field.
+        """
+        return pd.DataFrame([asdict(record) for record in self.records], columns=[f.name for f in fields(StageRecord)])
+
+
+class _NullStage:
+    """Stage that measures nothing, shared by every stage when profiling is off."""
+    _record = StageRecord('')
+
+    def __enter__(self):
+        return self._record
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _NullProfiler:
+    """Profiler used when profiling is off, so the pipeline doesn't need to check for None."""
+    _stage = _NullStage()
+
+    def stage(self, name:str, **sizes):
+        return self._stage
+
+
+NULL_PROFILER = _NullProfiler()
@@ -0,0 +1,255 @@
+import numpy as np
+
+
+class RaggedCohort:
+    """Cohort of patient graphs with a different number of timesteps for each patient, stored as the
+    timesteps of every patient one after the other and the offset of each patient's first timestep.
+    Patients with short histories aren't padded to the longest one, and each patient is a view of
+    the concatenated timesteps, so selecting a patient doesn't copy it.
+
+    Windows are only scanned over each patient's own timesteps (see window_activation_sums), as if
+    each patient were a separate 4D array, and patients with fewer timesteps than the filters have a
+    maximum activation of 0.
+
+    Args:
+        timesteps (np.ndarray): 3D array (total timesteps, nodes, nodes) of the timesteps of every patient.
+        offsets (np.ndarray): 1D int array (patients + 1) of where each patient starts in timesteps,
+            starting at 0 and ending at the number of timesteps.
+    """
+
+    def __init__(self, timesteps:np.ndarray, offsets:np.ndarray):
+        self.timesteps = timesteps
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        if timesteps.ndim != 3:
+            raise ValueError("The timesteps array must be 3-dimensional.")
+        if self.offsets.ndim != 1 or self.offsets.shape[0] == 0 or self.offsets[0] != 0 \
+                or self.offsets[-1] != timesteps.shape[0] or np.any(np.diff(self.offsets) < 0):
+            raise ValueError("The offsets must increase from 0 to the number of timesteps.")
+
+    @classmethod
+    def from_graphs(cls, graphs:list):
+        """Build from a 3D (timesteps, nodes, nodes) graph for each patient.
+
+        Args:
+            graphs (list): patient graphs, with any number of timesteps and the same number of nodes.
+
+        Returns:
+            RaggedCohort: the patients with their timesteps concatenated.
+        """
+        graphs = [np.asarray(graph) for graph in graphs]
+        if not graphs:
+            raise ValueError("There must be at least one patient graph.")
+        offsets = np.concatenate([[0], np.cumsum([graph.shape[0] for graph in graphs])])
+        return cls(np.concatenate(graphs), offsets)
+
+    @classmethod
+    def from_padded(cls, pat_graphs:np.ndarray, lengths=None, padding:str='end'):
+        """Build from a 4D array of patient graphs padded with empty timesteps.
+
+        Args:
+            pat_graphs (np.ndarray): 4D array (patients, timesteps, nodes, nodes) of patient graphs.
+            lengths (array-like): number of real timesteps of each patient. If not given, a patient's
+                history ends at its last timestep with an event ('end' padding) or starts at its first
+                ('start' padding).
+            padding (str): 'end' if the padding is after each patient's timesteps, 'start' if before.
+
+        Returns:
+            RaggedCohort: the patients without their padding.
+        """
+        if pat_graphs.ndim != 4:
+            raise ValueError("The input array must be 4-dimensional.")
+        if padding not in ('end', 'start'):
+            raise ValueError("padding must be 'end' or 'start'.")
+
+        num_pats, time_steps = pat_graphs.shape[:2]
+        if lengths is None:
+            # (patients, timesteps) whether each timestep has an event, a patient at a time
+            has_event = np.array([np.any(graph.reshape(time_steps, -1) != 0, axis=1) for graph in pat_graphs])
+            has_event = has_event.reshape(num_pats, time_steps)
+            if padding == 'end':
+                # up to the last timestep with an event
+                has_event = has_event[:, ::-1]
+            lengths = np.where(has_event.any(axis=1), time_steps - np.argmax(has_event, axis=1), 0)
+        lengths = np.asarray(lengths, dtype=np.int64)
+        if lengths.shape != (num_pats,) or np.any(lengths < 0) or np.any(lengths > time_steps):
+            raise ValueError("There must be a length between 0 and the number of timesteps for every patient.")
+
+        if padding == 'end':
+            return cls.from_graphs([graph[:length] for graph, length in zip(pat_graphs, lengths)])
+        return cls.from_graphs([graph[time_steps - length:] for graph, length in zip(pat_graphs, lengths)])
+
+    @property
+    def lengths(self):
+        """np.ndarray: number of timesteps of each patient."""
+        return np.diff(self.offsets)
+
+    @property
+    def shape(self):
+        """tuple: shape of the cohort padded to the longest patient, (patients, timesteps, nodes, nodes)."""
+        return (len(self), int(self.lengths.max(initial=0))) + self.timesteps.shape[1:]
+
+    @property
+    def ndim(self):
+        return 4
+
+    @property
+    def dtype(self):
+        return self.timesteps.dtype
+
+    @property
+    def nbytes(self):
+        """int: memory used by the timesteps and offsets."""
+        return self.timesteps.nbytes + self.offsets.nbytes
+
+    def __len__(self):
+        return self.offsets.shape[0] - 1
+
+    def __getitem__(self, num:int):
+        """Select a single patient as a 3D view of its timesteps."""
+        if not isinstance(num, (int, np.integer)):
+            raise TypeError("RaggedCohort can only be indexed with a single integer.")
+        if num < 0:
+            num += len(self)
+        if not 0 <= num < len(self):
+            raise IndexError(f"Index {num} is out of bounds for axis 0 with size {len(self)}")
+        return self.timesteps[self.offsets[num]:self.offsets[num + 1]]
+
+    def patient_slice(self, start:int, stop:int):
+        """Select a block of patients without copying their timesteps.
+
+        Args:
+            start (int): first patient in the block.
+            stop (int): patient after the last patient in the block.
+
+        Returns:
+            RaggedCohort: patients start to stop.
+        """
+        start, stop = min(start, len(self)), min(stop, len(self))
+        offsets = self.offsets[start:max(stop, start) + 1]
+        return RaggedCohort(self.timesteps[offsets[0]:offsets[-1]], offsets - offsets[0])
+
+    def take(self, patients):
+        """Select patients in the given order, like array[patients]. The timesteps are copied.
+
+        Args:
+            patients (array-like): patient numbers to select.
+
+        Returns:
+            RaggedCohort: the selected patients.
+        """
+        patients = np.asarray(patients, dtype=np.int64)
+        starts, lengths = self.offsets[patients], self.lengths[patients]
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        # position of every timestep of the selected patients, patient by patient
+        rows = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return RaggedCohort(self.timesteps[rows], offsets)
+
+    def to_padded(self, time_steps:int=None, padding:str='end'):
+        """Materialise the 4D array with every patient padded with empty timesteps.
+
+        Args:
+            time_steps (int): number of timesteps to pad to, the longest patient if not given.
+            padding (str): 'end' to pad after each patient's timesteps, 'start' to pad before.
+
+        Returns:
+            np.ndarray: 4D array (patients, timesteps, nodes, nodes).
+        """
+        if padding not in ('end', 'start'):
+            raise ValueError("padding must be 'end' or 'start'.")
+        shape = self.shape
+        if time_steps is None:
+            time_steps = shape[1]
+        if time_steps < shape[1]:
+            raise ValueError(f"time_steps must be at least the longest patient ({shape[1]}).")
+
+        padded = np.zeros((shape[0], time_steps) + shape[2:], dtype=self.dtype)
+        for p, length in enumerate(self.lengths.tolist()):
+            if padding == 'end':
+                padded[p, :length] = self[p]
+            else:
+                padded[p, time_steps - length:] = self[p]
+        return padded
+
+
+def window_offsets(lengths:np.ndarray, filt_steps:int):
+    """Number of full windows of each patient as offsets, patients shorter than the filter have none.
+
+    Args:
+        lengths (np.ndarray): number of timesteps of each patient.
+        filt_steps (int): number of timesteps of the filters.
+
+    Returns:
+        np.ndarray: 1D int array (patients + 1) of where each patient's windows start.
+    """
+    return np.concatenate([[0], np.cumsum(np.maximum(lengths - filt_steps + 1, 0))])
+
+
+def window_activation_sums(pat_graphs:RaggedCohort, filters:np.ndarray):
+    """Ragged version of calculations.window_activation_sums. The windows at every start of the
+    concatenated timesteps are scanned with filters.shape[1] matrix multiplications of contiguous slices
+    (so the timesteps aren't copied), and only the windows that are inside a single patient are kept,
+    so padding is never scanned.
+
+    Args:
+        pat_graphs (RaggedCohort): patient graphs.
+        filters (np.ndarray): 4D array (filters, filter timesteps, nodes, nodes) of filters.
+
+    Returns:
+        tuple: 2D float array (windows, filters) of window sums, patient by patient, and the
+        window_offsets of each patient in it.
+    """
+    if filters.ndim != 4:
+        raise ValueError("The filters array must be 4-dimensional.")
+
+    num_filters, filt_steps = filters.shape[:2]
+    offsets = window_offsets(pat_graphs.lengths, filt_steps)
+    # start timestep of every window inside a patient
+    starts = np.repeat(pat_graphs.offsets[:-1] - offsets[:-1], np.diff(offsets)) + np.arange(offsets[-1])
+
+    graphs_flat = pat_graphs.timesteps.reshape(pat_graphs.timesteps.shape[0], -1)
+    filts_flat = filters.reshape(num_filters, filt_steps, -1).astype(np.float64)
+    # (window starts, filters) sums of the windows starting at every timestep, including the windows
+    # across two patients, which are dropped afterwards
+    num_starts = max(graphs_flat.shape[0] - filt_steps + 1, 0)
+    all_sums = np.zeros((num_starts, num_filters))
+    for offset in range(filt_steps):
+        # (window starts, nodes*nodes) @ (nodes*nodes, filters)
+        all_sums += graphs_flat[offset:offset + num_starts] @ filts_flat[:, offset].T
+    return all_sums[starts], offsets
+
+
+def max_activation_matrix(pat_graphs:RaggedCohort, filters:np.ndarray, block_size:int=1024, window_sums=None):
+    """Ragged version of calculations.max_activation_matrix.
+
+    Args:
+        pat_graphs (RaggedCohort): patient graphs.
+        filters (np.ndarray): 4D array (filters, filter timesteps, nodes, nodes) of filters.
+        block_size (int): number of patients to scan at once, this bounds the memory used for the
+            window sums.
+        window_sums (callable): window sum kernel of a compute backend (see backends.Backend). If given,
+            the patients with the same number of timesteps are stacked into 4D blocks and scanned with
+            it, otherwise the concatenated timesteps are scanned with window_activation_sums.
+
+    Returns:
+        np.ndarray: 2D float array (patients, filters) of maximum activations.
+    """
+    max_acts = np.zeros((len(pat_graphs), filters.shape[0]))
+    if window_sums is not None:
+        lengths = pat_graphs.lengths
+        for length in np.unique(lengths[lengths >= filters.shape[1]]).tolist():
+            patients = np.flatnonzero(lengths == length)
+            for start in range(0, patients.shape[0], block_size):
+                block = patients[start:start + block_size]
+                # (patients, timesteps, nodes, nodes) copy of the patients in the block
+                graphs = pat_graphs.timesteps[pat_graphs.offsets[block, None] + np.arange(length)]
+                max_acts[block] = window_sums(graphs, filters).max(axis=2, initial=0.0)
+        return max_acts
+
+    for start in range(0, len(pat_graphs), block_size):
+        sums, offsets = window_activation_sums(pat_graphs.patient_slice(start, start + block_size), filters)
+        has_windows = np.flatnonzero(np.diff(offsets) > 0)
+        if has_windows.shape[0]:
+            # the windows of each patient are contiguous, so the maximum is one reduceat
+            max_acts[start + has_windows] = np.maximum.reduceat(sums, offsets[has_windows], axis=0)
+    # activations start from 0, as in calculations.max_activation_matrix
+    return np.maximum(max_acts, 0)
@@ -0,0 +1,323 @@
+import hashlib
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from tgcnn_act_graph import calculations, max_act_diff, parallel, ragged, sparse
+
+
+def _update_hash(hasher, array):
+    """Add the shape, dtype and contents of an array (or SparseGraphs or RaggedCohort) to the hash.
+
+    Args:
+        hasher (hashlib._Hash): hash to update.
+        array (np.array or sparse.SparseGraphs or ragged.RaggedCohort or list): data to add.
+    """
+    if isinstance(array, sparse.SparseGraphs):
+        hasher.update(f'sparse{array.shape}'.encode())
+        _update_hash(hasher, array.coords)
+        _update_hash(hasher, array.values)
+        return
+    if isinstance(array, ragged.RaggedCohort):
+        hasher.update(b'ragged')
+        _update_hash(hasher, array.offsets)
+        _update_hash(hasher, array.timesteps)
+        return
+
+    array = np.asarray(array)
+    hasher.update(f'{array.shape}{array.dtype.str}'.encode())
+    if array.ndim <= 1:
+        hasher.update(np.ascontiguousarray(array).tobytes())
+        return
+    # Hash one item of the first axis at a time so large (or memory-mapped) cohorts are
+    # never copied in full.
+    for item in array:
+        hasher.update(np.ascontiguousarray(item).tobytes())
+
+
+def _normalise_labels(labels:list):
+    """Labels as int64 if they are whole numbers (bool, any integer dtype or whole floats), so the same
+    labels hash the same whether they are a list, a bool array or e.g. an int32 or float .npy file.
+    """
+    labels = np.asarray(labels)
+    if labels.dtype == bool or np.issubdtype(labels.dtype, np.integer):
+        return labels.astype(np.int64)
+    if np.issubdtype(labels.dtype, np.floating) and np.all(np.isfinite(labels)) and np.all(labels == np.round(labels)):
+        return labels.astype(np.int64)
+    return labels
+
+
+def content_hash(pat_graphs, filters:np.array, labels:list):
+    """Hash of the filters, patient graphs and labels used to rank the filters. Labels that are whole
+    numbers are hashed as int64, so their type doesn't change the hash.
+
+    Args:
+        pat_graphs (np.array, sparse.SparseGraphs or ragged.RaggedCohort): 4D patient graphs.
+        filters (np.array): 4D array of filters.
+        labels (list): binary outcome for each patient.
+
+    Returns:
+        str: hex digest identifying the inputs.
+    """
+    hasher = hashlib.sha256()
+    for array in (filters, pat_graphs, _normalise_labels(labels)):
+        _update_hash(hasher, array)
+    return hasher.hexdigest()
+
+
+class FilterRanking:
+    """Difference in mean maximum activation between the classes for every filter, computed once
+    for a cohort and reused for every patient drawn from it.
+
+    Args:
+        class_name (str): name to describe prediction outcome.
+        difference_df (pd.DataFrame): output of max_act_diff.max_act_diff_calc with columns
+            Filter and Difference.
+        key (str): content_hash of the inputs the ranking was calculated from.
+    """
+
+    def __init__(self, class_name:str, difference_df:pd.DataFrame, key:str):
+        self.class_name = class_name
+        self.table = difference_df.reset_index(drop=True)
+        self.key = key
+        # weak references to the patient graphs and filters that last matched the key and a copy of
+        # their labels, so checking the same inputs again doesn't hash the whole cohort again
+        self._checked = None
+
+    @classmethod
+    def compute(cls, class_name:str, pat_graphs, filters:np.array, labels:list, verbose:bool=False, show_plot:bool=False,
+                n_jobs:int=1, backend:str=None, block_size:int=None):
+        """Rank the filters for a cohort.
+
+        Args:
+            class_name (str): name to describe prediction outcome.
+            pat_graphs (np.array, sparse.SparseGraphs or ragged.RaggedCohort): 4D patient graphs.
+            filters (np.array): 4D array of filters.
+            labels (list): binary outcome for each patient.
+            verbose (bool): print or not to print extra dataframes or print statements.
+            show_plot (bool): display graph of max filter activations.
+            n_jobs (int): number of processes to scan the patients with, -1 for every CPU.
+            backend (str or backends.Backend): compute backend to scan dense graphs with (see
+                max_act_diff.create_max_act_df).
+            block_size (int): number of patients to scan at once (see max_act_diff.create_max_act_df).
+
+        Returns:
+            FilterRanking: ranking of the filters for the cohort.
+        """
+        difference_df = max_act_diff.max_act_diff_calc(class_name, pat_graphs, filters, labels, verbose=verbose, show_plot=show_plot,
+                                                       n_jobs=n_jobs, backend=backend, block_size=block_size)
+        ranking = cls(class_name, difference_df, content_hash(pat_graphs, filters, labels))
+        ranking._remember(pat_graphs, filters, labels)
+        return ranking
+
+    @property
+    def best_filter(self):
+        """int: number (starting at 1) of the filter with the largest difference."""
+        return int(self.table.loc[self.table['Difference'].idxmax(), 'Filter'])
+
+    def _remember(self, pat_graphs, filters:np.array, labels:list):
+        """Remember inputs that match the key."""
+        try:
+            self._checked = (weakref.ref(pat_graphs), weakref.ref(filters), _normalise_labels(labels).copy())
+        except TypeError:
+            # inputs that can't be weakly referenced are hashed every time
+            self._checked = None
+
+    def _is_remembered(self, pat_graphs, filters:np.array, labels:list):
+        if self._checked is None:
+            return False
+        graphs_ref, filters_ref, checked_labels = self._checked
+        return graphs_ref() is pat_graphs and filters_ref() is filters \
+            and np.array_equal(checked_labels, _normalise_labels(labels))
+
+    def matches(self, pat_graphs, filters:np.array, labels:list):
+        """Check whether the ranking was calculated from these inputs. The cohort is only hashed the
+        first time: once the inputs match, the same patient graphs and filters objects (with the same
+        labels) match again without hashing them, so they mustn't be changed in place afterwards.
+
+        Returns:
+            bool: True if the content hash of the inputs matches the ranking key.
+        """
+        if self._is_remembered(pat_graphs, filters, labels):
+            return True
+        if content_hash(pat_graphs, filters, labels) != self.key:
+            return False
+        self._remember(pat_graphs, filters, labels)
+        return True
+
+    def check(self, pat_graphs, filters:np.array, labels:list):
+        """Raise an error if the ranking was not calculated from these inputs.
+
+        Raises:
+            ValueError: if the ranking is stale.
+        """
+        if not self.matches(pat_graphs, filters, labels):
+            raise ValueError("The filter ranking was calculated from different filters, graphs or labels. "
+                             "Recompute it with FilterRanking.compute.")
+
+    def save(self, path:str):
+        """Save the ranking to a .npz file.
+
+        Args:
+            path (str): file to write.
+        """
+        np.savez(path, filter=self.table['Filter'].to_numpy(), difference=self.table['Difference'].to_numpy(),
+                 class_name=np.array(self.class_name), key=np.array(self.key))
+
+    @classmethod
+    def load(cls, path:str, pat_graphs=None, filters:np.array=None, labels:list=None):
+        """Load a ranking saved with FilterRanking.save. If the inputs are given the ranking is
+        checked against them, which needs all three of them.
+
+        Args:
+            path (str): file to read.
+            pat_graphs (np.array, sparse.SparseGraphs or ragged.RaggedCohort): 4D patient graphs to check against.
+            filters (np.array): 4D array of filters to check against.
+            labels (list): binary outcome for each patient to check against.
+
+        Raises:
+            ValueError: if only some of the inputs are given, or the inputs are given and the ranking is stale.
+
+        Returns:
+            FilterRanking: the saved ranking.
+        """
+        with np.load(path, allow_pickle=False) as data:
+            difference_df = pd.DataFrame({'Filter': data['filter'].astype(int),
+                                          'Difference': data['difference'].astype(float)})
+            ranking = cls(str(data['class_name']), difference_df, str(data['key']))
+
+        given = [name for name, value in (('pat_graphs', pat_graphs), ('filters', filters), ('labels', labels))
+                 if value is not None]
+        if given and len(given) < 3:
+            raise ValueError(f"Only {', '.join(given)} given, the ranking can only be checked against pat_graphs, "
+                             "filters and labels together.")
+        if given:
+            ranking.check(pat_graphs, filters, labels)
+        return ranking
+
+
+class RankingState:
+    """Maximum activation of every filter for each patient in a cohort, kept by patient id, so the
+    filter ranking can be updated as patients join or leave the cohort by only scanning the patients
+    that join. The ranking is always calculated from the patients currently in the cohort, so it
+    doesn't drift however many times patients are added and removed.
+
+    Args:
+        class_name (str): name to describe prediction outcome.
+        filters (np.array): 4D array of filters, kept to scan the patients that are added.
+        n_jobs (int): number of processes to scan the patients with, -1 for every CPU.
+    """
+
+    def __init__(self, class_name:str, filters:np.array, n_jobs:int=1):
+        if filters.ndim != 4:
+            raise ValueError("The filters array must be 4-dimensional.")
+        self.class_name = class_name
+        self.filters = filters
+        self.n_jobs = n_jobs
+        self.patient_ids = np.array([], dtype=np.int64)
+        self.labels = np.array([], dtype=np.int64)
+        self.max_acts = np.zeros((0, filters.shape[0]))
+
+    def _max_activations(self, pat_graphs):
+        if parallel.resolve_n_jobs(self.n_jobs) > 1:
+            return parallel.max_activation_matrix(pat_graphs, self.filters, n_jobs=self.n_jobs)
+        return calculations.max_activation_matrix(pat_graphs, self.filters)
+
+    def __len__(self):
+        return self.patient_ids.shape[0]
+
+    def update(self, new_graphs, new_labels:list, patient_ids:list=None):
+        """Add patients to the cohort.
+
+        Args:
+            new_graphs (np.array, sparse.SparseGraphs or ragged.RaggedCohort): 4D patient graphs of the new patients.
+            new_labels (list): binary outcome for each new patient.
+            patient_ids (list): unique integer id of each new patient, e.g. its row in the full cohort, used to
+                remove it. If not given, the patients are numbered on from the largest id in the cohort (from 0
+                for an empty cohort).
+
+        Raises:
+            ValueError: if there isn't a label and id for every new patient, or an id is already in the cohort.
+
+        Returns:
+            RankingState: this state, updated.
+        """
+        new_labels = np.asarray(new_labels)
+        num_new = new_graphs.shape[0]
+        if patient_ids is None:
+            first_id = int(self.patient_ids.max()) + 1 if len(self) else 0
+            patient_ids = np.arange(first_id, first_id + num_new)
+        patient_ids = np.asarray(patient_ids, dtype=np.int64)
+        if new_labels.shape != (num_new,) or patient_ids.shape != (num_new,):
+            raise ValueError("There must be a label and a patient id for every new patient.")
+        if np.unique(patient_ids).shape[0] != num_new or np.isin(patient_ids, self.patient_ids).any():
+            raise ValueError("The patient ids must be unique and not already in the cohort.")
+
+        max_acts = self._max_activations(new_graphs)
+        self.patient_ids = np.concatenate([self.patient_ids, patient_ids])
+        self.labels = np.concatenate([self.labels, new_labels]) if self.labels.shape[0] else new_labels.copy()
+        self.max_acts = np.concatenate([self.max_acts, max_acts])
+        return self
+
+    def remove(self, patient_ids:list):
+        """Remove patients that were added to the cohort before. Their graphs aren't needed, as their
+        maximum activations are already kept.
+
+        Args:
+            patient_ids (list): ids of the patients to remove, as given to (or numbered by) update.
+
+        Raises:
+            ValueError: if a patient isn't in the cohort or is given more than once.
+
+        Returns:
+            RankingState: this state, updated.
+        """
+        patient_ids = np.asarray(patient_ids, dtype=np.int64).reshape(-1)
+        if np.unique(patient_ids).shape[0] != patient_ids.shape[0]:
+            raise ValueError("Each patient can only be removed once.")
+        missing = patient_ids[~np.isin(patient_ids, self.patient_ids)]
+        if missing.shape[0]:
+            raise ValueError(f"Patients {missing.tolist()} aren't in the cohort.")
+
+        keep = ~np.isin(self.patient_ids, patient_ids)
+        self.patient_ids, self.labels, self.max_acts = self.patient_ids[keep], self.labels[keep], self.max_acts[keep]
+        return self
+
+    def difference_df(self, verbose:bool=False, show_plot:bool=False):
+        """Get the filter ranking for the patients currently in the cohort, calculated from their
+        maximum activations as max_act_diff_calc would (the class means are only summed in a different
+        order, so they can differ from it by float64 rounding of the current cohort, not of its history).
+
+        Returns:
+            pd.DataFrame: difference between graph activation in both classes.
+        """
+        classes = np.unique(self.labels)
+        sums, counts = max_act_diff.class_activation_sums(self.max_acts, self.labels, classes)
+        mean_activation_df = max_act_diff.class_sums_to_mean_df(self.class_name, classes, sums, counts)
+        return max_act_diff.class_mean_difference(mean_activation_df, self.class_name, verbose, show_plot)
+
+    def save(self, path:str):
+        """Save the state (including the filters) to a .npz file.
+
+        Args:
+            path (str): file to write.
+        """
+        np.savez(path, class_name=np.array(self.class_name), filters=self.filters, patient_ids=self.patient_ids,
+                 labels=self.labels, max_acts=self.max_acts)
+
+    @classmethod
+    def load(cls, path:str, n_jobs:int=1):
+        """Load a state saved with RankingState.save.
+
+        Args:
+            path (str): file to read.
+            n_jobs (int): number of processes to scan the patients with, -1 for every CPU.
+
+        Returns:
+            RankingState: the saved state.
+        """
+        with np.load(path, allow_pickle=False) as data:
+            state = cls(str(data['class_name']), data['filters'], n_jobs=n_jobs)
+            state.patient_ids, state.labels, state.max_acts = data['patient_ids'], data['labels'], data['max_acts']
+        return state
@@ -0,0 +1,176 @@
+import numpy as np
+import pandas as pd
+
+
+def smallest_int_dtype(values:np.ndarray):
+    """Smallest integer dtype that holds every value, e.g. uint8 for filter numbers up to 255.
+
+    Args:
+        values (np.ndarray): integer values.
+
+    Returns:
+        np.dtype: integer dtype.
+    """
+    if values.size == 0:
+        return np.dtype(np.uint8)
+    return np.promote_types(np.min_scalar_type(values.min()), np.min_scalar_type(values.max()))
+
+
+def _compact_labels(labels, label_dtype=None):
+    """Labels as an array, integer labels are stored in the smallest integer dtype unless one is given."""
+    labels = np.asarray(labels)
+    if label_dtype is not None:
+        return labels.astype(label_dtype)
+    if np.issubdtype(labels.dtype, np.integer) or labels.dtype == bool:
+        return labels.astype(smallest_int_dtype(labels.astype(np.int64)))
+    return labels
+
+
+class MaxActivationTable:
+    """Maximum activation of each filter on each patient graph as typed arrays, one entry per filter
+    and patient with all patients for the first filter first (the rows of create_max_act_df).
+
+    Args:
+        labels (np.ndarray): class of the patient for each entry.
+        max_activation (np.ndarray): maximum activation for each entry.
+        filter_num (np.ndarray): filter number (starting at 1) for each entry.
+    """
+
+    def __init__(self, labels:np.ndarray, max_activation:np.ndarray, filter_num:np.ndarray):
+        self.labels = labels
+        self.max_activation = max_activation
+        self.filter_num = filter_num
+
+    @classmethod
+    def from_matrix(cls, max_acts:np.ndarray, labels:list, dtype=np.float32, label_dtype=None, filter_dtype=None):
+        """Build from a (patients, filters) array of maximum activations.
+
+        Args:
+            max_acts (np.ndarray): 2D array (patients, filters) of maximum activations.
+            labels (list): class of each patient.
+            dtype (np.dtype): dtype of the activations.
+            label_dtype (np.dtype): dtype of the labels, the smallest integer dtype for integer labels if not given.
+            filter_dtype (np.dtype): dtype of the filter numbers, the smallest integer dtype if not given.
+
+        Returns:
+            MaxActivationTable: table with num patients * num filters entries.
+        """
+        num_pats, num_filters = max_acts.shape
+        filter_nums = np.arange(1, num_filters + 1)
+        if filter_dtype is None:
+            filter_dtype = smallest_int_dtype(filter_nums)
+
+        return cls(np.tile(_compact_labels(labels, label_dtype), num_filters),
+                   max_acts.T.astype(dtype).ravel(),
+                   np.repeat(filter_nums.astype(filter_dtype), num_pats))
+
+    def __len__(self):
+        return self.max_activation.shape[0]
+
+    @property
+    def nbytes(self):
+        """int: memory used by the arrays."""
+        return self.labels.nbytes + self.max_activation.nbytes + self.filter_num.nbytes
+
+    def to_pandas(self, class_name:str):
+        """Convert to the create_max_act_df DataFrame.
+
+        Args:
+            class_name (str): name to describe prediction outcome, used as the label column name.
+
+        Returns:
+            pd.DataFrame: dataframe with columns for filter number, maximum activation and chosen class_name string.
+        """
+        return pd.DataFrame({class_name: self.labels, 'Max Activation': self.max_activation, 'Filter': self.filter_num})
+
+
+class EdgeTable:
+    """Edges of a patient graph as typed arrays (the rows of create_edges_df). Node names such as '5_v2'
+    are only made when converting to pandas.
+
+    Args:
+        start_code (np.ndarray): code (node index) the edge starts at.
+        end_code (np.ndarray): code (node index) the edge ends at.
+        start_visit (np.ndarray): visit the edge starts at, the edge ends at the next visit.
+        weight (np.ndarray): activation of the edge (0.5 where the activation is 0 so it can be drawn).
+        activated (np.ndarray): whether the activation is not 0.
+        time_between (np.ndarray): time between the visits, from the patient graph.
+    """
+
+    def __init__(self, start_code:np.ndarray, end_code:np.ndarray, start_visit:np.ndarray, weight:np.ndarray,
+                 activated:np.ndarray, time_between:np.ndarray):
+        self.start_code = start_code
+        self.end_code = end_code
+        self.start_visit = start_visit
+        self.weight = weight
+        self.activated = activated
+        self.time_between = time_between
+
+    @classmethod
+    def from_events(cls, t:np.ndarray, i:np.ndarray, j:np.ndarray, act_values:np.ndarray, time_between:np.ndarray,
+                    dtype=np.float32, index_dtype=np.int32):
+        """Build from the (timestep, start code, end code) of each edge and its activation.
+
+        Args:
+            t (np.ndarray): timestep of each edge.
+            i (np.ndarray): start code of each edge.
+            j (np.ndarray): end code of each edge.
+            act_values (np.ndarray): activation of each edge.
+            time_between (np.ndarray): time between visits of each edge.
+            dtype (np.dtype): dtype of the weights.
+            index_dtype (np.dtype): dtype of the codes and visits.
+
+        Returns:
+            EdgeTable: table of the edges.
+        """
+        act_values = np.asarray(act_values, dtype=dtype)
+        return cls(np.asarray(i, dtype=index_dtype), np.asarray(j, dtype=index_dtype), np.asarray(t, dtype=index_dtype),
+                   # change 0 weights to 0.5 so we can still see them on the graph figure
+                   np.where(act_values == 0, act_values.dtype.type(0.5), act_values),
+                   act_values != 0,
+                   np.asarray(time_between))
+
+    def __len__(self):
+        return self.weight.shape[0]
+
+    @property
+    def end_visit(self):
+        """np.ndarray: visit each edge ends at."""
+        return self.start_visit + 1
+
+    @property
+    def nbytes(self):
+        """int: memory used by the arrays."""
+        return sum(a.nbytes for a in (self.start_code, self.end_code, self.start_visit, self.weight,
+                                      self.activated, self.time_between))
+
+    def to_pandas(self):
+        """Convert to the create_edges_df DataFrame. The node names are categorical, so a name is only
+        built once per node.
+
+        Returns:
+            DataFrame: with columns start_node, end_node, activated, weight, time_between,
+            start_code, end_code, start_visit and end_visit.
+        """
+        num_edges = len(self)
+        start_visit = self.start_visit.astype(np.int64)
+        end_visit = start_visit + 1
+        # Node id = visit * num_codes + code, shared by the start and end node columns
+        num_codes = int(max(self.start_code.max(initial=0), self.end_code.max(initial=0))) + 1
+        start_id = start_visit * num_codes + self.start_code
+        end_id = end_visit * num_codes + self.end_code
+        node_ids, node_codes = np.unique(np.concatenate([start_id, end_id]), return_inverse=True)
+        node_names = [f'{node_id % num_codes}_v{node_id // num_codes}' for node_id in node_ids.tolist()]
+
+        return pd.DataFrame({
+            'start_node': pd.Categorical.from_codes(node_codes[:num_edges], node_names),
+            'end_node': pd.Categorical.from_codes(node_codes[num_edges:], node_names),
+            'activated': self.activated,
+            'weight': self.weight,
+            # edge label, the time between visits from the original graph
+            'time_between': self.time_between,
+            'start_code': self.start_code,
+            'end_code': self.end_code,
+            'start_visit': self.start_visit,
+            'end_visit': self.end_visit,
+        })
@@ -0,0 +1,142 @@
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from tgcnn_act_graph import calculations, parallel, ragged, sparse
+
+
+def _max_activations(pat_graphs, patients:np.ndarray, filters:np.array, n_jobs:int):
+    """Maximum activation of every filter on the chosen patients, read in patient order."""
+    patients = np.sort(patients)
+    if isinstance(pat_graphs, (sparse.SparseGraphs, ragged.RaggedCohort)):
+        graphs = pat_graphs.take(patients)
+    else:
+        graphs = np.asarray(pat_graphs[patients])
+    if parallel.resolve_n_jobs(n_jobs) > 1:
+        return parallel.max_activation_matrix(graphs, filters, n_jobs=n_jobs)
+    return calculations.max_activation_matrix(graphs, filters)
+
+
+def difference_intervals(sums:np.ndarray, squares:np.ndarray, counts:np.ndarray, totals:np.ndarray, z:float):
+    """Confidence intervals on the difference in mean maximum activation between two classes from
+    samples of each class, with the finite population correction so the interval shrinks to the exact
+    difference once every patient has been sampled.
+
+    Args:
+        sums (np.ndarray): 2D array (2 classes, filters) of summed maximum activations.
+        squares (np.ndarray): 2D array (2 classes, filters) of summed squared maximum activations.
+        counts (np.ndarray): 1D array (2 classes) of sampled patients.
+        totals (np.ndarray): 1D array (2 classes) of patients in the cohort.
+        z (float): number of standard errors either side of the difference.
+
+    Returns:
+        tuple: 1D arrays (filters) of the absolute difference and its lower and upper bounds. The bounds
+        are 0 and infinity while a class that hasn't been fully sampled has fewer than 2 samples, as its
+        variance can't be estimated.
+    """
+    counts = counts[:, None].astype(float)
+    means = sums / counts
+    variances = np.maximum(squares - counts * means**2, 0) / np.maximum(counts - 1, 1)
+    fpc = 1 - counts / totals[:, None]
+    # a fully sampled class adds no uncertainty, a class with one sample has an unknown variance
+    terms = np.where(fpc <= 0, 0.0, np.where(counts < 2, np.inf, variances / counts * np.maximum(fpc, 0)))
+    std_error = np.sqrt(np.sum(terms, axis=0))
+
+    signed = means[1] - means[0]
+    with np.errstate(invalid='ignore'):
+        low, high = signed - z * std_error, signed + z * std_error
+    # bounds of |difference|, which is 0 at best if the interval on the signed difference includes 0
+    lower = np.where((low <= 0) & (high >= 0), 0.0, np.minimum(np.abs(low), np.abs(high)))
+    upper = np.maximum(np.abs(low), np.abs(high))
+    return np.abs(signed), lower, upper
+
+
+def sampled_max_act_diff(class_name:str, pat_graphs, filters:np.array, labels:list, confidence:float=0.95,
+                         initial_size:int=256, growth:float=2.0, max_size:int=None, seed:int=None, n_jobs:int=1,
+                         verbose:bool=False):
+    """Approximate max_act_diff.max_act_diff_calc from a stratified sample of patients in each class.
+
+    The same number of patients is sampled (without replacement) from each class, and the sample grows
+    by growth times until the filter with the largest difference is separated from every other filter:
+    the lower bound of its difference is above the upper bound of every other difference. The intervals
+    are Bonferroni corrected over the filters and over the most rounds the sample can grow for
+    (ceil(log_growth(max_size / initial_size)) + 1), so the intervals of every filter in every round
+    hold together with the requested confidence, however often they are checked. If every patient is
+    sampled the result is the exact ranking.
+
+    Args:
+        class_name (str): name to describe prediction outcome.
+        pat_graphs (np.array, sparse.SparseGraphs or ragged.RaggedCohort): 4D patient graphs (can be a np.memmap).
+        filters (np.array): 4D array of filters.
+        labels (list): binary outcome for each patient.
+        confidence (float): confidence that the top filter is the top filter of the exact ranking.
+        initial_size (int): number of patients to sample from each class first, at least 2.
+        growth (float): factor to grow the sample by until the top filter is separated, more than 1.
+        max_size (int): stop once this many patients have been sampled from each class even if the
+            top filter isn't separated, every patient if not given.
+        seed (int): random seed for the sample.
+        n_jobs (int): number of processes to scan the patients with, -1 for every CPU.
+        verbose (bool): print the sample size and result of each round.
+
+    Raises:
+        ValueError: if there aren't two classes, initial_size is less than 2 or growth isn't more than 1.
+
+    Returns:
+        pd.DataFrame: columns Filter, Difference (estimated), Lower and Upper (confidence bounds on the
+        difference). attrs['sampled'] is the number of patients sampled from each class and
+        attrs['separated'] whether the top filter was separated.
+    """
+    if filters.ndim != 4:
+        raise ValueError("The filters array must be 4-dimensional.")
+    if initial_size < 2:
+        raise ValueError("initial_size must be at least 2 to estimate the variance of each class.")
+    if growth <= 1:
+        raise ValueError("growth must be more than 1.")
+    labels = np.asarray(labels)
+    classes = np.unique(labels)
+    if classes.shape[0] != 2:
+        raise ValueError("Sampling needs exactly two classes.")
+
+    rng = np.random.default_rng(seed)
+    num_filters = filters.shape[0]
+
+    # every patient of each class in a random order, the sample is the first patients of each order
+    orders = [rng.permutation(np.flatnonzero(labels == label)) for label in classes]
+    totals = np.array([order.shape[0] for order in orders])
+    if max_size is None:
+        max_size = int(totals.max())
+    # the intervals are checked once per round, spread the error over every round as well as every filter
+    num_rounds = int(np.ceil(np.log(max(max_size / initial_size, 1)) / np.log(growth))) + 1
+    z = NormalDist().inv_cdf(1 - (1 - confidence) / (2 * num_filters * num_rounds))
+
+    sums = np.zeros((2, num_filters))
+    squares = np.zeros((2, num_filters))
+    counts = np.zeros(2, dtype=np.int64)
+    size = initial_size
+    while True:
+        for c, order in enumerate(orders):
+            new_patients = order[counts[c]:min(size, max_size, totals[c])]
+            if new_patients.shape[0] == 0:
+                continue
+            max_acts = _max_activations(pat_graphs, new_patients, filters, n_jobs)
+            sums[c] += max_acts.sum(axis=0)
+            squares[c] += (max_acts**2).sum(axis=0)
+            counts[c] += new_patients.shape[0]
+
+        difference, lower, upper = difference_intervals(sums, squares, counts, totals, z)
+        top = np.argmax(difference)
+        separated = num_filters == 1 or lower[top] > np.delete(upper, top).max()
+        if verbose:
+            print(f"Sampled {counts.tolist()} patients, filter {top+1} separated: {separated}")
+        exhausted = np.all((counts >= totals) | (counts >= max_size))
+        if separated or exhausted:
+            break
+        size = int(np.ceil(size * growth))
+
+    difference_df = pd.DataFrame({'Filter': np.arange(1, num_filters + 1), 'Difference': difference,
+                                  'Lower': lower, 'Upper': upper})
+    difference_df.attrs.update(sampled=counts.tolist(), separated=bool(separated))
+    if verbose:
+        print(difference_df)
+    return difference_df
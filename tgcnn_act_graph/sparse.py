@@ -0,0 +1,247 @@
+import numpy as np
+
+
+class SparseGraphs:
+    """Coordinate (COO) representation of one patient graph (3D) or a cohort of patient
+    graphs (4D). Only the recorded events are stored, so memory scales with the number of
+    events rather than with the number of nodes squared.
+
+    The coordinates are stored in the same order as np.nonzero would return them for the
+    dense array (patient, timestep, start node, end node) so results built from them match
+    the dense pipeline row for row, and patients can be found by binary search. Use from_coo
+    for coordinates that are unsorted or have duplicates.
+
+    Args:
+        coords (np.ndarray): 2D int array (ndim, number of events) of coordinates, sorted in
+            np.nonzero order with no duplicates.
+        values (np.ndarray): 1D array of the value for each event (time between visits).
+        shape (tuple): shape of the equivalent dense array.
+    """
+
+    def __init__(self, coords:np.ndarray, values:np.ndarray, shape:tuple):
+        self.coords = np.asarray(coords, dtype=np.int64)
+        self.values = np.asarray(values)
+        self.shape = tuple(int(s) for s in shape)
+        if self.coords.shape != (len(self.shape), self.values.shape[0]):
+            raise ValueError("There must be one coordinate per dimension for each value.")
+        if self.coords.shape[1]:
+            if np.any(self.coords < 0) or np.any(self.coords.max(axis=1) >= np.asarray(self.shape)):
+                raise ValueError("The coordinates must be within the shape of the graphs.")
+            if np.any(np.diff(np.ravel_multi_index(tuple(self.coords), self.shape)) <= 0):
+                raise ValueError("The coordinates must be sorted with no duplicates, use SparseGraphs.from_coo "
+                                 "to build from unsorted coordinates.")
+
+    @classmethod
+    def from_coo(cls, coords, values, shape:tuple):
+        """Build from (possibly unsorted) coordinate triplets/quadruplets. Duplicate
+        coordinates are summed and zero values are dropped.
+
+        Args:
+            coords (array-like): (ndim, number of events) coordinates, e.g. (patient, t, i, j).
+            values (array-like): value for each event.
+            shape (tuple): shape of the equivalent dense array.
+
+        Returns:
+            SparseGraphs: canonical sparse graphs.
+        """
+        coords = np.asarray(coords, dtype=np.int64).reshape(len(shape), -1)
+        values = np.asarray(values).ravel()
+        if coords.size and (np.any(coords < 0) or np.any(coords.max(axis=1) >= np.asarray(shape))):
+            raise ValueError("The coordinates must be within the shape of the graphs.")
+
+        flat_idx = np.ravel_multi_index(tuple(coords), shape)
+        unique_idx, inverse = np.unique(flat_idx, return_inverse=True)
+        summed = np.zeros(unique_idx.shape[0], dtype=values.dtype)
+        np.add.at(summed, inverse, values)
+
+        keep = summed != 0
+        return cls(np.array(np.unravel_index(unique_idx[keep], shape)), summed[keep], shape)
+
+    @classmethod
+    def from_dense(cls, array:np.ndarray):
+        """Build from a dense 3D patient graph or 4D array of patient graphs.
+
+        Args:
+            array (np.ndarray): dense graph(s).
+
+        Returns:
+            SparseGraphs: the non-zero events of the array.
+        """
+        array = np.asarray(array)
+        coords = np.array(np.nonzero(array)).reshape(array.ndim, -1)
+        return cls(coords, array[tuple(coords)], array.shape)
+
+    @classmethod
+    def from_timesteps(cls, matrices:list, num_nodes:int=None):
+        """Build a single 3D patient graph from one (nodes, nodes) adjacency matrix per timestep.
+        The matrices can be dense arrays or any sparse matrix with a tocoo() method, such as
+        scipy.sparse matrices.
+
+        Args:
+            matrices (list): adjacency matrix for each timestep.
+            num_nodes (int): number of nodes, taken from the first matrix if not given.
+
+        Returns:
+            SparseGraphs: 3D sparse patient graph.
+        """
+        coords, values = [], []
+        for t, matrix in enumerate(matrices):
+            if hasattr(matrix, 'tocoo'):
+                matrix = matrix.tocoo()
+                rows, cols, data = np.asarray(matrix.row), np.asarray(matrix.col), np.asarray(matrix.data)
+            else:
+                matrix = np.asarray(matrix)
+                rows, cols = np.nonzero(matrix)
+                data = matrix[rows, cols]
+            if num_nodes is None:
+                num_nodes = matrix.shape[0]
+            coords.append(np.array([np.full(rows.shape[0], t), rows, cols]))
+            values.append(data)
+
+        if num_nodes is None:
+            raise ValueError("num_nodes must be given when there are no timesteps.")
+        coords = np.concatenate(coords, axis=1) if coords else np.zeros((3, 0), dtype=np.int64)
+        values = np.concatenate(values) if values else np.zeros(0)
+        return cls.from_coo(coords, values, (len(matrices), num_nodes, num_nodes))
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def nnz(self):
+        return self.values.shape[0]
+
+    @property
+    def dtype(self):
+        return self.values.dtype
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, num:int):
+        """Select a single patient (for 4D) or timestep (for 3D) without densifying."""
+        if not isinstance(num, (int, np.integer)):
+            raise TypeError("SparseGraphs can only be indexed with a single integer.")
+        if num < 0:
+            num += self.shape[0]
+        if not 0 <= num < self.shape[0]:
+            raise IndexError(f"Index {num} is out of bounds for axis 0 with size {self.shape[0]}")
+        start, stop = np.searchsorted(self.coords[0], [num, num + 1])
+        return SparseGraphs(self.coords[1:, start:stop], self.values[start:stop], self.shape[1:])
+
+    def patient_slice(self, start:int, stop:int):
+        """Select a block of patients from a 4D cohort, keeping it 4D.
+
+        Args:
+            start (int): first patient in the block.
+            stop (int): patient after the last patient in the block.
+
+        Returns:
+            SparseGraphs: 4D sparse graphs for patients start to stop.
+        """
+        stop = min(stop, self.shape[0])
+        lo, hi = np.searchsorted(self.coords[0], [start, stop])
+        coords = self.coords[:, lo:hi].copy()
+        coords[0] -= start
+        return SparseGraphs(coords, self.values[lo:hi], (max(stop - start, 0),) + self.shape[1:])
+
+    def take(self, patients):
+        """Select patients from a 4D cohort in the given order, keeping it 4D, like array[patients].
+
+        Args:
+            patients (array-like): patient numbers to select.
+
+        Returns:
+            SparseGraphs: 4D sparse graphs for the selected patients.
+        """
+        patients = np.asarray(patients, dtype=np.int64)
+        starts = np.searchsorted(self.coords[0], patients)
+        lengths = np.searchsorted(self.coords[0], patients + 1) - starts
+        # position of every event of the selected patients, patient by patient
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        events = offsets + np.arange(offsets.shape[0])
+        coords = self.coords[:, events]
+        coords[0] = np.repeat(np.arange(patients.shape[0]), lengths)
+        return SparseGraphs(coords, self.values[events], (patients.shape[0],) + self.shape[1:])
+
+    def flip_time(self):
+        """Reverse the timestep axis so the most recent event is at the front.
+
+        Returns:
+            SparseGraphs: graph(s) with the time axis flipped.
+        """
+        time_axis = self.ndim - 3
+        coords = self.coords.copy()
+        coords[time_axis] = self.shape[time_axis] - 1 - coords[time_axis]
+        order = np.lexsort(coords[::-1])
+        return SparseGraphs(coords[:, order], self.values[order], self.shape)
+
+    def to_dense(self):
+        """Materialise the dense array.
+
+        Returns:
+            np.ndarray: dense array with shape self.shape.
+        """
+        dense = np.zeros(self.shape, dtype=self.values.dtype)
+        dense[tuple(self.coords)] = self.values
+        return dense
+
+
+def window_activation_sums(pat_graphs:SparseGraphs, filters:np.ndarray):
+    """Sparse version of calculations.window_activation_sums. Each event only contributes to the
+    windows that cover its timestep, so the work scales with the number of events.
+
+    Args:
+        pat_graphs (SparseGraphs): 4D sparse patient graphs.
+        filters (np.ndarray): 4D array (filters, filter timesteps, nodes, nodes) of filters.
+
+    Returns:
+        np.ndarray: 3D float array (patients, filters, windows) of window sums.
+    """
+    if pat_graphs.ndim != 4:
+        raise ValueError("The input array must be 4-dimensional.")
+    if filters.ndim != 4:
+        raise ValueError("The filters array must be 4-dimensional.")
+
+    num_pats, time_steps = pat_graphs.shape[:2]
+    num_filters, filt_steps = filters.shape[:2]
+    num_windows = max(time_steps - filt_steps + 1, 0)
+    pat, t, i, j = pat_graphs.coords
+
+    sums = np.zeros((num_pats * num_windows, num_filters))
+    for offset in range(filt_steps):
+        window = t - offset
+        keep = (window >= 0) & (window < num_windows)
+        # Events are sorted by patient then timestep so the window index is already sorted
+        # and contributions to the same window can be summed with reduceat.
+        window_idx = pat[keep] * num_windows + window[keep]
+        if window_idx.shape[0] == 0:
+            continue
+        contribution = pat_graphs.values[keep, None] * filters[:, offset, i[keep], j[keep]].T
+        starts = np.flatnonzero(np.r_[True, window_idx[1:] != window_idx[:-1]])
+        sums[window_idx[starts]] += np.add.reduceat(contribution, starts, axis=0)
+
+    return sums.reshape(num_pats, num_windows, num_filters).transpose(0, 2, 1)
+
+
+def get_act_graph_array(pat_graph:SparseGraphs, max_act_filt:np.ndarray, alpha:float=0.01):
+    """Sparse version of calculations.get_act_graph_array. The filter is only looked up at the
+    events of the patient graph, the repeated filter is never built.
+
+    Args:
+        pat_graph (SparseGraphs): 3D sparse patient graph, or 4D for a batch of patients.
+        max_act_filt (np.ndarray): 3D filter.
+        alpha (float): leaky ReLU parameter.
+
+    Returns:
+        SparseGraphs: activated graph with the same events as the patient graph (including
+        events with zero activation).
+    """
+    if pat_graph.ndim not in (3, 4):
+        raise ValueError("The input array must be 3-dimensional (or 4-dimensional for a batch of patients).")
+
+    t, i, j = pat_graph.coords[-3:]
+    filt_times_graph = pat_graph.values * max_act_filt[t % max_act_filt.shape[0], i, j]
+    activated = np.maximum(alpha * filt_times_graph, filt_times_graph)
+    return SparseGraphs(pat_graph.coords, activated, pat_graph.shape)
@@ -0,0 +1,108 @@
+import queue
+import threading
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from tgcnn_act_graph import calculations, ranking, utils
+
+
+@dataclass
+class EdgeActivation:
+    """Activation results for one patient, as computed by figures.edge_activated_graph before drawing.
+
+    Args:
+        patient_number (int): patient the results are for.
+        filter_num (int): number (starting at 1) of the filter used.
+        patient_graph (np.array): patient graph, flipped so the most recent event is at the front.
+        act_graph (np.array): activated graph from calculations.get_act_graph_array.
+        edges (pd.DataFrame or results.EdgeTable): edges from utils.create_edges_df.
+    """
+    patient_number: int
+    filter_num: int
+    patient_graph: np.ndarray
+    act_graph: np.ndarray
+    edges: pd.DataFrame
+
+
+def _edge_activation(input_tensors, patient_number:int, filt:np.array, filter_num:int, as_frame:bool):
+    patient_graph, filt = utils.flip_graph(utils.select_patient(input_tensors, patient_number), filt)
+    act_graph = calculations.get_act_graph_array(patient_graph, filt)
+    edges = utils.create_edges_df(patient_graph, act_graph, as_frame=as_frame)
+    return EdgeActivation(int(patient_number), filter_num, patient_graph, act_graph, edges)
+
+
+def _put(items:queue.Queue, stop:threading.Event, item):
+    """Put an item on the queue, giving up if the consumer has stopped. Returns whether it was put."""
+    while not stop.is_set():
+        try:
+            items.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _prefetch(results, size:int):
+    """Compute the results in a background thread, at most size ahead of the consumer. Errors are
+    raised in the consumer, and the thread stops when the consumer stops iterating.
+    """
+    items = queue.Queue(maxsize=size)
+    stop = threading.Event()
+    done = object()
+
+    def produce():
+        try:
+            for result in results:
+                if not _put(items, stop, (result, None)):
+                    return
+        except Exception as e:
+            _put(items, stop, (None, e))
+        else:
+            _put(items, stop, (done, None))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            result, error = items.get()
+            if error is not None:
+                raise error
+            if result is done:
+                return
+            yield result
+    finally:
+        stop.set()
+        thread.join()
+
+
+def iter_edge_activations(input_tensors, filter_ranking, filters:np.array, patients:list=None, prefetch:int=0,
+                          as_frame:bool=True):
+    """Lazily compute the activated graph and edges of each patient with the best filter of one ranking,
+    without drawing. Only the current patient's results are kept (plus up to prefetch patients ahead).
+
+    Args:
+        input_tensors (np.array): 4D array (or sparse.SparseGraphs) of patient graphs.
+        filter_ranking (ranking.FilterRanking or pd.DataFrame): ranking of the filters for these inputs, or the
+            output of max_act_diff.max_act_diff_calc.
+        filters (np.array): 4D array of filters.
+        patients (list): patients to compute, every patient if not given.
+        prefetch (int): number of patients to compute ahead in a background thread while the consumer works
+            on the current one, 0 to compute each patient only when it is asked for.
+        as_frame (bool): give the edges as a DataFrame, otherwise as a results.EdgeTable.
+
+    Yields:
+        EdgeActivation: results for each patient, in the order of patients.
+    """
+    if isinstance(filter_ranking, ranking.FilterRanking):
+        filter_ranking = filter_ranking.table
+    filter_num = int(filter_ranking.loc[filter_ranking['Difference'].idxmax(), 'Filter'])
+    filt = filters[filter_num-1] # minus 1 as we don't have a filter called 0
+    if patients is None:
+        patients = range(input_tensors.shape[0])
+
+    results = (_edge_activation(input_tensors, patient_number, filt, filter_num, as_frame) for patient_number in patients)
+    if prefetch > 0:
+        results = _prefetch(results, prefetch)
+    yield from results
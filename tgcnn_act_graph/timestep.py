@@ -0,0 +1,100 @@
+import numpy as np
+
+from tgcnn_act_graph import calculations
+
+
+class TimestepActivations:
+    """Activation of every filter on every window of every patient graph, kept from one batched scan
+    so the activation over time of any patient can be looked up without scanning again. The
+    maximum over the windows is the maximum activation used to rank the filters.
+
+    Window w covers timesteps w to w + filter timesteps - 1 of the patient graph as it is given
+    (before figures.edge_activated_graph flips it to draw it).
+
+    Args:
+        activations (np.ndarray): 3D array (patients, filters, windows) of activations.
+        filt_steps (int): number of timesteps in the filters.
+    """
+
+    def __init__(self, activations:np.ndarray, filt_steps:int):
+        if activations.ndim != 3:
+            raise ValueError("The activations array must be 3-dimensional.")
+        self.activations = activations
+        self.filt_steps = filt_steps
+
+    @classmethod
+    def compute(cls, pat_graphs:np.ndarray, filters:np.ndarray, block_size:int=1024, dtype=np.float32):
+        """Scan every filter over every window of every patient graph.
+
+        Args:
+            pat_graphs (np.ndarray or sparse.SparseGraphs): 4D array (patients, timesteps, nodes, nodes) of patient graphs.
+            filters (np.ndarray): 4D array (filters, filter timesteps, nodes, nodes) of filters.
+            block_size (int): number of patients to scan at once.
+            dtype (np.dtype): dtype to keep the activations in.
+
+        Returns:
+            TimestepActivations: the activations for the cohort.
+        """
+        num_windows = max(pat_graphs.shape[1] - filters.shape[1] + 1, 0)
+        activations = np.empty((pat_graphs.shape[0], filters.shape[0], num_windows), dtype=dtype)
+        for start, block in calculations.iter_window_activations(pat_graphs, filters, block_size):
+            activations[start:start + block.shape[0]] = block
+        return cls(activations, filters.shape[1])
+
+    @property
+    def num_windows(self):
+        """int: number of windows per patient graph."""
+        return self.activations.shape[2]
+
+    def max_activations(self):
+        """Get the maximum activation of every filter on every patient graph, the same as
+        calculations.max_activation_matrix.
+
+        Returns:
+            np.ndarray: 2D array (patients, filters) of maximum activations.
+        """
+        return self.activations.max(axis=2, initial=0)
+
+    def window_activations(self, patient_number:int, filter_num:int=None):
+        """Get the activation of each window for one patient.
+
+        Args:
+            patient_number (int): patient to look up.
+            filter_num (int): filter number (starting at 1), every filter if not given.
+
+        Returns:
+            np.ndarray: 1D array (windows) for one filter or 2D array (filters, windows).
+        """
+        if filter_num is None:
+            return self.activations[patient_number]
+        return self.activations[patient_number, filter_num-1] # minus 1 as we don't have a filter called 0
+
+    def timestep_importance(self, patient_number:int, filter_num:int=None):
+        """Get the importance of each timestep for one patient, the largest activation of the windows
+        that cover the timestep (see calculations.timestep_importance).
+
+        Args:
+            patient_number (int): patient to look up.
+            filter_num (int): filter number (starting at 1), every filter if not given.
+
+        Returns:
+            np.ndarray: 1D array (timesteps) for one filter or 2D array (filters, timesteps).
+        """
+        return calculations.timestep_importance(self.window_activations(patient_number, filter_num), self.filt_steps)
+
+    def plot(self, patient_number:int, filter_nums:list=None, save_path:str=None):
+        """Plot the importance of each timestep for one patient, see figures.plot_timestep_activation.
+
+        Args:
+            patient_number (int): patient to plot.
+            filter_nums (list): filter numbers (starting at 1) to plot, every filter if not given.
+            save_path (str): save the figure to this file instead of showing it.
+        """
+        # figures needs matplotlib, only import it when plotting
+        from tgcnn_act_graph import figures
+
+        if filter_nums is None:
+            filter_nums = range(1, self.activations.shape[1] + 1)
+        filter_nums = np.asarray(filter_nums, dtype=int)
+        importance = self.timestep_importance(patient_number)[filter_nums-1]
+        figures.plot_timestep_activation(importance, filter_nums, save_path=save_path)
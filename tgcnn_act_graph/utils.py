@@ -1,5 +1,8 @@
+import functools
+
 import numpy as np
 import pandas as pd
+from tgcnn_act_graph import ranking, results, sparse
 
 
 def select_patient(input_tensors:np.array, num:int):
@@ -29,13 +32,15 @@ def get_max_act_filt(mean_activation_df:pd.DataFrame, filters:np.array):
     """Using the dataframe of acitvation difference select the filter with the largest difference.
 
     Args:
-        mean_activation_df (pd.DataFrame): dataframe with difference in activation between positive and negative class 
-        for each filter.
+        mean_activation_df (pd.DataFrame or ranking.FilterRanking): dataframe with difference in activation
+        between positive and negative class for each filter, or a precomputed FilterRanking.
         filters (np.array): 4D array with 3D filters.
 
     Returns:
         np.array: 3D array representing one filter.
     """
+    if isinstance(mean_activation_df, ranking.FilterRanking):
+        mean_activation_df = mean_activation_df.table
 
     max_idx = mean_activation_df['Difference'].idxmax()
     max_act_filt_num = mean_activation_df.loc[max_idx, 'Filter']
@@ -45,47 +50,93 @@ def get_max_act_filt(mean_activation_df:pd.DataFrame, filters:np.array):
 
 
 
-def create_edges_df(patient_graph:np.array, act_graph:np.array):
+def get_top_k_filts(mean_activation_df:pd.DataFrame, filters:np.array, k:int):
+    """Select the k filters with the largest difference in activation, largest first.
+
+    Args:
+        mean_activation_df (pd.DataFrame or ranking.FilterRanking): dataframe with difference in activation
+        between positive and negative class for each filter, or a precomputed FilterRanking.
+        filters (np.array): 4D array with 3D filters.
+        k (int): number of filters to select.
+
+    Returns:
+        tuple: 1D array of the filter numbers (starting at 1) and 4D array of the k filters.
+    """
+    if isinstance(mean_activation_df, ranking.FilterRanking):
+        mean_activation_df = mean_activation_df.table
+
+    top_k = mean_activation_df.sort_values('Difference', ascending=False, kind='stable').head(k)
+    filter_nums = top_k['Filter'].to_numpy(dtype=int)
+    return filter_nums, filters[filter_nums-1] # minus 1 as we don't have a filter called 0
+
+
+def create_edges_df(patient_graph:np.array, act_graph:np.array, dtype=np.float32, index_dtype=np.int32,
+                    as_frame:bool=True):
     """Create a DataFrame of the edges of the patient graph, including the start and end nodes
     whether the edge is activated (more than 0), the 'weight' of the activation, and the time 
     between visits.
 
+    The edges are found with np.nonzero, in (timestep, start code, end code) order and kept in a
+    results.EdgeTable. The node names (e.g. '5_v2' for code 5 at visit 2) are categorical, so a
+    name is only built once per node, and the integer codes and visits are kept as separate columns.
+
+    If the patient graph is a sparse.SparseGraphs the edges are read straight from its events
+    and act_graph can be either sparse (with the same events) or dense.
+
     Args:
         patient_graph (np.array): 3D numpy array showing the patients health codes over time.
         act_graph (np.array): 3D numpy array showing graph activation.
+        dtype (np.dtype): dtype of the weights.
+        index_dtype (np.dtype): dtype of the codes and visits.
+        as_frame (bool): return a DataFrame, otherwise return the results.EdgeTable.
 
     Returns:
-        DataFrame: with columns start_node, end_node, activated, weight, time_between.
+        DataFrame: with columns start_node, end_node, activated (bool), weight (float32 by default), time_between,
+        start_code, end_code, start_visit and end_visit (int32 by default), or the results.EdgeTable if
+        as_frame is False.
     """
-    num_edges = np.count_nonzero(patient_graph)
-    edges_df = pd.DataFrame(columns=['start_node', 'end_node', 'activated', 'weight', 'time_between'], index=range(num_edges))
-    num_nodes = patient_graph.shape[1]
-    timesteps = patient_graph.shape[0]
-
-    row_num = 0
-    for t in range(timesteps):
-        for i in range(num_nodes):
-            for j in range(num_nodes):
-                if patient_graph[t, i, j] != 0:
-                    if t == 0:
-                        start_node_v = 0
-                        end_node_v = 1
-                    else:
-                        start_node_v = t
-                        end_node_v = t+1
-                    
-                    edges_df.at[row_num, 'end_node'] = f'{j}_v{end_node_v}' #[row num, col name]
-                    edges_df.at[row_num, 'weight'] = act_graph[t, i, j]
-                    edges_df.at[row_num, 'time_between'] = patient_graph[t, i, j] #add a column for the edge label too (time between from original graph)
-                    edges_df.at[row_num, 'start_node'] = f'{i}_v{start_node_v}' #[row num, col name]
-                    
-                    row_num += 1
-
-
-    # activated_graph col is more than 0, the activated column = 1, otherwise it is 0
-    edges_df['activated'] = edges_df['weight'].apply(lambda x: 0 if x == 0 else 1)  
-    # change 0 weights to 0.5 so we can still see them on the graph figure
-    edges_df['weight'] = edges_df['weight'].apply(lambda x: 0.5 if x == 0 else x)
+    if isinstance(patient_graph, sparse.SparseGraphs):
+        t, i, j = patient_graph.coords
+        time_between = patient_graph.values
+        if isinstance(act_graph, sparse.SparseGraphs):
+            if not np.array_equal(act_graph.coords, patient_graph.coords):
+                raise ValueError("The activated graph must have the same events as the patient graph.")
+            weight = act_graph.values
+        else:
+            weight = act_graph[t, i, j]
+    else:
+        t, i, j = np.nonzero(patient_graph)
+        time_between = patient_graph[t, i, j]
+        weight = act_graph[t, i, j]
+
+    # Edges go from visit t to visit t+1
+    table = results.EdgeTable.from_events(t, i, j, weight, time_between, dtype=dtype, index_dtype=index_dtype)
+    if not as_frame:
+        return table
+    return table.to_pandas()
+
+
+def create_multi_filter_edges_df(patient_graph:np.array, act_graphs, filter_nums:list):
+    """Create the edges DataFrame with the activation weight of every edge for several filters, so the
+    filters can be compared or aggregated edge by edge.
+
+    Args:
+        patient_graph (np.array): 3D numpy array (or sparse.SparseGraphs) showing the patients health codes over time.
+        act_graphs (np.array or list): activated graph for each filter, from calculations.get_act_graph_array_multi.
+        filter_nums (list): filter number of each activated graph.
+
+    Returns:
+        DataFrame: create_edges_df columns for the first filter, plus a weight_filter_<number> column with the
+        activation of each edge (0 if not activated) for each filter.
+    """
+    edges_df = create_edges_df(patient_graph, act_graphs[0])
+
+    t, i, j = (edges_df[col].to_numpy() for col in ('start_visit', 'start_code', 'end_code'))
+    for filter_num, act_graph in zip(filter_nums, act_graphs):
+        if isinstance(act_graph, sparse.SparseGraphs):
+            edges_df[f'weight_filter_{filter_num}'] = act_graph.values
+        else:
+            edges_df[f'weight_filter_{filter_num}'] = act_graph[t, i, j]
     return edges_df
 
 
@@ -173,6 +224,76 @@ def create_pos_dict(pos_df:pd.DataFrame):
     pos = pos_df.set_index('node')[['x', 'y']].apply(tuple, axis=1).to_dict()
     return pos
 
+@functools.lru_cache(maxsize=None)
+def y_offsets(num_codes:int):
+    """Get the y coordinates for a visit with num_codes nodes, the same as
+    generate_pos_sequence(num_codes)[num_codes - 1] but as an array which is cached
+    for each visit size.
+
+    Args:
+        num_codes (int): number of nodes in the visit.
+
+    Returns:
+        np.array: read-only array of y coordinates, centred on 0 and skipping 0 for an even number of nodes.
+    """
+    offsets = np.arange(num_codes) - num_codes // 2
+    if num_codes % 2 == 0:
+        offsets[offsets >= 0] += 1
+    offsets.flags.writeable = False
+    return offsets
+
+
+def node_layout(edges_df:pd.DataFrame):
+    """Get the x and y coordinates for every node with array operations on the integer code and visit
+    columns from create_edges_df. Gives the same layout as create_position_df, generate_pos_sequence,
+    map_y_coord_to_node and create_pos_dict.
+
+    Args:
+        edges_df (pd.DataFrame): DataFrame from create_edges_df.
+
+    Returns:
+        tuple: 1D arrays of node codes, x coordinates (visit number) and y coordinates, with the nodes
+        in the order they first appear in the edges.
+    """
+    # Nodes in the order they appear reading start then end node of each edge
+    codes = np.column_stack([edges_df['start_code'].to_numpy(), edges_df['end_code'].to_numpy()]).ravel()
+    visits = np.column_stack([edges_df['start_visit'].to_numpy(), edges_df['end_visit'].to_numpy()]).ravel()
+    node_ids = visits.astype(np.int64) * (int(codes.max(initial=0)) + 1) + codes
+    _, first_seen = np.unique(node_ids, return_index=True)
+    first_seen = np.sort(first_seen)
+    codes, x = codes[first_seen], visits[first_seen]
+
+    # Count the nodes in each visit in the order they are seen
+    by_visit = np.argsort(x, kind='stable')
+    visit_starts = np.flatnonzero(np.r_[True, np.diff(x[by_visit]) != 0])
+    visit_sizes = np.diff(np.r_[visit_starts, x.shape[0]])
+    cumulative_count = np.empty_like(x)
+    cumulative_count[by_visit] = np.arange(x.shape[0]) - np.repeat(visit_starts, visit_sizes)
+    codes_per_visit = np.empty_like(x)
+    codes_per_visit[by_visit] = np.repeat(visit_sizes, visit_sizes)
+
+    y = np.empty_like(x)
+    for num_codes in np.unique(codes_per_visit):
+        in_visits = codes_per_visit == num_codes
+        y[in_visits] = y_offsets(int(num_codes))[cumulative_count[in_visits]]
+
+    return codes, x, y
+
+
+def create_layout_pos_dict(edges_df:pd.DataFrame):
+    """Make the node: (x, y) position dictionary read by NetworkX straight from the edges,
+    using node_layout.
+
+    Args:
+        edges_df (pd.DataFrame): DataFrame from create_edges_df.
+
+    Returns:
+        dict: dictionary of node: (x,y)
+    """
+    codes, x, y = node_layout(edges_df)
+    return {f'{code}_v{visit}': (visit, y_pos) for code, visit, y_pos in zip(codes.tolist(), x.tolist(), y.tolist())}
+
+
 def flip_graph(patient_graph:np.array, filter_graph:np.array):
     """Flip the 3D Tensor so that the most recent event is at the front rather than the back.
 
@@ -183,4 +304,7 @@ def flip_graph(patient_graph:np.array, filter_graph:np.array):
     Returns:
         np.array: flipped tensors with the most recent event at the front
     """
-    return np.flip(patient_graph, axis=0), np.flip(filter_graph, axis=0)
\ No newline at end of file
+    # The time axis is third from the end so batches of graphs or filters are flipped too
+    if isinstance(patient_graph, sparse.SparseGraphs):
+        return patient_graph.flip_time(), np.flip(filter_graph, axis=-3)
+    return np.flip(patient_graph, axis=-3), np.flip(filter_graph, axis=-3)
\ No newline at end of file